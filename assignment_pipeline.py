@@ -0,0 +1,192 @@
+"""
+Streaming position assignment with bounded memory.
+
+Positions are read from a cursor in batches, joined with their securities, assigned and
+written batch by batch, so at most prefetch_depth + 2 batches are held at any time,
+independent of the size of the positions collection:
+
+    source -> join -> [prefetch thread, bounded queue] -> evaluate -> sink
+
+    stats = run_pipeline(
+        cursor_source(db["positions"], batch_size=1000),
+        SecurityIndex(securities).join_batch,
+        build_rule_set(assigners, as_of=as_of).assign,
+        mongo_sink(db["assignments"], as_of),
+    )
+
+The lookup returns the security (or None) of every position of a batch: the join_batch
+of a security_index.SecurityIndex for securities held in memory, collection_lookup
+queries them per batch with $in.
+"""
+import queue
+import threading
+from itertools import islice
+
+from pymongo import UpdateOne
+
+from models import PositionModel, SecurityModel
+from record_views import view_class
+from security_index import SecurityIndex
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class PipelineStats:
+    def __init__(self):
+        self.batches = 0
+        self.records = 0
+        self.assigned = 0
+        self.unmatched = 0
+        self.failed = 0
+        # positions without a security
+        self.missing = 0
+
+    def __repr__(self):
+        return (f"PipelineStats(batches={self.batches}, records={self.records}, assigned={self.assigned}, "
+                f"unmatched={self.unmatched}, failed={self.failed}, missing={self.missing})")
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def cursor_source(collection, batch_size=DEFAULT_BATCH_SIZE, query=None, projection=None):
+    """ batches of documents, the cursor fetches batch_size documents per round trip """
+    cursor = collection.find(query or {}, projection, batch_size=batch_size)
+    try:
+        yield from batched(cursor, batch_size)
+    finally:
+        cursor.close()
+
+
+def dict_lookup(securities, key="isin"):
+    """ lookup on securities held in memory, joined on one key """
+    return SecurityIndex(securities, keys=(key,), on=((key, key),)).join_batch
+
+
+def collection_lookup(collection, key="isin"):
+    """ lookup querying the securities of one batch with $in """
+    def lookup(positions):
+        values = list({position.get(key) for position in positions} - {None})
+        index = SecurityIndex(collection.find({key: {"$in": values}}), keys=(key,), on=((key, key),))
+        return index.join_batch(positions)
+    return lookup
+
+
+def join_stage(batches, lookup, views=False):
+    """
+    Batches of evaluation records {"sec": security or None, "pos": position}.
+    With views the records hold record_views instead of the raw documents.
+    """
+    PositionView, SecurityView = view_class(PositionModel), view_class(SecurityModel)
+    for batch in batches:
+        records = []
+        for position, security in zip(batch, lookup(batch)):
+            if views:
+                position = PositionView(position)
+                security = SecurityView(security) if security is not None else None
+            records.append({"sec": security, "pos": position})
+        yield records
+
+
+def evaluate_stage(batches, assign):
+    """ batches of (record, mapping key or None, exception or None) """
+    for records in batches:
+        results = []
+        for record in records:
+            try:
+                results.append((record, assign(record), None))
+            except Exception as err:
+                results.append((record, None, err))
+        yield results
+
+
+def prefetch(iterable, depth=2):
+    """
+    Runs iterable in a background thread with at most depth items buffered, the thread
+    blocks while the queue is full. Exceptions are re-raised in the consumer.
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(("item", item)):
+                    return
+            put(("done", None))
+        except BaseException as err:
+            put(("error", err))
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name="assignment-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            kind, item = items.get()
+            if kind == "done":
+                return
+            if kind == "error":
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def mongo_sink(collection, as_of=None):
+    """ sink upserting {_id: position _id, mapping, as_of} per batch, the format of rule_mongo.mapping_pipeline """
+    def sink(results):
+        requests = [UpdateOne({"_id": record["pos"].get("_id")}, {"$set": {"mapping": key, "as_of": as_of}}, upsert=True)
+                    for record, key, error in results if error is None]
+        if requests:
+            collection.bulk_write(requests, ordered=False)
+    return sink
+
+
+def run_pipeline(source, lookup, assign, sink, prefetch_depth=2, views=False):
+    """
+    Streams the batches of source through join, evaluation and sink.
+
+    :param source: iterable of position batches, e.g. cursor_source
+    :param lookup: batch of positions -> their securities (None if missing), e.g. SecurityIndex.join_batch
+    :param assign: evaluation record -> mapping key or None, e.g. MappingRuleSet.assign
+    :param sink: called with every batch of (record, mapping key, exception) results
+    :param prefetch_depth: joined batches read ahead in a thread, 0 reads in the calling thread
+    :return: PipelineStats
+    """
+    batches = join_stage(source, lookup, views)
+    if prefetch_depth:
+        batches = prefetch(batches, prefetch_depth)
+    stats = PipelineStats()
+    for results in evaluate_stage(batches, assign):
+        stats.batches += 1
+        stats.records += len(results)
+        for record, key, error in results:
+            if record["sec"] is None:
+                stats.missing += 1
+            if error is not None:
+                stats.failed += 1
+            elif key is None:
+                stats.unmatched += 1
+            else:
+                stats.assigned += 1
+        sink(results)
+    return stats
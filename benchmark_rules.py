@@ -0,0 +1,267 @@
+"""
+Benchmarks for parsing, validating and evaluating rules on synthetic data.
+
+Records are generated from PositionModel/SecurityModel, rule sets in the test.json
+format. Every stage is timed separately (best of --repeat runs) and written as JSON.
+Pass a previous result as --baseline to fail (exit code 1) on regressions above
+--max-regression, e.g.
+
+    python benchmark_rules.py --positions 2000 --mappings 50 --output bench.json
+    python benchmark_rules.py --positions 2000 --mappings 50 --baseline bench.json --max-regression 0.2
+
+Tracing (rule_trace) is timed as configured, stdout goes to os.devnull.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+from models import PositionModel, SecurityModel
+from rule_widget import process_input_string, validate_tree, evaluate_tree_conditions, evaluate
+from schema_registry import model_schema
+from rule_compiler import compile_rule
+from mapping_rules import build_rule_set
+from position_assignment_filer import mapping_evaluator
+
+AS_OF = datetime(2025, 7, 11, 12, 0, 0)
+STRING_VALUES = 8
+
+
+def synthetic_value(rng, field, field_type, isins):
+    if field == "isin":
+        return rng.choice(isins)
+    if field_type == "string":
+        return f"{field[:3].upper()}{rng.randrange(STRING_VALUES)}"
+    if field_type == "float":
+        return round(rng.uniform(-100, 100), 2)
+    if field_type == "int":
+        return rng.randint(0, 100)
+    if field_type == "bool":
+        return rng.random() < 0.5
+    if field_type == "datetime":
+        return AS_OF - timedelta(days=rng.randint(0, 400), hours=rng.randint(0, 23), minutes=rng.randint(0, 59))
+    return None
+
+
+def synthetic_model(rng, model, name, isins):
+    values = {}
+    for full_field, field_type in model_schema(model, name).items():
+        field = full_field.split(".", 1)[1]
+        value = synthetic_value(rng, field, field_type, isins)
+        if value is not None:
+            values[field] = value
+    # validated by the model, the record is what the database would hold
+    return model(**values).model_dump()
+
+
+def synthetic_records(positions, securities, seed=0):
+    """ evaluation records {"sec": ..., "pos": ...}, every position references one of the securities by isin """
+    rng = random.Random(seed)
+    isins = [f"DE{jj:010d}" for jj in range(securities)]
+    by_isin = {}
+    for isin in isins:
+        security = synthetic_model(rng, SecurityModel, "sec", [isin])
+        by_isin[security["isin"]] = security
+    return [{"sec": by_isin[position["isin"]], "pos": position}
+            for position in (synthetic_model(rng, PositionModel, "pos", isins) for _ in range(positions))]
+
+
+def valid_fields():
+    fields = model_schema(PositionModel, "pos")
+    fields.update(model_schema(SecurityModel, "sec"))
+    return {field: field_type for field, field_type in fields.items()
+            if field_type in ("string", "float", "int", "bool", "datetime")}
+
+
+def synthetic_condition(rng, fields):
+    full_field, field_type = rng.choice(sorted(fields.items()))
+    field = full_field.split(".", 1)[1]
+    if field_type == "string":
+        values = [f'"{field[:3].upper()}{rng.randrange(STRING_VALUES)}"' for _ in range(3)]
+        return rng.choice([f"?{full_field} == {values[0]}?", f"?{full_field} <> {values[0][:3]}\"?",
+                           f"?{full_field} := [{','.join(values)}]?"])
+    if field_type in ("float", "int"):
+        low = rng.randint(-100, 80)
+        return rng.choice([f"?{full_field} {rng.choice(['<', '<=', '>', '>='])} {low}?",
+                           f"?{full_field} := /{low},{low + rng.randint(0, 100)}/?"])
+    if field_type == "bool":
+        return f"?{full_field} == {rng.choice(['TRUE', 'FALSE'])}?"
+    hour = rng.randint(7, 17)
+    return rng.choice([f"?{full_field} {rng.choice(['<', '>='])} (*,*,*,{hour},{rng.randint(0, 59)},*)?",
+                       f"?{full_field} < {{0,{rng.randint(0, 12)},0,0,0,0}}?"])
+
+
+def synthetic_rule(rng, fields, depth=2):
+    if depth == 0 or rng.random() < 0.4:
+        return synthetic_condition(rng, fields)
+    op = rng.choice(["$AND", "$OR", "$NOT"])
+    if op == "$NOT":
+        return f"$NOT({synthetic_rule(rng, fields, depth - 1)})"
+    return f"{op}({','.join(synthetic_rule(rng, fields, depth - 1) for _ in range(rng.randint(2, 3)))})"
+
+
+def synthetic_rule_strings(mappings, rules_per_mapping, seed=0):
+    """ list of mappings, every mapping a list of rule strings """
+    rng = random.Random(seed)
+    fields = valid_fields()
+    return [[synthetic_rule(rng, fields) for _ in range(rules_per_mapping)] for _ in range(mappings)]
+
+
+def mapping_assignments(rule_strings, fields):
+    """ rule set in the test.json format """
+    return {f"mapping_{jj}": {"label": f"Mapping {jj}", "temp": False,
+                              "rule_dicts": [process_input_string(rule, fields) for rule in rules]}
+            for jj, rules in enumerate(rule_strings)}
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run_benchmarks(positions=1000, securities=200, mappings=20, rules_per_mapping=3, repeat=3, seed=0):
+    """
+    :return: dict with "meta" (sizes, environment) and "results": name -> {"ops", "seconds", "us_per_op", "ops_per_second"}
+    """
+    fields = valid_fields()
+    records = synthetic_records(positions, securities, seed)
+    rule_strings = synthetic_rule_strings(mappings, rules_per_mapping, seed)
+    flat_rules = [rule for rules in rule_strings for rule in rules]
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        assignments = mapping_assignments(rule_strings, fields)
+        asts = [rule for mapping in assignments.values() for rule in mapping["rule_dicts"]]
+        compiled = [compile_rule(ast, as_of=AS_OF) for ast in asts]
+        rule_set = build_rule_set(assignments, as_of=AS_OF)
+
+        def evaluate_two_phase():
+            for record in records:
+                for ast in asts:
+                    try:
+                        evaluate_tree_conditions(ast, record, AS_OF)
+                    except (TypeError, AttributeError):
+                        pass
+
+        def evaluate_pure():
+            for record in records:
+                for ast in asts:
+                    try:
+                        evaluate(ast, record, as_of=AS_OF)
+                    except (TypeError, AttributeError):
+                        pass
+
+        def evaluate_compiled():
+            for record in records:
+                for rule in compiled:
+                    try:
+                        rule(record)
+                    except (TypeError, AttributeError):
+                        pass
+
+        def assign(function):
+            def run():
+                for record in records:
+                    try:
+                        function(record)
+                    except (TypeError, AttributeError):
+                        pass
+            return run
+
+        benchmarks = {
+            "process_input_string": (lambda: [process_input_string(rule, fields) for rule in flat_rules], len(flat_rules)),
+            "validate_tree": (lambda: [validate_tree(ast, fields) for ast in asts], len(asts)),
+            "evaluate_tree_conditions": (evaluate_two_phase, len(records) * len(asts)),
+            "evaluate": (evaluate_pure, len(records) * len(asts)),
+            "compile_rule": (lambda: [compile_rule(ast, as_of=AS_OF) for ast in asts], len(asts)),
+            "compiled_rule": (evaluate_compiled, len(records) * len(asts)),
+            "mapping_evaluator": (assign(lambda record: mapping_evaluator(assignments, record, AS_OF)), len(records)),
+            "mapping_rule_set": (assign(rule_set.assign), len(records)),
+        }
+        results = {}
+        for name, (function, ops) in benchmarks.items():
+            seconds = best_of(function, repeat)
+            results[name] = {"ops": ops, "seconds": seconds, "us_per_op": 1e6 * seconds / ops,
+                             "ops_per_second": ops / seconds if seconds else None}
+
+    return {
+        "meta": {
+            "positions": positions, "securities": securities, "mappings": mappings,
+            "rules_per_mapping": rules_per_mapping, "repeat": repeat, "seed": seed,
+            "python": sys.version.split()[0], "platform": platform.platform(), "commit": git_commit(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_to_baseline(result, baseline, max_regression=0.2):
+    """
+    :return: list of (name, baseline us_per_op, current us_per_op, relative change) for every
+        benchmark slower than the baseline by more than max_regression (0.2 = 20 %)
+    """
+    regressions = []
+    for name, current in result["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None or not previous["us_per_op"]:
+            continue
+        change = current["us_per_op"] / previous["us_per_op"] - 1
+        if change > max_regression:
+            regressions.append((name, previous["us_per_op"], current["us_per_op"], change))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rule engine benchmarks on synthetic data")
+    parser.add_argument("--positions", type=int, default=1000)
+    parser.add_argument("--securities", type=int, default=200)
+    parser.add_argument("--mappings", type=int, default=20)
+    parser.add_argument("--rules-per-mapping", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the result JSON to this file instead of stdout")
+    parser.add_argument("--baseline", help="result JSON of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed slowdown per benchmark, 0.2 = 20 %%")
+    args = parser.parse_args(argv)
+
+    result = run_benchmarks(args.positions, args.securities, args.mappings, args.rules_per_mapping, args.repeat, args.seed)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(result, baseline, args.max_regression)
+        result["regressions"] = [{"name": name, "baseline_us_per_op": previous, "us_per_op": current, "change": change}
+                                 for name, previous, current, change in regressions]
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    for regression in result.get("regressions", []):
+        print(f"REGRESSION {regression['name']}: {regression['baseline_us_per_op']:.2f} -> "
+              f"{regression['us_per_op']:.2f} us/op ({100 * regression['change']:+.1f} %)", file=sys.stderr)
+    return 1 if result.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
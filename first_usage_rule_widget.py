@@ -1,4 +1,4 @@
-from rule_widget import process_input_string, evaluate_tree_conditions,evaluate_expression
+from rule_widget import process_input_string, evaluate
 from trades import trade_valid_fields
 import json
 from pymongo import MongoClient
@@ -13,9 +13,7 @@ trades = z["trades"]
 all_trades = list(trades.find())
 for trade in all_trades:
     eval_data = {"trade":trade}
-    data = ast
-    evaluate_tree_conditions(data, eval_data)
-    data = evaluate_expression(data)
+    data = evaluate(ast, eval_data)
     if data:
         print(22,trade)
 
@@ -0,0 +1,129 @@
+"""
+Incremental mapping assignment for positions that change intraday.
+
+Every mapping knows the "db.field" paths its rules read (compile_rule(...).fields).
+The results of the mappings are kept per record, when a record changes only the
+mappings reading one of the changed fields are invalidated, and the first-match walk
+reuses every result that is still valid. Intraday mostly remaining_quantity, pnl and
+last_trade change, which most mappings do not read.
+
+Timedelta conditions depend on the time as well: their cutoff is fixed by as_of, call
+set_as_of to move it, which invalidates only the time dependent mappings.
+
+    assigner = IncrementalAssigner(assigners, as_of=as_of)
+    assigner.assign(position["_id"], {"sec": sec_data, "pos": position})
+    assigner.update(position["_id"], {"sec": sec_data, "pos": changed_position}, {"pos.remaining_quantity"})
+"""
+from datetime import datetime
+
+from rule_compiler import compile_rule, compile_and
+
+
+def is_time_dependent(tree):
+    """ True if the rule has a timedelta condition, its result changes with as_of """
+    if tree["type"] == "condition":
+        return tree["value"]["type"] == "timedelta"
+    return any(is_time_dependent(arg) for arg in tree["args"])
+
+
+def changed_fields(old_data, new_data):
+    """ set of "db.field" paths whose value differs between two evaluation records """
+    changed = set()
+    for db in set(old_data) | set(new_data):
+        old_values = old_data.get(db) or {}
+        new_values = new_data.get(db) or {}
+        for field in set(old_values) | set(new_values):
+            if field not in old_values or field not in new_values or old_values[field] != new_values[field]:
+                changed.add(f"{db}.{field}")
+    return changed
+
+
+def snapshot(data):
+    return {db: dict(values) if isinstance(values, dict) else values for db, values in data.items()}
+
+
+class IncrementalAssigner:
+    def __init__(self, mapping_assignments, schema=None, as_of=None):
+        self.as_of = as_of if as_of is not None else datetime.now()
+        self.keys = []
+        self.rule_dicts = []
+        self.rules = []
+        # "db.field" -> indices of the mappings reading it
+        self.dependents = {}
+        self.time_dependent = []
+
+        for index, (key, mapping) in enumerate(mapping_assignments.items()):
+            rule_dicts = mapping.get("rule_dicts", [])
+            compiled = [compile_rule(rule, schema, self.as_of) for rule in rule_dicts]
+            for rule in compiled:
+                for field in rule.fields:
+                    self.dependents.setdefault(field, set()).add(index)
+            if any(is_time_dependent(rule) for rule in rule_dicts):
+                self.time_dependent.append(index)
+            self.keys.append(key)
+            self.rule_dicts.append(rule_dicts)
+            self.rules.append(compile_and(compiled))
+
+        # record id -> per mapping result, None if not known (not evaluated or invalidated)
+        self.results = {}
+        self.snapshots = {}
+        self.evaluated = 0
+        self.reused = 0
+
+    def assign(self, record_id, data):
+        """ evaluates a new (or completely changed) record, returns the key of the first matching mapping """
+        self.results[record_id] = [None] * len(self.keys)
+        return self.first_match(record_id, data)
+
+    def update(self, record_id, data, fields=None):
+        """
+        Re-evaluates a changed record, only mappings reading one of the changed fields are evaluated again.
+
+        :param record_id: id the record was assigned with
+        :param data: the complete, changed evaluation record
+        :param fields: changed "db.field" paths, if None they are computed against the last seen record
+        :return: key of the first matching mapping, None if no mapping matches
+        """
+        if record_id not in self.results:
+            return self.assign(record_id, data)
+        if fields is None:
+            fields = changed_fields(self.snapshots[record_id], data)
+        results = self.results[record_id]
+        for field in fields:
+            for index in self.dependents.get(field, ()):
+                results[index] = None
+        return self.first_match(record_id, data)
+
+    def first_match(self, record_id, data):
+        results = self.results[record_id]
+        self.snapshots[record_id] = snapshot(data)
+        for index, rule in enumerate(self.rules):
+            result = results[index]
+            if result is None:
+                result = results[index] = bool(rule(data))
+                self.evaluated += 1
+            else:
+                self.reused += 1
+            if result:
+                return self.keys[index]
+        return None
+
+    def set_as_of(self, as_of):
+        """ moves the reference time of timedelta conditions, invalidates only the time dependent mappings """
+        self.as_of = as_of
+        for index in self.time_dependent:
+            self.rules[index] = compile_and([compile_rule(rule, as_of=as_of) for rule in self.rule_dicts[index]])
+            for results in self.results.values():
+                results[index] = None
+
+    def refresh(self, record_id, data):
+        """ first matching mapping after set_as_of, without changed fields """
+        return self.update(record_id, data, fields=())
+
+    def forget(self, record_id):
+        self.results.pop(record_id, None)
+        self.snapshots.pop(record_id, None)
+
+    def depends_on(self, field):
+        """ keys of the mappings reading "db.field" """
+        return [self.keys[index] for index in sorted(self.dependents.get(field, ()))]
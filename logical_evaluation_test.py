@@ -1,5 +1,8 @@
 import unittest
+import copy
+from concurrent.futures import ThreadPoolExecutor
 from rule_widget import evaluate_expression as evaluate_logical_expression
+from rule_widget import evaluate, evaluate_tree_conditions, EvaluationStats
 class TestLogicalEvaluation(unittest.TestCase):
 
     def make_leaf(self, result: bool):
@@ -107,6 +110,73 @@ class TestLogicalEvaluation(unittest.TestCase):
         self.assertTrue(evaluate_logical_expression(expr))
 
 
+class TestPureEvaluation(unittest.TestCase):
+
+    def make_condition(self, field, content):
+        return {"type": "condition", "db": "sec", "field": field, "op": "==", "value": {"type": "string", "content": content}}
+
+    def setUp(self):
+        # OR(AND(region == "DE", NOT(sector == "bank")), region == "US")
+        self.tree = {
+            "type": "operator", "operator": "$OR", "args": [
+                {
+                    "type": "operator", "operator": "$AND", "args": [
+                        self.make_condition("region", "DE"),
+                        {"type": "operator", "operator": "$NOT", "args": [self.make_condition("sector", "bank")]}
+                    ]
+                },
+                self.make_condition("region", "US")
+            ]
+        }
+        self.records = [
+            {"sec": {"region": "DE", "sector": "tech"}},   # True
+            {"sec": {"region": "DE", "sector": "bank"}},   # False
+            {"sec": {"region": "US", "sector": "bank"}},   # True
+            {"sec": {"region": "CA", "sector": "tech"}},   # False
+        ]
+
+    def test_results(self):
+        results = [evaluate(self.tree, record) for record in self.records]
+        self.assertEqual(results, [True, False, True, False])
+
+    def test_matches_two_phase_api(self):
+        for record in self.records:
+            shared_copy = copy.deepcopy(self.tree)
+            evaluate_tree_conditions(shared_copy, record)
+            self.assertEqual(evaluate(self.tree, record), evaluate_logical_expression(shared_copy))
+
+    def test_tree_is_not_modified(self):
+        before = copy.deepcopy(self.tree)
+        for record in self.records:
+            evaluate(self.tree, record)
+        self.assertEqual(self.tree, before)
+
+    def test_shared_tree_in_thread_pool(self):
+        records = self.records * 250
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda record: evaluate(self.tree, record), records))
+        self.assertEqual(results, [True, False, True, False] * 250)
+
+    def test_and_stops_at_first_false(self):
+        # the second leaf would raise a TypeError (None > 5) but is never evaluated
+        tree = {"type": "operator", "operator": "$AND", "args": [
+            self.make_condition("region", "DE"),
+            {"type": "condition", "db": "sec", "field": "price", "op": ">", "value": {"type": "number", "content": 5}},
+        ]}
+        stats = EvaluationStats()
+        self.assertFalse(evaluate(tree, {"sec": {"region": "US", "price": None}}, stats))
+        self.assertEqual((stats.evaluated, stats.skipped), (1, 1))
+
+    def test_skipped_leaves_are_counted(self):
+        stats = EvaluationStats()
+        for record in self.records:
+            evaluate(self.tree, record, stats)
+        # DE/tech: 2 evaluated, US skipped | DE/bank: 3 evaluated
+        # US/bank: 2 evaluated, sector skipped | CA/tech: 2 evaluated, sector skipped
+        self.assertEqual(stats.evaluated, 9)
+        self.assertEqual(stats.skipped, 3)
+
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
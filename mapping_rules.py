@@ -0,0 +1,146 @@
+"""
+Shared evaluation of a whole mapping rule set (test.json).
+
+Mappings repeat the same conditions (e.g. ?sec.region == "DE"? or
+?pos.remaining_quantity == 0.0?). Every node of every rule is canonicalized with
+reconstruct_expression and stored once in a shared table, so per record each
+distinct condition or sub expression is evaluated at most once, no matter how many
+mappings use it.
+"""
+from collections import namedtuple
+
+from rule_widget import validate_tree, reconstruct_expression, count_conditions
+from rule_compiler import compile_condition
+
+RuleSetInfo = namedtuple("RuleSetInfo", ["mappings", "total_conditions", "distinct_conditions", "distinct_nodes"])
+
+
+def build_rule_set(mapping_assignments, schema=None, as_of=None):
+    """
+    :param mapping_assignments: dict mapping_key -> {"label", "temp", "rule_dicts"}, as stored in test.json
+    :param schema: valid fields dict, if given every rule is validated first
+    :param as_of: reference time for timedelta conditions, see compile_rule
+    :return: MappingRuleSet
+    """
+    return MappingRuleSet(mapping_assignments, schema=schema, as_of=as_of)
+
+
+class MappingRuleSet:
+    """
+    First-match evaluation of mapping_assignments with the same result as
+    position_assignment_filer.mapping_evaluator, but nodes are shared between mappings.
+
+        rule_set = build_rule_set(assigners, as_of=as_of)
+        key = rule_set.assign({"sec": sec_data, "pos": position})
+    """
+    def __init__(self, mapping_assignments, schema=None, as_of=None):
+        self.as_of = as_of
+        # canonical expression -> slot in the per record memo
+        self.slots = {}
+        self.expressions = []
+        self.conditions = 0
+        self.total_conditions = 0
+        self.mappings = []
+
+        for key, mapping in mapping_assignments.items():
+            rules = []
+            for rule in mapping.get("rule_dicts", []):
+                if schema is not None:
+                    validate_tree(rule, schema)
+                self.total_conditions += count_conditions(rule)
+                rules.append(self.share(rule))
+            self.mappings.append((key, rules))
+
+    def share(self, node):
+        """ compiled closure (data, memo, stats) -> bool for node, reusing an existing slot for equal nodes """
+        expression = reconstruct_expression(node)
+        slot = self.slots.get(expression)
+        if slot is not None:
+            return self.expressions[slot][1]
+
+        if node["type"] == "condition":
+            self.conditions += 1
+            evaluate = self.share_condition(node)
+        else:
+            evaluate = self.share_operator(node)
+
+        slot = len(self.expressions)
+        self.slots[expression] = slot
+        memoized = memoize(evaluate, slot, node["type"] == "condition")
+        self.expressions.append((expression, memoized))
+        return memoized
+
+    def share_condition(self, node):
+        condition = compile_condition(node, self.as_of)
+
+        def evaluate(data, memo, stats):
+            return bool(condition(data))
+        return evaluate
+
+    def share_operator(self, node):
+        op = node["operator"]
+        args = [self.share(arg) for arg in node["args"]]
+        # condition leaves after every argument, counted as skipped when the operator short-circuits there
+        remaining = [sum(count_conditions(rest) for rest in node["args"][jj + 1:]) for jj in range(len(args))]
+
+        if op == "$AND":
+            def evaluate(data, memo, stats):
+                for jj, arg in enumerate(args):
+                    if not arg(data, memo, stats):
+                        if stats is not None:
+                            stats.skipped += remaining[jj]
+                        return False
+                return True
+
+        elif op == "$OR":
+            def evaluate(data, memo, stats):
+                for jj, arg in enumerate(args):
+                    if arg(data, memo, stats):
+                        if stats is not None:
+                            stats.skipped += remaining[jj]
+                        return True
+                return False
+
+        elif op == "$NOT":
+            if len(args) != 1:
+                raise ValueError(f"$NOT expects exactly one argument, got {len(args)}")
+            arg = args[0]
+
+            def evaluate(data, memo, stats):
+                return not arg(data, memo, stats)
+
+        else:
+            raise ValueError(f"Unknown operator: {op}")
+        return evaluate
+
+    def assign(self, data, stats=None):
+        """
+        Key of the first mapping whose rule_dicts are all True, None if no mapping matches.
+        Pass an EvaluationStats to count condition leaves: evaluated are actual evaluations,
+        skipped are short-circuited like in rule_widget.evaluate, shared_hits are lookups
+        answered from the shared results of this record.
+        """
+        memo = [None] * len(self.expressions)
+        for key, rules in self.mappings:
+            for rule in rules:
+                if not rule(data, memo, stats):
+                    break
+            else:
+                return key
+        return None
+
+    def info(self):
+        return RuleSetInfo(len(self.mappings), self.total_conditions, self.conditions, len(self.expressions))
+
+
+def memoize(evaluate, slot, is_condition):
+    def shared(data, memo, stats):
+        result = memo[slot]
+        if result is None:
+            result = memo[slot] = evaluate(data, memo, stats)
+            if is_condition and stats is not None:
+                stats.evaluated += 1
+        elif is_condition and stats is not None:
+            stats.shared_hits += 1
+        return result
+    return shared
@@ -5,11 +5,13 @@ from PyQt5.QtWidgets import (
     QComboBox, QTextEdit, QHBoxLayout, QVBoxLayout, QShortcut, QListWidgetItem, QLineEdit, QMessageBox,QLabel
 )
 from PyQt5.QtGui import QKeySequence
-from rule_widget import process_input_string, reconstruct_expression, create_valid_fields_dict, tooltip_html
-from trades import trade_valid_fields
+from rule_widget import cached_process_input_string, reconstruct_expression, create_valid_fields_dict, tooltip_html
 from PyQt5.QtCore import Qt
 import json
 from models import SecurityModel, PositionModel
+from rule_trace import trace_category
+
+TRACE_MAPPING_TOOL = trace_category("mapping_tool")
 
 
 
@@ -28,7 +30,8 @@ class MappingTool(QWidget):
         if previous_data:
             self.data = previous_data
 
-        print(999,self.data)
+        if TRACE_MAPPING_TOOL.enabled:
+            TRACE_MAPPING_TOOL.emit("init", data_path=data_path, mappings=len(self.data))
 
         self.mapping_dict = mapping_dict
         self.valid_fields = valid_fields
@@ -119,7 +122,7 @@ class MappingTool(QWidget):
 
             for line in lines:
                 if line.strip():  # skip empty lines
-                    rule = process_input_string(line, self.valid_fields)
+                    rule = cached_process_input_string(line, self.valid_fields)
                     rule_update.append(rule)
 
             item = self.list_widget.currentItem()
@@ -253,10 +256,10 @@ class MappingTool(QWidget):
         try:
             with open(self.data_path, "r", encoding="utf-8") as f:
                 load_data = json.load(f)
-                print(888,load_data)
                 load_data = dict(
                     sorted(load_data.items(), key=lambda x: x[1].get("position", 0)))
-                print(9919,load_data)
+                if TRACE_MAPPING_TOOL.enabled:
+                    TRACE_MAPPING_TOOL.emit("load_data", data_path=self.data_path, keys=list(load_data))
                 return load_data
             print(f"Loaded rules from {filename}")
         except FileNotFoundError:
@@ -369,7 +372,6 @@ if __name__ == '__main__':
     print(mappings_list)
     valid_fields = {}
     valid_fields = create_valid_fields_dict(SecurityModel,name="sec")|create_valid_fields_dict(PositionModel,name="pos")
-    print(valid_fields)
 
     window = MappingTool(mappings,valid_fields,"test.json",tool_tip_data=tooltip_html)
     window.resize(600, 300)
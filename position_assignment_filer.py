@@ -1,14 +1,15 @@
 import json
-from rule_widget import evaluate_expression, evaluate_tree_conditions, condition_evaluator
+from datetime import datetime
+from rule_widget import evaluate
+from mapping_rules import build_rule_set
+from rule_snapshot import load_ruleset
+from assignment_pipeline import run_pipeline, cursor_source
+from security_index import SecurityIndex
+from rule_trace import trace_category
 from pymongo import MongoClient
-with open(r"C:\Users\dnml1\Downloads\securities.json", "r", encoding="utf-8") as f:
-    securities_data = json.load(f)
-
-z = MongoClient()
-y = z["trading_data"]
-x = y["positions"]
-
 
+TRACE_MAPPING = trace_category("mapping")
+TRACE_ASSIGNMENT = trace_category("assignment")
 
 
 def find_by_field(data,key,value):
@@ -17,32 +18,50 @@ def find_by_field(data,key,value):
             return item
     return None
 
-with open(r"test.json", "r", encoding="utf-8") as f:
-    assigners = json.load(f)
-
-positions = list(x.find())
 
-
-def mapping_evaluator(mapping_assignments, data):
+def mapping_evaluator(mapping_assignments, data, as_of=None):
     for key,mapping in mapping_assignments.items():
-        print(44,mapping)
-        bools = []
-        for rule in mapping.get("rule_dicts",[]):
-            input = rule
-            temp_data = data
-            evaluate_tree_conditions(input,temp_data)
-            bool = evaluate_expression(input)
-            bools.append(bool)
-        if all(bools):
+        if TRACE_MAPPING.enabled:
+            TRACE_MAPPING.emit("mapping", key=key, label=mapping.get("label"))
+        # rule_dicts are and-connected, stop at the first rule that fails
+        if all(evaluate(rule, data, as_of=as_of) for rule in mapping.get("rule_dicts",[])):
             return key
 
     return None
 
 
-for position in positions:
-    sec_data = find_by_field(securities_data,"isin",position.get("isin"))
-    processing_data = {"sec":sec_data,"pos":position}
-    try:
-        print(55555,mapping_evaluator(assigners,processing_data))
-    except:
-        print(696969,processing_data)
\ No newline at end of file
+def main():
+    with open(r"C:\Users\dnml1\Downloads\securities.json", "r", encoding="utf-8") as f:
+        securities_data = json.load(f)
+
+    z = MongoClient()
+    y = z["trading_data"]
+    x = y["positions"]
+
+    # parsed once into test.rules, recompiled when test.json changes
+    assigners = load_ruleset(r"test.json").mappings
+
+    # one reference time for all timedelta rules of this run, set a fixed datetime to rerun a historical assignment
+    as_of = datetime.now()
+    # conditions shared between mappings are evaluated once per position
+    rule_set = build_rule_set(assigners, as_of=as_of)
+
+    def trace_results(results):
+        if TRACE_ASSIGNMENT.enabled:
+            for record, mapping_key, err in results:
+                position = record["pos"]
+                if err is None:
+                    TRACE_ASSIGNMENT.emit("assigned", position=position.get("_id"), isin=position.get("isin"), mapping=mapping_key)
+                else:
+                    TRACE_ASSIGNMENT.emit("error", position=position.get("_id"), isin=position.get("isin"), error=err)
+
+    # positions are streamed in batches, memory does not grow with the collection
+    # securities are indexed by isin once, every position is one dict lookup
+    securities = SecurityIndex(securities_data)
+    stats = run_pipeline(cursor_source(x, batch_size=1000), securities.join_batch, rule_set.assign, trace_results)
+    print(f"Assigned {stats.assigned} positions, {stats.unmatched} without mapping, {stats.failed} failed")
+    if securities.misses:
+        print(f"{securities.miss_count} positions without security, e.g. isin {', '.join(str(isin) for (isin,), _ in securities.misses.most_common(5))}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,125 @@
+"""
+Typed views on raw records (Mongo documents) without per-record pydantic validation.
+
+view_class(model) generates a __slots__ class with one attribute per model field, its
+__init__ copies the fields out of the raw dict (missing fields get the model default)
+and does nothing else. Views have .get/[] like the dicts, so evaluate, compile_rule and
+the rule sets accept {"sec": view, "pos": view} records unchanged.
+
+Validation is a separate pass over many records, run when the data is loaded or changed:
+
+    invalid = bulk_validate(PositionModel, positions)  # [(index, errors), ...]
+    PositionView = view_class(PositionModel)
+    records = [{"sec": sec_view, "pos": PositionView(position)} for position in positions]
+"""
+import copy
+import functools
+import typing
+
+from pydantic import TypeAdapter, ValidationError
+from pydantic_core import PydanticUndefined
+
+from schema_registry import model_schema
+
+# mongo documents carry their id outside of the models
+EXTRA_FIELDS = ("_id",)
+
+
+class RecordView:
+    __slots__ = ()
+    MODEL = None
+    # field names, including EXTRA_FIELDS
+    FIELDS = ()
+    FIELD_SET = frozenset()
+    # field -> declared type (schema_registry), only for model fields
+    TYPES = {}
+
+    def get(self, key, default=None):
+        if key in self.FIELD_SET:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key in self.FIELD_SET:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.FIELD_SET
+
+    def keys(self):
+        return self.FIELDS
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def validate(self):
+        """ the validated model instance, raises pydantic.ValidationError """
+        return self.MODEL.model_validate(self.to_dict())
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.FIELDS if getattr(self, field) is not None)
+        return f"{type(self).__name__}({fields})"
+
+
+@functools.lru_cache(maxsize=None)
+def view_class(model):
+    """ RecordView subclass for a pydantic model, generated once per model """
+    fields = tuple(model.model_fields) + tuple(field for field in EXTRA_FIELDS if field not in model.model_fields)
+    namespace = {}
+    lines = ["def __init__(self, record):", "    get = record.get"]
+    for jj, field in enumerate(fields):
+        info = model.model_fields.get(field)
+        factory = info.default_factory if info is not None else None
+        if info is not None and isinstance(info.default, (list, dict, set)):
+            # mutable defaults are copied per view, like pydantic does
+            factory = functools.partial(copy.copy, info.default)
+        if factory is not None:
+            namespace[f"factory_{jj}"] = factory
+            lines.append(f"    self.{field} = record[{field!r}] if {field!r} in record else factory_{jj}()")
+        else:
+            default = None if info is None or info.default is PydanticUndefined else info.default
+            namespace[f"default_{jj}"] = default
+            lines.append(f"    self.{field} = get({field!r}, default_{jj})")
+    # the generated constructor is a straight sequence of slot assignments, no loop or setattr
+    exec("\n".join(lines), namespace)
+
+    prefix = f"{model.__name__}."
+    schema = model_schema(model, model.__name__)
+    return type(f"{model.__name__}View", (RecordView,), {
+        "__slots__": fields,
+        "__init__": namespace["__init__"],
+        "MODEL": model,
+        "FIELDS": fields,
+        "FIELD_SET": frozenset(fields),
+        "TYPES": {path[len(prefix):]: field_type for path, field_type in schema.items()},
+    })
+
+
+def make_views(model, records):
+    """ list of views on raw records, not validated """
+    cls = view_class(model)
+    return [cls(record) for record in records]
+
+
+@functools.lru_cache(maxsize=None)
+def list_adapter(model):
+    return TypeAdapter(typing.List[model])
+
+
+def bulk_validate(model, records):
+    """
+    Validates many raw records in one pydantic call.
+
+    :return: list of (index, errors) of the invalid records, errors as returned by ValidationError.errors()
+    """
+    records = [record.to_dict() if isinstance(record, RecordView) else record for record in records]
+    try:
+        list_adapter(model).validate_python(records)
+    except ValidationError as err:
+        invalid = {}
+        for error in err.errors():
+            index = error["loc"][0]
+            invalid.setdefault(index, []).append(dict(error, loc=error["loc"][1:]))
+        return sorted(invalid.items())
+    return []
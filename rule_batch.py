@@ -0,0 +1,291 @@
+"""
+Column-wise evaluation of rule ASTs with numpy.
+
+Instead of evaluating a rule record by record, every condition is evaluated as one
+comparison over a whole column (e.g. all "pos.first_trade" values of a batch) and
+the logical operators are combined with boolean mask algebra.
+
+Differences to condition_evaluator: a missing value (None, missing db) or a value of
+the wrong type never raises, the condition is simply False for that record.
+"""
+import numbers
+import operator
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+
+from rule_widget import rule_fields, datetime_pattern, content_to_timedelta
+from rule_widget import COMPARISON_OPERATORS, TIMEDELTA_CUTOFF_OPERATORS
+
+DATETIME_UNIT = "datetime64[us]"
+# values of object columns used by number and range conditions (numpy scalars are registered as numbers.Real)
+NUMBERS = (numbers.Real, Decimal)
+EQUAL = np.frompyfunc(operator.eq, 2, 1)
+
+
+def build_columns(records, fields):
+    """
+    Builds object columns from evaluation records ({"sec": {...}, "pos": {...}}).
+
+    :param records: list of evaluation records
+    :param fields: iterable of "db.field" paths, e.g. rule_fields(ast)
+    :return: dict "db.field" -> numpy object array
+    """
+    columns = {}
+    for full_field in fields:
+        db, field = full_field.split(".", 1)
+        values = ((record.get(db) or {}).get(field) for record in records)
+        columns[full_field] = np.fromiter(values, dtype=object, count=len(records))
+    return columns
+
+
+def evaluate_batch(ast, columns, as_of=None, evaluator_class=None):
+    """
+    Evaluates a rule for every row of the given columns.
+
+    :param ast: rule AST (output of process_input_string or a rule_dict from test.json)
+    :param columns: dict "db.field" -> array like, all of the same length
+    :param as_of: reference time for timedelta conditions, defaults to now (taken once per batch)
+    :param evaluator_class: BatchEvaluator subclass, e.g. rule_frame.FrameEvaluator
+    :return: numpy bool array, one entry per row
+    """
+    if as_of is None:
+        as_of = datetime.now()
+    return (evaluator_class or BatchEvaluator)(columns, as_of).mask(ast)
+
+
+def assign_batch(mapping_assignments, columns, as_of=None, evaluator_class=None):
+    """
+    Column-wise version of mapping_evaluator: for every row the key of the first
+    mapping whose rule_dicts are all True, None if no mapping matches.
+    """
+    if as_of is None:
+        as_of = datetime.now()
+    evaluator = (evaluator_class or BatchEvaluator)(columns, as_of)
+    result = np.full(evaluator.length, None, dtype=object)
+    unassigned = np.ones(evaluator.length, dtype=bool)
+
+    for key, mapping in mapping_assignments.items():
+        matched = unassigned.copy()
+        for rule in mapping.get("rule_dicts", []):
+            matched &= evaluator.mask(rule)
+        result[matched] = key
+        unassigned &= ~matched
+        if not unassigned.any():
+            break
+    return result
+
+
+class BatchEvaluator:
+    def __init__(self, columns, as_of):
+        self.columns = {key: np.asarray(column) for key, column in columns.items()}
+        lengths = {len(column) for column in self.columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"All columns need the same length, got {sorted(lengths)}")
+        self.length = lengths.pop() if lengths else 0
+        self.as_of = as_of
+        # converted columns, shared between all conditions on the same field
+        self.converted = {}
+
+    def mask(self, node):
+        if node["type"] == "condition":
+            return self.condition_mask(node)
+
+        elif node["type"] == "operator":
+            op = node["operator"]
+            args = node["args"]
+
+            if op == "$AND":
+                result = self.mask(args[0])
+                for arg in args[1:]:
+                    result = result & self.mask(arg)
+                return result
+
+            elif op == "$OR":
+                result = self.mask(args[0])
+                for arg in args[1:]:
+                    result = result | self.mask(arg)
+                return result
+
+            elif op == "$NOT":
+                if len(args) != 1:
+                    raise ValueError(f"$NOT expects exactly one argument, got {len(args)}")
+                return ~self.mask(args[0])
+
+            else:
+                raise ValueError(f"Unknown operator: {op}")
+
+        else:
+            raise ValueError(f"Unknown node type {node['type']}")
+
+    # ------------------------------------------------------------------
+    # columns
+    # ------------------------------------------------------------------
+    def column(self, condition):
+        full_field = f"{condition['db']}.{condition['field']}"
+        if full_field not in self.columns:
+            raise KeyError(f"No column for field: {full_field}")
+        return full_field, self.columns[full_field]
+
+    def float_column(self, full_field, column):
+        key = (full_field, "float")
+        if key not in self.converted:
+            if column.dtype.kind in "biuf":
+                converted = column.astype(float)
+            else:
+                converted = np.fromiter(
+                    (float(value) if isinstance(value, NUMBERS) else np.nan for value in column),
+                    dtype=float, count=len(column))
+            self.converted[key] = converted
+        return self.converted[key]
+
+    def datetime_column(self, full_field, column):
+        key = (full_field, "datetime")
+        if key not in self.converted:
+            if column.dtype.kind == "M":
+                converted = column.astype(DATETIME_UNIT)
+            else:
+                converted = np.fromiter(
+                    (np.datetime64(value, "us") if isinstance(value, datetime) else np.datetime64("NaT")
+                     for value in column),
+                    dtype=DATETIME_UNIT, count=len(column))
+            self.converted[key] = converted
+        return self.converted[key]
+
+    def datetime_part(self, full_field, column, index):
+        """ year, month, day, hour, minute or second (index 0-5) of a datetime column as int array """
+        key = (full_field, "datetime", index)
+        if key not in self.converted:
+            values = self.datetime_column(full_field, column)
+            if index == 0:
+                part = values.astype("datetime64[Y]").astype(np.int64) + 1970
+            elif index == 1:
+                part = values.astype("datetime64[M]").astype(np.int64) % 12 + 1
+            else:
+                units = ["M", "D", "h", "m", "s"]
+                coarse = values.astype(f"datetime64[{units[index - 2]}]")
+                fine = values.astype(f"datetime64[{units[index - 1]}]")
+                part = (fine - coarse).astype(np.int64) + (1 if index == 2 else 0)
+            self.converted[key] = part
+        return self.converted[key]
+
+    # ------------------------------------------------------------------
+    # conditions
+    # ------------------------------------------------------------------
+    def condition_mask(self, condition):
+        full_field, column = self.column(condition)
+        op = condition.get("op")
+        value = condition.get("value")
+        value_type = value.get("type")
+
+        if value_type == "string":
+            content = value.get("content")
+            if op == "==":
+                return self.equal_mask(column, content)
+            elif op == "<>":
+                if column.dtype.kind == "U":
+                    return np.char.find(column, content) >= 0
+                return self.row_mask(column, lambda ref: isinstance(ref, (str, list, tuple)) and content in ref)
+            elif op == ":=":
+                return self.row_mask(column, lambda ref: isinstance(ref, str) and ref in content)
+            else:
+                raise ValueError(f"String evaluation failed at: {condition}")
+
+        elif value_type == "number":
+            if op not in COMPARISON_OPERATORS:
+                raise ValueError(f"Number evaluation failed at: {condition}")
+            return COMPARISON_OPERATORS[op](self.float_column(full_field, column), value.get("content"))
+
+        elif value_type == "range":
+            if op != ":=":
+                raise ValueError(f"Range evaluation failed at: {condition}")
+            values = self.float_column(full_field, column)
+            return (values >= float(value.get("low"))) & (values <= float(value.get("high")))
+
+        elif value_type == "list":
+            content = list(value.get("content"))
+            if op == ":=":
+                return self.member_mask(column, content)
+            elif op == "<>":
+                return self.row_mask(column, lambda ref: isinstance(ref, (str, list, tuple, set))
+                                     and all(elem in ref for elem in content))
+            else:
+                raise ValueError(f"List evaluation failed at: {condition}")
+
+        elif value_type == "datetime":
+            if op not in COMPARISON_OPERATORS:
+                raise ValueError(f"Datetime evaluation failed at: {condition}")
+            return self.datetime_mask(full_field, column, op, value.get("content"))
+
+        elif value_type == "timedelta":
+            if op not in TIMEDELTA_CUTOFF_OPERATORS:
+                raise ValueError(f"Timedelta evaluation failed at: {condition}")
+            cutoff = np.datetime64(self.as_of - content_to_timedelta(value.get("content")), "us")
+            # NaT compares False for every ordering operator
+            return COMPARISON_OPERATORS[TIMEDELTA_CUTOFF_OPERATORS[op]](self.datetime_column(full_field, column), cutoff)
+
+        elif value_type == "bool":
+            return self.equal_mask(column, value.get("content"))
+
+        else:
+            raise ValueError(f"Unknown value type: {value_type}")
+
+    def datetime_mask(self, full_field, column, op, content):
+        """
+        Same position by position comparison as condition_evaluator, vectorised:
+        walking the fixed parts from the last to the first, a row is smaller if it is
+        smaller at this part or equal at this part and smaller afterwards.
+        """
+        mask, target = datetime_pattern(content)
+        fixed = list(zip(mask, target))
+        valid = ~np.isnat(self.datetime_column(full_field, column))
+
+        if op == "==":
+            result = np.ones(self.length, dtype=bool)
+            for jj, target in fixed:
+                result &= self.datetime_part(full_field, column, jj) == target
+            return result & valid
+
+        result = np.full(self.length, op in ("<=", ">="), dtype=bool)
+        decides = np.less if op in ("<", "<=") else np.greater
+        for jj, target in reversed(fixed):
+            part = self.datetime_part(full_field, column, jj)
+            result = decides(part, target) | ((part == target) & result)
+        return result & valid
+
+    def equal_mask(self, column, content):
+        """
+        column value == content per element with python equality, like evaluate. Comparing
+        the array directly can give a single scalar, e.g. an int column with a string.
+        """
+        return EQUAL(column, content).astype(bool)
+
+    def member_mask(self, column, content):
+        """
+        column value in content: one frozenset lookup per row, called from the ufunc loop
+        of np.frompyfunc instead of a python generator. A column with unhashable values
+        (e.g. lists) falls back to row_mask.
+        """
+        lookup = frozenset(content)
+        try:
+            return np.frompyfunc(lookup.__contains__, 1, 1)(column).astype(bool)
+        except TypeError:
+            return self.row_mask(column, lambda ref: is_member(ref, lookup, content))
+
+    def row_mask(self, column, predicate):
+        """ fallback for checks that have no numpy equivalent, still one pass per column """
+        return np.fromiter((bool(predicate(ref)) for ref in column), dtype=bool, count=len(column))
+
+
+def is_member(reference, lookup, content):
+    try:
+        return reference in lookup
+    except TypeError:
+        # unhashable reference, e.g. a list
+        return reference in content
+
+
+def evaluate_records(ast, records, as_of=None):
+    """ evaluate_batch for a list of evaluation records, builds the needed columns first """
+    return evaluate_batch(ast, build_columns(records, rule_fields(ast)), as_of=as_of)
@@ -0,0 +1,393 @@
+import time
+
+from rule_widget import validate_tree, rule_fields, compile_datetime_matcher, compile_timedelta_matcher, COMPARISON_OPERATORS
+
+
+def compile_rule(ast, schema=None, as_of=None, profiler=None, name=None):
+    """
+    Turns a rule AST (output of process_input_string or a rule_dict from test.json)
+    into a tree of closures. All literal coercion and operator selection happens here,
+    once, so calling the result only does the actual comparisons.
+
+    :param ast: rule AST
+    :param schema: valid fields dict, if given the ast is validated first
+    :param as_of: reference time for timedelta conditions, the cutoff (as_of - td) is computed once.
+        Defaults to None, which compares against the current time on every call
+    :param profiler: opt-in instrumentation, e.g. rule_profiler.RuleProfiler. Every node then records
+        evaluations, true count, exceptions and time in profiler.node_stats(name, path, node)
+    :param name: name of the rule in the profiler report
+    :return: callable taking the evaluation data ({"sec": {...}, "pos": {...}}) and returning a bool,
+        its fields attribute is the frozenset of "db.field" paths the rule reads
+    """
+    if schema is not None:
+        validate_tree(ast, schema)
+    if profiler is None:
+        compiled = compile_node(ast, as_of)
+    else:
+        compiled = compile_instrumented(ast, as_of, lambda path, node: profiler.node_stats(name, path, node))
+    compiled.fields = frozenset(rule_fields(ast))
+    return compiled
+
+
+def compile_node(node, as_of=None):
+    if node["type"] == "condition":
+        return compile_condition(node, as_of)
+
+    elif node["type"] == "operator":
+        op = node["operator"]
+        args = [compile_node(arg, as_of) for arg in node["args"]]
+
+        if op == "$AND":
+            return compile_and(args)
+
+        elif op == "$OR":
+            return compile_or(args)
+
+        elif op == "$NOT":
+            if len(args) != 1:
+                raise ValueError(f"$NOT expects exactly one argument, got {len(args)}")
+            arg = args[0]
+
+            def evaluate_not(data):
+                return not arg(data)
+            return evaluate_not
+
+        else:
+            raise ValueError(f"Unknown operator: {op}")
+
+    else:
+        raise ValueError(f"Unknown node type {node['type']}")
+
+
+def compile_and(args):
+    def evaluate_and(data):
+        for arg in args:
+            if not arg(data):
+                return False
+        return True
+    return evaluate_and
+
+
+def compile_or(args):
+    def evaluate_or(data):
+        for arg in args:
+            if arg(data):
+                return True
+        return False
+    return evaluate_or
+
+
+def compile_condition(condition, as_of=None):
+    """
+    Compiles a single condition node into a closure with the same semantics as
+    rule_widget.condition_evaluator.
+    """
+    db = condition["db"]
+    field = condition["field"]
+    op = condition.get("op")
+    value = condition.get("value")
+    value_type = value.get("type")
+
+    if value_type == "string":
+        content = value.get("content")
+        if op == "==":
+            def evaluate(data):
+                return data.get(db).get(field) == content
+        elif op == "<>":
+            def evaluate(data):
+                return content in data.get(db).get(field)
+        elif op == ":=":
+            def evaluate(data):
+                return data.get(db).get(field) in content
+        else:
+            raise ValueError(f"String evaluation failed at: {condition}")
+        return evaluate
+
+    elif value_type == "number":
+        if op not in COMPARISON_OPERATORS:
+            raise ValueError(f"Number evaluation failed at: {condition}")
+        return compile_comparison(db, field, COMPARISON_OPERATORS[op], value.get("content"))
+
+    elif value_type == "range":
+        if op != ":=":
+            raise ValueError(f"Range evaluation failed at: {condition}")
+        low = float(value.get("low"))
+        high = float(value.get("high"))
+
+        def evaluate(data):
+            reference = data.get(db).get(field)
+            return reference >= low and reference <= high
+        return evaluate
+
+    elif value_type == "list":
+        return compile_list(db, field, op, value.get("content"), condition)
+
+    elif value_type == "datetime":
+        if op not in COMPARISON_OPERATORS:
+            raise ValueError(f"Datetime evaluation failed at: {condition}")
+        return compile_datetime(db, field, op, value.get("content"))
+
+    elif value_type == "timedelta":
+        if op not in COMPARISON_OPERATORS:
+            raise ValueError(f"Timedelta evaluation failed at: {condition}")
+        matches = compile_timedelta_matcher(value.get("content"), op, as_of)
+
+        def evaluate(data):
+            return matches(data.get(db).get(field))
+        return evaluate
+
+    elif value_type == "bool":
+        content = value.get("content")
+
+        def evaluate(data):
+            return content == data.get(db).get(field)
+        return evaluate
+
+    else:
+        raise ValueError(f"Unknown value type: {value_type}")
+
+
+def compile_comparison(db, field, compare, content):
+    def evaluate(data):
+        return compare(data.get(db).get(field), content)
+    return evaluate
+
+
+def compile_list(db, field, op, content, condition):
+    """
+    List literals are frozen into a frozenset once, := is a hash lookup and the
+    contains-all check <> a subset test. Unhashable references (e.g. a list for :=)
+    and string references for <> (substring semantics) fall back to the list checks.
+    """
+    content = tuple(content)
+    lookup = frozenset(content)
+
+    if op == ":=":
+        def evaluate(data):
+            reference = data.get(db).get(field)
+            try:
+                return reference in lookup
+            except TypeError:
+                return reference in content
+        return evaluate
+
+    elif op == "<>":
+        def evaluate(data):
+            reference = data.get(db).get(field)
+            if not isinstance(reference, str):
+                try:
+                    return lookup.issubset(reference)
+                except TypeError:
+                    pass
+            return all(elem in reference for elem in content)
+        return evaluate
+
+    else:
+        raise ValueError(f"List evaluation failed at: {condition}")
+
+
+def compile_datetime(db, field, op, content):
+    """ wildcard patterns are turned into a mask and target tuple once, see compile_datetime_matcher """
+    matches = compile_datetime_matcher(content, op)
+
+    def evaluate(data):
+        return matches(data.get(db).get(field))
+    return evaluate
+
+
+# ----------------------------------------------------------------------
+# Adaptive argument order
+# ----------------------------------------------------------------------
+class NodeStats:
+    """ evaluation count, true count, cumulative time and exception count of one node """
+    __slots__ = ("evaluations", "true_count", "total_time", "exceptions")
+
+    def __init__(self, evaluations=0, true_count=0, total_time=0.0, exceptions=0):
+        self.evaluations = evaluations
+        self.true_count = true_count
+        self.total_time = total_time
+        self.exceptions = exceptions
+
+    @property
+    def probability(self):
+        return self.true_count / self.evaluations if self.evaluations else None
+
+    @property
+    def cost(self):
+        return self.total_time / self.evaluations if self.evaluations else None
+
+    def to_list(self):
+        return [self.evaluations, self.true_count, self.total_time, self.exceptions]
+
+    def __repr__(self):
+        return (f"NodeStats(evaluations={self.evaluations}, true_count={self.true_count}, "
+                f"total_time={self.total_time}, exceptions={self.exceptions})")
+
+
+def instrument(evaluate, node_stats):
+    def measured(data):
+        start = time.perf_counter()
+        try:
+            result = evaluate(data)
+        except Exception:
+            node_stats.total_time += time.perf_counter() - start
+            node_stats.evaluations += 1
+            node_stats.exceptions += 1
+            raise
+        node_stats.total_time += time.perf_counter() - start
+        node_stats.evaluations += 1
+        if result:
+            node_stats.true_count += 1
+        return result
+    return measured
+
+
+def compile_instrumented(node, as_of, node_stats, order=None, path=()):
+    """
+    compile_node with every node wrapped in instrument.
+
+    :param node_stats: callable (path, node) -> NodeStats of the node, path is the tuple of argument indices
+    :param order: callable (node, path) -> order of the $AND/$OR arguments, defaults to the authored order
+    """
+    stats = node_stats(path, node)
+
+    if node["type"] == "condition":
+        return instrument(compile_condition(node, as_of), stats)
+
+    elif node["type"] == "operator":
+        op = node["operator"]
+        if op in ("$AND", "$OR"):
+            indices = order(node, path) if order is not None else range(len(node["args"]))
+            args = [compile_instrumented(node["args"][jj], as_of, node_stats, order, path + (jj,)) for jj in indices]
+            evaluate = compile_and(args) if op == "$AND" else compile_or(args)
+
+        elif op == "$NOT":
+            if len(node["args"]) != 1:
+                raise ValueError(f"$NOT expects exactly one argument, got {len(node['args'])}")
+            arg = compile_instrumented(node["args"][0], as_of, node_stats, order, path + (0,))
+
+            def evaluate(data):
+                return not arg(data)
+
+        else:
+            raise ValueError(f"Unknown operator: {op}")
+
+        return instrument(evaluate, stats)
+
+    else:
+        raise ValueError(f"Unknown node type {node['type']}")
+
+
+def argument_order(node, path, stats):
+    """
+    Order in which the arguments of a $AND/$OR node should run, as indices into node["args"].
+    An argument decides a $AND when it is False and a $OR when it is True, so arguments are
+    ranked by cost / probability of deciding, the classic ordering for short-circuit chains.
+    Arguments without stats keep their authored order after the measured ones, ties keep
+    the authored order too, so the order only depends on the stats.
+    """
+    decides_on = node["operator"] == "$OR"
+
+    def rank(jj):
+        arg_stats = stats.get(path + (jj,))
+        if arg_stats is None or not arg_stats.evaluations:
+            return (1, 0.0, jj)
+        probability = arg_stats.probability if decides_on else 1 - arg_stats.probability
+        if probability == 0:
+            return (0, float("inf"), jj)
+        return (0, arg_stats.cost / probability, jj)
+
+    return sorted(range(len(node["args"])), key=rank)
+
+
+def reorder_ast(node, stats, path=()):
+    """ copy of the ast with the arguments of every $AND/$OR in argument_order, stats are keyed by authored path """
+    if node["type"] == "condition":
+        return node
+    args = [reorder_ast(arg, stats, path + (jj,)) for jj, arg in enumerate(node["args"])]
+    if node["operator"] in ("$AND", "$OR"):
+        args = [args[jj] for jj in argument_order(node, path, stats)]
+    return {"type": "operator", "operator": node["operator"], "args": args}
+
+
+class AdaptiveRule:
+    """
+    Compiled rule that records for every node how often it is True and how long it takes,
+    and reorders the arguments of $AND/$OR every reorder_every calls so cheap, decisive
+    arguments run first. Results are the same as with compile_rule, only the order changes:
+    a reordered argument can raise (e.g. None > 5) where the authored order short-circuits
+    before reaching it, so a record that raises is evaluated again in the authored order,
+    which returns its result or raises like compile_rule.
+
+    Call freeze() to stop collecting: the rule is then compiled without instrumentation in
+    the order given by the collected stats, which is deterministic for the same stats.
+
+        rule = AdaptiveRule(ast, as_of=as_of)
+        for data in sample: rule(data)
+        rule.freeze()
+    """
+    def __init__(self, ast, schema=None, as_of=None, reorder_every=1000, stats=None):
+        if schema is not None:
+            validate_tree(ast, schema)
+        self.ast = ast
+        self.fields = frozenset(rule_fields(ast))
+        self.as_of = as_of
+        self.reorder_every = reorder_every
+        # authored path (tuple of argument indices) -> NodeStats
+        self.stats = stats if stats is not None else {}
+        self.frozen = False
+        self.calls = 0
+        self._evaluate = self._compile_instrumented(ast, ())
+        self._authored = compile_node(ast, as_of)
+
+    def __call__(self, data):
+        try:
+            result = self._evaluate(data)
+        except Exception:
+            result = self._authored(data)
+        if self.frozen:
+            return result
+        self.calls += 1
+        if self.calls % self.reorder_every == 0:
+            self.reorder()
+        return result
+
+    def reorder(self):
+        """ recompiles the instrumented rule in the order given by the current stats """
+        self._evaluate = self._compile_instrumented(self.ast, ())
+
+    def freeze(self):
+        self.frozen = True
+        self._evaluate = compile_node(self.ordered_ast(), self.as_of)
+
+    def unfreeze(self):
+        self.frozen = False
+        self.reorder()
+
+    def ordered_ast(self):
+        return reorder_ast(self.ast, self.stats)
+
+    def export_stats(self):
+        """
+        stats as json friendly dict, path "0.2" -> [evaluations, true_count, total_time, exceptions],
+        from_exported_stats also reads exports without exceptions
+        """
+        return {".".join(str(jj) for jj in path): node_stats.to_list() for path, node_stats in self.stats.items()}
+
+    @classmethod
+    def from_exported_stats(cls, ast, exported, **kwargs):
+        stats = {}
+        for key, values in exported.items():
+            path = tuple(int(jj) for jj in key.split(".")) if key else ()
+            stats[path] = NodeStats(*values)
+        rule = cls(ast, stats=stats, **kwargs)
+        rule.freeze()
+        return rule
+
+    def _compile_instrumented(self, node, path):
+        def node_stats(node_path, _):
+            return self.stats.setdefault(node_path, NodeStats())
+
+        def order(operator_node, node_path):
+            return argument_order(operator_node, node_path, self.stats)
+        return compile_instrumented(node, self.as_of, node_stats, order, path)
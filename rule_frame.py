@@ -0,0 +1,119 @@
+"""
+pandas backend for the rule DSL.
+
+Rules read "db.field" columns, so positions and securities are joined into one frame
+with "pos." and "sec." prefixed columns (join_frames). The columns are evaluated by
+FrameEvaluator, the column-wise evaluator of rule_batch with numpy arrays (datetime64
+columns without copy), so wildcard datetimes, timedelta ages, ranges, contains and list
+membership have the same semantics as there: missing values (NaN, NaT, None) never
+raise, the condition is False for that row. Contains and membership conditions on
+string columns use Series.str.contains and Series.isin.
+
+    frame = join_frames(df_positions, df_securities)
+    frame.loc[rule_to_expr(ast, as_of)]
+    assign_mappings(df_positions, df_securities, assigners)
+"""
+import numpy as np
+import pandas as pd
+
+from rule_widget import rule_fields
+from rule_batch import evaluate_batch, assign_batch, BatchEvaluator
+
+def frame_columns(frame, fields):
+    """ "db.field" -> Series for every field, KeyError for a column the frame does not have """
+    missing = [field for field in fields if field not in frame.columns]
+    if missing:
+        raise KeyError(f"No column for field: {', '.join(sorted(missing))}")
+    return {field: frame[field] for field in fields}
+
+
+def string_mask(series, op, value):
+    """
+    Mask of a string or list condition with := or <> on a column holding only strings
+    and missing values, None if the condition or the column needs rule_batch.
+    """
+    value_type = value.get("type")
+    if value_type not in ("string", "list") or op not in (":=", "<>"):
+        return None
+    kind = pd.api.types.infer_dtype(series, skipna=True)
+    if kind == "empty":
+        return np.zeros(len(series), dtype=bool)
+    if kind != "string":
+        return None
+
+    content = value.get("content")
+    if value_type == "string" and op == "<>":
+        mask = series.str.contains(content, regex=False, na=False)
+    elif value_type == "string":
+        # ref in content, one find of every present value in the fixed content
+        present = series.notna().to_numpy(dtype=bool)
+        result = np.zeros(len(series), dtype=bool)
+        result[present] = np.char.find(content, series[present].to_numpy(dtype=str)) >= 0
+        return result
+    elif op == ":=":
+        mask = series.isin(list(content))
+    else:
+        if not all(isinstance(elem, str) for elem in content):
+            return None
+        mask = series.notna()
+        for elem in content:
+            mask &= series.str.contains(elem, regex=False, na=False)
+    return mask.to_numpy(dtype=bool)
+
+
+class FrameEvaluator(BatchEvaluator):
+    """ BatchEvaluator that keeps the Series of the columns for the pandas string methods """
+    def __init__(self, columns, as_of):
+        super().__init__(columns, as_of)
+        self.series = columns
+
+    def condition_mask(self, condition):
+        series = self.series.get(f"{condition['db']}.{condition['field']}")
+        mask = None if series is None else string_mask(series, condition.get("op"), condition.get("value"))
+        return mask if mask is not None else super().condition_mask(condition)
+
+
+def rule_to_expr(ast, as_of=None):
+    """
+    :param ast: rule AST (output of process_input_string or a rule_dict from test.json)
+    :param as_of: reference time for timedelta conditions, defaults to now (taken once per call)
+    :return: callable frame -> bool Series with the index of the frame, usable in frame.loc[...]
+    """
+    fields = rule_fields(ast)
+
+    def expr(frame):
+        mask = evaluate_batch(ast, frame_columns(frame, fields), as_of=as_of, evaluator_class=FrameEvaluator)
+        return pd.Series(mask, index=frame.index)
+    return expr
+
+
+def join_frames(df_positions, df_securities, on="isin"):
+    """
+    Positions with their security as one frame, columns prefixed with "pos." and "sec.".
+    Like find_by_field the first security with the isin is used, positions without a
+    security keep NaN in the "sec." columns. The index of df_positions is kept.
+    """
+    securities = df_securities.drop_duplicates(subset=on, keep="first").add_prefix("sec.")
+    positions = df_positions.add_prefix("pos.")
+    joined = positions.merge(securities, how="left", left_on=f"pos.{on}", right_on=f"sec.{on}")
+    joined.index = positions.index
+    return joined
+
+
+def assign_mappings(df_positions, df_securities, rules, as_of=None, on="isin"):
+    """
+    :param df_positions: positions frame, one row per position
+    :param df_securities: securities frame
+    :param rules: mapping_assignments, dict mapping_key -> {"label", "temp", "rule_dicts"} in priority order
+    :param as_of: reference time for timedelta conditions, defaults to now
+    :param on: column joining positions and securities
+    :return: Series with the key of the first matching mapping (None if no mapping matches),
+        indexed like df_positions
+    """
+    fields = set()
+    for mapping in rules.values():
+        for rule in mapping.get("rule_dicts", []):
+            fields |= rule_fields(rule)
+    frame = join_frames(df_positions, df_securities, on=on)
+    assignments = assign_batch(rules, frame_columns(frame, fields), as_of=as_of, evaluator_class=FrameEvaluator)
+    return pd.Series(assignments, index=frame.index, name="mapping", dtype=object)
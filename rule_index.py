@@ -0,0 +1,233 @@
+"""
+Candidate prefiltering for a mapping rule set (test.json) with field indexes.
+
+Most mappings are keyed on a few fields (sec.region, pos.direction, an ISIN list).
+The top level and-connected conditions of every mapping are indexed per field:
+
+- ?db.field == literal? and ?db.field := [list]? go into a hash index
+  literal -> mappings that accept it
+- ?db.field := /low,high/? and number comparisons (<, <=, >, >=) are intersected
+  into one interval per mapping and field, the sorted interval endpoints split the
+  number line into segments and every segment knows the mappings covering it (bisect)
+
+For a record every indexed field is looked up once. Sets of mappings are int bitmasks,
+the candidates are the mappings every indexed field accepts, and only their remaining
+(not indexed) conditions are evaluated, in priority order.
+
+Same result as mapping_evaluator for every record that evaluates without an error.
+A value an indexed condition would raise for (e.g. None > 10) simply excludes the mapping.
+"""
+import numbers
+from bisect import bisect_left
+from collections import namedtuple
+
+from rule_widget import validate_tree
+from rule_compiler import compile_node, compile_and
+from rule_network import split_rule
+
+EQUALITY_VALUE_TYPES = ("string", "number", "bool")
+INFINITY = float("inf")
+
+RuleIndexInfo = namedtuple("RuleIndexInfo", ["mappings", "indexed_mappings", "equality_fields", "interval_fields"])
+
+
+def build_rule_index(mapping_assignments, schema=None, as_of=None):
+    """
+    :param mapping_assignments: dict mapping_key -> {"label", "temp", "rule_dicts"}, in priority order
+    :param schema: valid fields dict, if given every rule is validated first
+    :param as_of: reference time for timedelta conditions, see compile_rule
+    :return: RuleIndex
+    """
+    return RuleIndex(mapping_assignments, schema=schema, as_of=as_of)
+
+
+class Interval:
+    """ number interval, the bounds are included if low_closed/high_closed """
+    __slots__ = ("low", "low_closed", "high", "high_closed")
+
+    def __init__(self, low=-INFINITY, low_closed=False, high=INFINITY, high_closed=False):
+        self.low = low
+        self.low_closed = low_closed
+        self.high = high
+        self.high_closed = high_closed
+
+    @classmethod
+    def from_condition(cls, condition):
+        """ Interval for a range or number comparison condition, None if it is not one """
+        op = condition["op"]
+        value = condition["value"]
+        if value["type"] == "range" and op == ":=":
+            return cls(float(value["low"]), True, float(value["high"]), True)
+        if value["type"] == "number" and op in ("<", "<=", ">", ">="):
+            content = value["content"]
+            if op in ("<", "<="):
+                return cls(high=content, high_closed=op == "<=")
+            return cls(low=content, low_closed=op == ">=")
+        return None
+
+    def intersect(self, other):
+        low, low_closed = self.low, self.low_closed
+        if other.low > low or (other.low == low and not other.low_closed):
+            low, low_closed = other.low, other.low_closed
+        high, high_closed = self.high, self.high_closed
+        if other.high < high or (other.high == high and not other.high_closed):
+            high, high_closed = other.high, other.high_closed
+        return Interval(low, low_closed, high, high_closed)
+
+    def __contains__(self, value):
+        return ((value > self.low or (self.low_closed and value == self.low))
+                and (value < self.high or (self.high_closed and value == self.high)))
+
+    def bounds(self):
+        return [bound for bound in (self.low, self.high) if bound not in (-INFINITY, INFINITY)]
+
+
+def equality_literals(condition):
+    """ literals a ?db.field == literal? or ?db.field := [list]? condition accepts, None if not indexable """
+    value = condition["value"]
+    if condition["op"] == "==" and value["type"] in EQUALITY_VALUE_TYPES:
+        return {value["content"]}
+    if condition["op"] == ":=" and value["type"] == "list":
+        try:
+            return set(value["content"])
+        except TypeError:
+            return None
+    return None
+
+
+class EqualityField:
+    __slots__ = ("db", "field", "masks", "unconstrained")
+
+    def __init__(self, db, field, accepted, all_mask):
+        self.db = db
+        self.field = field
+        # literal -> mappings accepting it
+        self.masks = {}
+        constrained = 0
+        for index, literals in accepted.items():
+            constrained |= 1 << index
+            for literal in literals:
+                self.masks[literal] = self.masks.get(literal, 0) | 1 << index
+        self.unconstrained = all_mask & ~constrained
+
+    def accepting(self, value):
+        try:
+            return self.unconstrained | self.masks.get(value, 0)
+        except TypeError:
+            # unhashable values never equal a string, number or bool literal
+            return self.unconstrained
+
+
+class IntervalField:
+    __slots__ = ("db", "field", "breakpoints", "segments", "unconstrained")
+
+    def __init__(self, db, field, intervals, all_mask):
+        self.db = db
+        self.field = field
+        self.breakpoints = sorted({bound for interval in intervals.values() for bound in interval.bounds()})
+        constrained = 0
+        for index in intervals:
+            constrained |= 1 << index
+        self.unconstrained = all_mask & ~constrained
+
+        # segment 2 * jj is the open part below breakpoint jj, 2 * jj + 1 the breakpoint itself
+        representatives = []
+        previous = None
+        for breakpoint in self.breakpoints:
+            representatives.append(breakpoint - 1 if previous is None else (previous + breakpoint) / 2)
+            representatives.append(breakpoint)
+            previous = breakpoint
+        representatives.append(previous + 1 if previous is not None else 0)
+
+        self.segments = []
+        for representative in representatives:
+            mask = self.unconstrained
+            for index, interval in intervals.items():
+                if representative in interval:
+                    mask |= 1 << index
+            self.segments.append(mask)
+
+    def accepting(self, value):
+        if not isinstance(value, numbers.Real) or value != value:
+            # not a number or NaN, every comparison is False
+            return self.unconstrained
+        jj = bisect_left(self.breakpoints, value)
+        if jj < len(self.breakpoints) and self.breakpoints[jj] == value:
+            return self.segments[2 * jj + 1]
+        return self.segments[2 * jj]
+
+
+class RuleIndex:
+    """
+        index = build_rule_index(assigners, as_of=as_of)
+        key = index.assign({"sec": sec_data, "pos": position})
+    """
+    def __init__(self, mapping_assignments, schema=None, as_of=None):
+        self.keys = []
+        # compiled not indexed parts per mapping
+        self.residuals = []
+        # (db, field) -> {mapping index: accepted literals / Interval}
+        equalities = {}
+        intervals = {}
+
+        for index, (key, mapping) in enumerate(mapping_assignments.items()):
+            residual = []
+            for rule in mapping.get("rule_dicts", []):
+                if schema is not None:
+                    validate_tree(rule, schema)
+                for part in split_rule(rule):
+                    if part["type"] == "condition":
+                        full_field = (part["db"], part["field"])
+                        literals = equality_literals(part)
+                        if literals is not None:
+                            accepted = equalities.setdefault(full_field, {})
+                            accepted[index] = accepted[index] & literals if index in accepted else literals
+                            continue
+                        interval = Interval.from_condition(part)
+                        if interval is not None:
+                            by_mapping = intervals.setdefault(full_field, {})
+                            by_mapping[index] = by_mapping[index].intersect(interval) if index in by_mapping else interval
+                            continue
+                    residual.append(compile_node(part, as_of))
+            self.keys.append(key)
+            self.residuals.append(compile_and(residual))
+
+        self.all_mask = (1 << len(self.keys)) - 1
+        self.equality_fields = [EqualityField(db, field, accepted, self.all_mask)
+                                for (db, field), accepted in equalities.items()]
+        self.interval_fields = [IntervalField(db, field, by_mapping, self.all_mask)
+                                for (db, field), by_mapping in intervals.items()]
+        indexed = set()
+        for accepted in list(equalities.values()) + list(intervals.values()):
+            indexed.update(accepted)
+        self.indexed_mappings = len(indexed)
+
+    def candidate_mask(self, data):
+        mask = self.all_mask
+        for index_field in self.equality_fields + self.interval_fields:
+            mask &= index_field.accepting((data.get(index_field.db) or {}).get(index_field.field))
+            if not mask:
+                break
+        return mask
+
+    def candidates(self, data):
+        """ keys of the mappings the indexes accept for data, in priority order """
+        return [self.keys[index] for index in iterate_bits(self.candidate_mask(data))]
+
+    def assign(self, data):
+        """ key of the first mapping whose rule_dicts are all True, None if no mapping matches """
+        for index in iterate_bits(self.candidate_mask(data)):
+            if self.residuals[index](data):
+                return self.keys[index]
+        return None
+
+    def info(self):
+        return RuleIndexInfo(len(self.keys), self.indexed_mappings, len(self.equality_fields), len(self.interval_fields))
+
+
+def iterate_bits(mask):
+    """ indices of the set bits, lowest first """
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
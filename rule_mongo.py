@@ -0,0 +1,200 @@
+"""
+Server side mapping assignment: an ordered mapping rule set (test.json) as one
+MongoDB aggregation pipeline.
+
+    positions
+    -> $lookup securities by isin
+    -> $project {"pos": position, "sec": first matched security}
+    -> $project {"_id", "mapping": $switch over the mappings in priority order}
+    -> $merge into the assignments collection
+
+Every rule is translated into an aggregation expression with the semantics of
+condition_evaluator. Where Python raises (e.g. None > 10, a number compared to a
+string) the expression is False instead, comparisons are guarded by type checks
+so BSON cross type ordering never decides a condition.
+
+Datetimes are compared part by part in UTC, which is how pymongo stores naive
+datetimes. Timedelta conditions use the cutoff as_of - td, as_of is fixed when the
+pipeline is built.
+"""
+from datetime import datetime
+
+from rule_widget import datetime_pattern, content_to_timedelta, COMPARISON_OPERATORS, TIMEDELTA_CUTOFF_OPERATORS
+
+MONGO_COMPARISONS = {"==": "$eq", "<": "$lt", "<=": "$lte", ">": "$gt", ">=": "$gte"}
+DATETIME_PART_OPERATORS = ("$year", "$month", "$dayOfMonth", "$hour", "$minute", "$second")
+
+
+def rule_to_expr(node, as_of):
+    """
+    :param node: rule AST
+    :param as_of: reference time for timedelta conditions
+    :return: aggregation expression, "db.field" is read from "$db.field"
+    """
+    if node["type"] == "condition":
+        return condition_to_expr(node, as_of)
+
+    elif node["type"] == "operator":
+        op = node["operator"]
+        args = [rule_to_expr(arg, as_of) for arg in node["args"]]
+
+        if op == "$AND":
+            return {"$and": args}
+        elif op == "$OR":
+            return {"$or": args}
+        elif op == "$NOT":
+            if len(args) != 1:
+                raise ValueError(f"$NOT expects exactly one argument, got {len(args)}")
+            return {"$not": args}
+        else:
+            raise ValueError(f"Unknown operator: {op}")
+
+    else:
+        raise ValueError(f"Unknown node type {node['type']}")
+
+
+def is_type(reference, *bson_types):
+    return {"$in": [{"$type": reference}, list(bson_types)]}
+
+
+def guarded(guard, expr):
+    """ expr is only evaluated if guard is True, $and does not guarantee that """
+    return {"$cond": [guard, expr, False]}
+
+
+def contains_substring(string, substring):
+    return {"$gte": [{"$indexOfCP": [string, substring]}, 0]}
+
+
+def condition_to_expr(condition, as_of):
+    reference = f"${condition['db']}.{condition['field']}"
+    op = condition.get("op")
+    value = condition.get("value")
+    value_type = value.get("type")
+
+    if value_type == "string":
+        content = {"$literal": value.get("content")}
+        if op == "==":
+            return {"$eq": [reference, content]}
+        elif op == "<>":
+            # substring of a string reference, element of an array reference
+            return {"$switch": {"branches": [
+                {"case": is_type(reference, "string"), "then": contains_substring(reference, content)},
+                {"case": {"$isArray": reference}, "then": {"$in": [content, reference]}},
+            ], "default": False}}
+        elif op == ":=":
+            return guarded(is_type(reference, "string"), contains_substring(content, reference))
+        else:
+            raise ValueError(f"String evaluation failed at: {condition}")
+
+    elif value_type == "number":
+        if op not in MONGO_COMPARISONS:
+            raise ValueError(f"Number evaluation failed at: {condition}")
+        return guarded({"$isNumber": reference}, {MONGO_COMPARISONS[op]: [reference, value.get("content")]})
+
+    elif value_type == "range":
+        if op != ":=":
+            raise ValueError(f"Range evaluation failed at: {condition}")
+        return guarded({"$isNumber": reference}, {"$and": [
+            {"$gte": [reference, float(value.get("low"))]},
+            {"$lte": [reference, float(value.get("high"))]},
+        ]})
+
+    elif value_type == "list":
+        content = {"$literal": list(value.get("content"))}
+        if op == ":=":
+            return {"$in": [reference, content]}
+        elif op == "<>":
+            branches = [{"case": {"$isArray": reference}, "then": {"$setIsSubset": [content, reference]}}]
+            if all(isinstance(elem, str) for elem in value.get("content")):
+                # a string reference has to contain every element as substring
+                substrings = [contains_substring(reference, {"$literal": elem}) for elem in value.get("content")]
+                branches.append({"case": is_type(reference, "string"), "then": {"$and": substrings}})
+            return {"$switch": {"branches": branches, "default": False}}
+        else:
+            raise ValueError(f"List evaluation failed at: {condition}")
+
+    elif value_type == "datetime":
+        if op not in MONGO_COMPARISONS:
+            raise ValueError(f"Datetime evaluation failed at: {condition}")
+        return datetime_to_expr(reference, op, value.get("content"))
+
+    elif value_type == "timedelta":
+        if op not in TIMEDELTA_CUTOFF_OPERATORS:
+            raise ValueError(f"Timedelta evaluation failed at: {condition}")
+        cutoff = as_of - content_to_timedelta(value.get("content"))
+        return guarded(is_type(reference, "date"),
+                       {MONGO_COMPARISONS[TIMEDELTA_CUTOFF_OPERATORS[op]]: [reference, cutoff]})
+
+    elif value_type == "bool":
+        return {"$eq": [reference, value.get("content")]}
+
+    else:
+        raise ValueError(f"Unknown value type: {value_type}")
+
+
+def datetime_to_expr(reference, op, content):
+    """
+    Same position by position comparison as compile_datetime_matcher: walking the fixed
+    parts from the last to the first, the reference is smaller if it is smaller at this
+    part or equal at this part and smaller afterwards.
+    """
+    mask, target = datetime_pattern(content)
+    if not mask:
+        # only wildcards, every datetime is equal to the pattern
+        return COMPARISON_OPERATORS[op]((), ())
+
+    parts = [({DATETIME_PART_OPERATORS[jj]: reference}, part_target) for jj, part_target in zip(mask, target)]
+    if op == "==":
+        return guarded(is_type(reference, "date"), {"$and": [{"$eq": [part, part_target]} for part, part_target in parts]})
+
+    expr = op in ("<=", ">=")
+    decides = "$lt" if op in ("<", "<=") else "$gt"
+    for part, part_target in reversed(parts):
+        expr = {"$or": [{decides: [part, part_target]}, {"$and": [{"$eq": [part, part_target]}, expr]}]}
+    return guarded(is_type(reference, "date"), expr)
+
+
+def mapping_switch(mapping_assignments, as_of):
+    """ $switch with the key of the first mapping whose rule_dicts are all True, None if no mapping matches """
+    branches = []
+    for key, mapping in mapping_assignments.items():
+        branches.append({
+            "case": {"$and": [rule_to_expr(rule, as_of) for rule in mapping.get("rule_dicts", [])]},
+            "then": {"$literal": key},
+        })
+    if not branches:
+        # like mapping_evaluator on an empty rule set, a bare None is not a valid $project value
+        return {"$literal": None}
+    return {"$switch": {"branches": branches, "default": None}}
+
+
+def mapping_pipeline(mapping_assignments, as_of=None, securities="securities", into="assignments",
+                     isin_field="isin"):
+    """
+    :param mapping_assignments: dict mapping_key -> {"label", "temp", "rule_dicts"}, in priority order
+    :param as_of: reference time for timedelta conditions, defaults to now
+    :param securities: collection the securities are looked up in
+    :param into: collection the assignments are merged into, None to return them instead
+    :param isin_field: field joining positions and securities
+    :return: aggregation pipeline for the positions collection
+    """
+    if as_of is None:
+        as_of = datetime.now()
+    pipeline = [
+        {"$lookup": {"from": securities, "localField": isin_field, "foreignField": isin_field, "as": "_securities"}},
+        {"$project": {"pos": "$$ROOT", "sec": {"$arrayElemAt": ["$_securities", 0]}}},
+        {"$project": {"_id": 1, "mapping": mapping_switch(mapping_assignments, as_of), "as_of": {"$literal": as_of}}},
+    ]
+    if into is not None:
+        pipeline.append({"$merge": {"into": into, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}})
+    return pipeline
+
+
+def assign_in_mongo(database, mapping_assignments, as_of=None, positions="positions", **kwargs):
+    """
+    Runs the mapping pipeline on the server, e.g. assign_in_mongo(MongoClient()["trading_data"], assigners).
+    With into=None the assignments are returned as list instead of merged.
+    """
+    pipeline = mapping_pipeline(mapping_assignments, as_of=as_of, **kwargs)
+    return list(database[positions].aggregate(pipeline))
@@ -0,0 +1,310 @@
+"""
+Decision network for an ordered, first-match mapping rule set (test.json).
+
+mapping_evaluator tries the mappings one by one, so the work per position grows with
+the number of mappings. Here the rule_dicts of all mappings are split into tests and
+compiled into a decision DAG:
+
+- a switch node reads one field and jumps on its value with a dict lookup, this
+  decides every ?db.field == literal? test on that field for all mappings at once
+- a test node evaluates any other condition or sub expression once
+
+At every state the next test is taken from the highest priority mapping that is still
+possible (it has to be decided before any later mapping can win) and among those the
+one shared by most remaining mappings is chosen. Equal states are built once, so the
+result is a DAG. Opaque tests can still multiply the states, once max_nodes states
+are built the remaining mappings of a state are checked one by one (SequentialNode).
+
+Same result as mapping_evaluator for every record that evaluates without an error.
+Which test raises for incomplete data (e.g. sec is None) can differ, because the tests
+run in a different order.
+"""
+from rule_widget import validate_tree, reconstruct_expression
+from rule_compiler import compile_node
+
+SWITCH_VALUE_TYPES = ("string", "number", "bool")
+
+
+class DecisionLeaf:
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+
+class SwitchNode:
+    __slots__ = ("db", "field", "branches", "default")
+
+    def __init__(self, db, field, branches, default):
+        self.db = db
+        self.field = field
+        # literal -> node, default for every other value
+        self.branches = branches
+        self.default = default
+
+    def children(self):
+        return list(self.branches.values()) + [self.default]
+
+
+class TestNode:
+    __slots__ = ("expression", "test", "if_true", "if_false")
+
+    def __init__(self, expression, test, if_true, if_false):
+        self.expression = expression
+        self.test = test
+        self.if_true = if_true
+        self.if_false = if_false
+
+    def children(self):
+        return [self.if_true, self.if_false]
+
+
+class SequentialNode:
+    """ fallback when the node budget is used up: the remaining candidates in order, like mapping_evaluator """
+    __slots__ = ("candidates",)
+
+    def __init__(self, candidates):
+        # (key, (compiled test, ...)) in priority order
+        self.candidates = candidates
+
+    def children(self):
+        return []
+
+
+def build_decision_network(mapping_assignments, schema=None, as_of=None, max_nodes=10000):
+    """
+    :param mapping_assignments: dict mapping_key -> {"label", "temp", "rule_dicts"}, in priority order
+    :param schema: valid fields dict, if given every rule is validated first
+    :param as_of: reference time for timedelta conditions, see compile_rule
+    :param max_nodes: number of states built before falling back to sequential checks
+    :return: DecisionNetwork
+    """
+    return DecisionNetwork(mapping_assignments, schema=schema, as_of=as_of, max_nodes=max_nodes)
+
+
+def split_rule(rule):
+    """ a rule_dict as list of and-connected parts, top level $AND nodes are flattened """
+    if rule["type"] == "operator" and rule["operator"] == "$AND":
+        parts = []
+        for arg in rule["args"]:
+            parts.extend(split_rule(arg))
+        return parts
+    return [rule]
+
+
+def is_switch_condition(node):
+    return (node["type"] == "condition" and node["op"] == "=="
+            and node["value"]["type"] in SWITCH_VALUE_TYPES)
+
+
+class DecisionNetwork:
+    """
+        network = build_decision_network(assigners, as_of=as_of)
+        key = network.assign({"sec": sec_data, "pos": position})
+        network.depth, network.node_count, network.expected_tests(records)
+    """
+    def __init__(self, mapping_assignments, schema=None, as_of=None, max_nodes=10000):
+        self.as_of = as_of
+        self.max_nodes = max_nodes
+        self.keys = []
+        # test id -> ("switch", (db, field), literal, condition) or ("test", expression, node)
+        self.tests = []
+        test_ids = {}
+        candidates = []
+
+        for key, mapping in mapping_assignments.items():
+            atoms = []
+            for rule in mapping.get("rule_dicts", []):
+                if schema is not None:
+                    validate_tree(rule, schema)
+                for part in split_rule(rule):
+                    if is_switch_condition(part):
+                        test = ("switch", (part["db"], part["field"]), part["value"]["content"], part)
+                        test_key = (test[0], test[1], type(test[2]).__name__, test[2])
+                    else:
+                        expression = reconstruct_expression(part)
+                        test_key = ("test", expression)
+                        test = ("test", expression, part)
+                    if test_key not in test_ids:
+                        test_ids[test_key] = len(self.tests)
+                        self.tests.append(test)
+                    if test_ids[test_key] not in atoms:
+                        atoms.append(test_ids[test_key])
+            candidates.append((len(self.keys), tuple(atoms)))
+            self.keys.append(key)
+
+        self.compiled = {}
+        self.states = {}
+        self.root = self.build(self.prune(candidates))
+        self.states = None
+
+    # ------------------------------------------------------------------
+    # construction
+    # ------------------------------------------------------------------
+    def prune(self, candidates):
+        """ candidates behind the first one without open tests can never win """
+        for jj, (index, atoms) in enumerate(candidates):
+            if not atoms:
+                return tuple(candidates[:jj + 1])
+        return tuple(candidates)
+
+    def build(self, candidates):
+        if candidates in self.states:
+            return self.states[candidates]
+
+        if not candidates:
+            node = DecisionLeaf(None)
+        elif not candidates[0][1]:
+            node = DecisionLeaf(self.keys[candidates[0][0]])
+        elif len(self.states) >= self.max_nodes:
+            node = SequentialNode(tuple(
+                (self.keys[index], tuple(self.compiled_test(atom) for atom in atoms)) for index, atoms in candidates))
+        else:
+            node = self.build_branch(candidates)
+
+        self.states[candidates] = node
+        return node
+
+    def build_branch(self, candidates):
+        test_id = self.choose_test(candidates)
+        test = self.tests[test_id]
+
+        if test[0] == "switch":
+            field = test[1]
+            resolved = [jj for jj, other in enumerate(self.tests) if other[0] == "switch" and other[1] == field]
+            branches = {}
+            for index, atoms in candidates:
+                for atom in atoms:
+                    if atom in resolved and self.tests[atom][2] not in branches:
+                        literal = self.tests[atom][2]
+                        branches[literal] = self.build(self.resolve(
+                            candidates, {jj: self.tests[jj][2] == literal for jj in resolved}))
+            default = self.build(self.resolve(candidates, {jj: False for jj in resolved}))
+            return SwitchNode(field[0], field[1], branches, default)
+
+        return TestNode(test[1], self.compiled_test(test_id),
+                        self.build(self.resolve(candidates, {test_id: True})),
+                        self.build(self.resolve(candidates, {test_id: False})))
+
+    def compiled_test(self, test_id):
+        if test_id not in self.compiled:
+            self.compiled[test_id] = compile_node(self.tests[test_id][-1], self.as_of)
+        return self.compiled[test_id]
+
+    def choose_test(self, candidates):
+        """ test of the first candidate shared by most candidates, a switch counts for its whole field """
+        def group(test_id):
+            test = self.tests[test_id]
+            return (test[0], test[1])
+
+        coverage = {}
+        for index, atoms in candidates:
+            for test_group in {group(atom) for atom in atoms}:
+                coverage[test_group] = coverage.get(test_group, 0) + 1
+
+        first_atoms = candidates[0][1]
+        # max keeps the first of equal coverage, i.e. the authored order of the first candidate
+        return max(first_atoms, key=lambda atom: coverage[group(atom)])
+
+    def resolve(self, candidates, outcomes):
+        remaining = []
+        for index, atoms in candidates:
+            if any(outcomes.get(atom) is False for atom in atoms):
+                continue
+            remaining.append((index, tuple(atom for atom in atoms if atom not in outcomes)))
+        return self.prune(remaining)
+
+    # ------------------------------------------------------------------
+    # evaluation
+    # ------------------------------------------------------------------
+    def trace(self, data):
+        """ (key of the first matching mapping or None, number of tests run) """
+        node = self.root
+        tests = 0
+        while not isinstance(node, DecisionLeaf):
+            if isinstance(node, SequentialNode):
+                for key, candidate_tests in node.candidates:
+                    for test in candidate_tests:
+                        tests += 1
+                        if not test(data):
+                            break
+                    else:
+                        return key, tests
+                return None, tests
+            tests += 1
+            if isinstance(node, SwitchNode):
+                value = data.get(node.db).get(node.field)
+                try:
+                    node = node.branches.get(value, node.default)
+                except TypeError:
+                    # unhashable values never equal a string, number or bool literal
+                    node = node.default
+            else:
+                node = node.if_true if node.test(data) else node.if_false
+        return node.key, tests
+
+    def assign(self, data):
+        return self.trace(data)[0]
+
+    # ------------------------------------------------------------------
+    # reporting
+    # ------------------------------------------------------------------
+    def nodes(self):
+        seen = {}
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen[id(node)] = node
+            if not isinstance(node, DecisionLeaf):
+                stack.extend(node.children())
+        return list(seen.values())
+
+    @property
+    def node_count(self):
+        return len(self.nodes())
+
+    @property
+    def depth(self):
+        """ maximal number of tests on a path from the root to a leaf """
+        depths = {}
+
+        def depth(node):
+            if isinstance(node, DecisionLeaf):
+                return 0
+            if isinstance(node, SequentialNode):
+                return sequential_tests(node)
+            if id(node) not in depths:
+                depths[id(node)] = 1 + max(depth(child) for child in node.children())
+            return depths[id(node)]
+        return depth(self.root)
+
+    def expected_tests(self, records=None):
+        """
+        Mean number of tests per record. Measured on records if given, otherwise
+        estimated with every branch of a node taken with the same probability and
+        all tests of a SequentialNode.
+        """
+        if records is not None:
+            records = list(records)
+            if not records:
+                return 0.0
+            return sum(self.trace(record)[1] for record in records) / len(records)
+
+        expected = {}
+
+        def estimate(node):
+            if isinstance(node, DecisionLeaf):
+                return 0.0
+            if isinstance(node, SequentialNode):
+                return float(sequential_tests(node))
+            if id(node) not in expected:
+                children = node.children()
+                expected[id(node)] = 1 + sum(estimate(child) for child in children) / len(children)
+            return expected[id(node)]
+        return estimate(self.root)
+
+
+def sequential_tests(node):
+    return sum(len(candidate_tests) for key, candidate_tests in node.candidates)
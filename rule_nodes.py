@@ -0,0 +1,283 @@
+"""
+Compact rule AST nodes.
+
+Parsed rules are nested dicts, the classes here hold the same data in __slots__ and
+evaluate with attribute access. They read like the dicts (node["type"], value.get("content")),
+so validate_tree, reconstruct_expression, compile_rule and the rule set builders accept them
+unchanged. to_dict/node_from_dict convert losslessly, test.json keeps the dict format.
+
+    rule = parse_rule('$AND(?sec.region == "DE"?, ?pos.remaining_quantity > 0?)', valid_fields)
+    rule.evaluate(data, as_of)
+    assigners = load_mappings(json.load(f))
+"""
+from datetime import datetime
+
+from rule_widget import (Parser, ConditionParser, logical_tokenize, tokenize_condition, validate_tree,
+                         COMPARISON_OPERATORS, TIMEDELTA_CUTOFF_OPERATORS, cached_datetime_matcher,
+                         cached_timedelta)
+
+
+class Node:
+    """ read only dict access on the slots, "type" is a class attribute """
+    __slots__ = ()
+    type = None
+    KEYS = ()
+
+    def __getitem__(self, key):
+        if key == "type":
+            return self.type
+        if key in self.KEYS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key == "type" or key in self.KEYS
+
+    def keys(self):
+        return ("type",) + self.KEYS
+
+    def __eq__(self, other):
+        if isinstance(other, (Node, dict)):
+            return self.to_dict() == (other.to_dict() if isinstance(other, Node) else other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{key}={getattr(self, key)!r}' for key in self.KEYS)})"
+
+
+# ----------------------------------------------------------------------
+# Values
+# ----------------------------------------------------------------------
+class Value(Node):
+    __slots__ = ("content",)
+    KEYS = ("content",)
+
+    def __init__(self, content):
+        self.content = content
+
+    def to_dict(self):
+        return {"type": self.type, "content": self.content}
+
+    def failed(self, op):
+        return ValueError(f"{self.type.capitalize()} evaluation failed, unknown operator: {op}")
+
+
+class StringValue(Value):
+    __slots__ = ()
+    type = "string"
+
+    def matches(self, op, reference, as_of=None):
+        if op == "==":
+            return reference == self.content
+        if op == "<>":
+            return self.content in reference
+        if op == ":=":
+            return reference in self.content
+        raise self.failed(op)
+
+
+class NumberValue(Value):
+    __slots__ = ()
+    type = "number"
+
+    def matches(self, op, reference, as_of=None):
+        if op not in COMPARISON_OPERATORS:
+            raise self.failed(op)
+        return COMPARISON_OPERATORS[op](reference, self.content)
+
+
+class BoolValue(Value):
+    __slots__ = ()
+    type = "bool"
+
+    def matches(self, op, reference, as_of=None):
+        return self.content == reference
+
+
+class DatetimeValue(Value):
+    __slots__ = ()
+    type = "datetime"
+
+    def matches(self, op, reference, as_of=None):
+        return cached_datetime_matcher(tuple(self.content), op)(reference)
+
+
+class TimedeltaValue(Value):
+    __slots__ = ()
+    type = "timedelta"
+
+    def matches(self, op, reference, as_of=None):
+        if op not in TIMEDELTA_CUTOFF_OPERATORS:
+            raise self.failed(op)
+        if as_of is None:
+            as_of = datetime.now()
+        cutoff = as_of - cached_timedelta(tuple(self.content))
+        return COMPARISON_OPERATORS[TIMEDELTA_CUTOFF_OPERATORS[op]](reference, cutoff)
+
+
+class ListValue(Value):
+    __slots__ = ("value_type",)
+    type = "list"
+
+    def __init__(self, content, value_type=None):
+        self.content = content
+        self.value_type = value_type
+
+    @property
+    def KEYS(self):
+        # rules saved before value_type was added have only the content
+        return ("content",) if self.value_type is None else ("value_type", "content")
+
+    def to_dict(self):
+        if self.value_type is None:
+            return {"type": self.type, "content": self.content}
+        return {"type": self.type, "value_type": self.value_type, "content": self.content}
+
+    def matches(self, op, reference, as_of=None):
+        if op == ":=":
+            return reference in self.content
+        if op == "<>":
+            return all(elem in reference for elem in self.content)
+        raise self.failed(op)
+
+
+class RangeValue(Value):
+    __slots__ = ("low", "high")
+    type = "range"
+    KEYS = ("low", "high")
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def to_dict(self):
+        return {"type": self.type, "low": self.low, "high": self.high}
+
+    def matches(self, op, reference, as_of=None):
+        if op != ":=":
+            raise self.failed(op)
+        return float(self.low) <= reference <= float(self.high)
+
+
+VALUE_CLASSES = {cls.type: cls for cls in (StringValue, NumberValue, BoolValue, DatetimeValue, TimedeltaValue)}
+
+
+def value_from_dict(value):
+    if isinstance(value, Value):
+        return value
+    if not isinstance(value, dict):
+        raise ValueError(f"Unknown value: {value!r}")
+    value_type = value.get("type")
+    if value_type == "list":
+        return ListValue(value["content"], value.get("value_type"))
+    if value_type == "range":
+        return RangeValue(value["low"], value["high"])
+    if value_type not in VALUE_CLASSES:
+        raise ValueError(f"Unknown value type: {value_type}")
+    return VALUE_CLASSES[value_type](value.get("content"))
+
+
+# ----------------------------------------------------------------------
+# Nodes
+# ----------------------------------------------------------------------
+class ConditionNode(Node):
+    __slots__ = ("db", "field", "op", "value")
+    type = "condition"
+    KEYS = ("db", "field", "op", "value")
+
+    def __init__(self, db, field, op, value):
+        self.db = db
+        self.field = field
+        self.op = op
+        self.value = value_from_dict(value)
+
+    def to_dict(self):
+        return {"type": self.type, "db": self.db, "field": self.field, "op": self.op, "value": self.value.to_dict()}
+
+    def evaluate(self, data, as_of=None):
+        return self.value.matches(self.op, data.get(self.db).get(self.field), as_of)
+
+
+class OperatorNode(Node):
+    __slots__ = ("operator", "args")
+    type = "operator"
+    KEYS = ("operator", "args")
+
+    def __init__(self, operator, args):
+        if operator not in ("$AND", "$OR", "$NOT"):
+            raise ValueError(f"Unknown operator: {operator}")
+        if operator == "$NOT" and len(args) != 1:
+            raise ValueError(f"$NOT expects exactly one argument, got {len(args)}")
+        self.operator = operator
+        self.args = args
+
+    def to_dict(self):
+        return {"type": self.type, "operator": self.operator, "args": [arg.to_dict() for arg in self.args]}
+
+    def evaluate(self, data, as_of=None):
+        if self.operator == "$NOT":
+            return not self.args[0].evaluate(data, as_of)
+        # $AND is decided by the first False, $OR by the first True
+        deciding = self.operator == "$OR"
+        for arg in self.args:
+            if bool(arg.evaluate(data, as_of)) == deciding:
+                return deciding
+        return not deciding
+
+
+def node_from_dict(tree):
+    """ rule dict (as parsed or loaded from json) -> OperatorNode/ConditionNode """
+    if isinstance(tree, Node):
+        return tree
+    if tree["type"] == "operator":
+        return OperatorNode(tree["operator"], [node_from_dict(arg) for arg in tree["args"]])
+    if tree["type"] == "condition":
+        return ConditionNode(tree["db"], tree["field"], tree["op"], tree["value"])
+    raise ValueError(f"Unknown node type {tree['type']}")
+
+
+def node_to_dict(tree):
+    return tree.to_dict() if isinstance(tree, Node) else tree
+
+
+# ----------------------------------------------------------------------
+# Parsing
+# ----------------------------------------------------------------------
+class NodeConditionParser(ConditionParser):
+    def condition_node(self, db, field, op, value):
+        return ConditionNode(db, field, op, value)
+
+
+class NodeParser(Parser):
+    def condition_node(self, text):
+        return NodeConditionParser(tokenize_condition(text)).parse()
+
+    def operator_node(self, op, args):
+        return OperatorNode(op, args)
+
+
+def parse_rule(input_string: str, valid_fields: dict):
+    """ process_input_string, but the rule is built from nodes """
+    ast = NodeParser(logical_tokenize(input_string)).parse_expression()
+    validate_tree(ast, valid_fields)
+    return ast
+
+
+def load_mappings(mapping_assignments):
+    """ mapping rule set (test.json format) with the rule_dicts converted to nodes """
+    return {key: dict(mapping, rule_dicts=[node_from_dict(rule) for rule in mapping.get("rule_dicts", [])])
+            for key, mapping in mapping_assignments.items()}
+
+
+def dump_mappings(mapping_assignments):
+    """ inverse of load_mappings, json serialisable """
+    return {key: dict(mapping, rule_dicts=[node_to_dict(rule) for rule in mapping.get("rule_dicts", [])])
+            for key, mapping in mapping_assignments.items()}
@@ -0,0 +1,263 @@
+"""
+Binary snapshots of a mapping rule set (test.json format) for fast startup.
+
+compile_ruleset parses and validates the json once and writes a versioned artifact:
+a header (magic, version, python and marshal version, sha256 of the source json,
+sha256 of the valid_fields the rules were validated against, sha256 of the payload)
+and a marshal payload with a string table, a flat node array (children before
+parents), the value literals and the reconstructed expression of every rule.
+load_snapshot rebuilds the rules as rule_nodes without json parsing or validation.
+The snapshot is written to a temporary file and renamed, readers never see a
+partial file.
+
+    compile_ruleset("test.json", "test.rules", valid_fields)
+    snapshot = load_snapshot("test.rules", source="test.json", valid_fields=valid_fields)  # ValueError if stale
+    rule_set = build_rule_set(snapshot.mappings, as_of=as_of)
+
+load_ruleset("test.json", valid_fields) does both, it recompiles when the snapshot is
+missing or stale, also when it was not validated against the same valid_fields or
+was written by another python (the marshal format is version specific).
+"""
+import gc
+import hashlib
+import json
+import marshal
+import os
+import struct
+import sys
+import tempfile
+
+from rule_widget import validate_tree, reconstruct_expression
+from rule_nodes import (node_from_dict, OperatorNode, ConditionNode, StringValue, NumberValue, BoolValue,
+                        DatetimeValue, TimedeltaValue, ListValue, RangeValue)
+
+MAGIC = b"PTRS"
+VERSION = 3
+# magic, version, python major, python minor, marshal version, source sha256, valid_fields sha256,
+# payload sha256, payload length
+HEADER = struct.Struct("<4sHBBH32s32s32sQ")
+PYTHON_VERSION = sys.version_info[:2]
+# valid_fields sha256 of a snapshot compiled without validation
+NOT_VALIDATED = bytes(32)
+SNAPSHOT_SUFFIX = ".rules"
+
+OPERATOR_NODE = 0
+CONDITION_NODE = 1
+VALUE_TYPES = ("string", "number", "bool", "datetime", "timedelta", "list", "range")
+
+
+class RuleSetSnapshot:
+    def __init__(self, mappings, expressions, source_sha256):
+        # mapping rule set with the rule_dicts as nodes
+        self.mappings = mappings
+        # mapping_key -> reconstructed expression of every rule
+        self.expressions = expressions
+        self.source_sha256 = source_sha256
+
+    def __repr__(self):
+        return f"RuleSetSnapshot(mappings={len(self.mappings)}, source_sha256={self.source_sha256.hex()[:12]})"
+
+
+def snapshot_path(path):
+    return os.path.splitext(path)[0] + SNAPSHOT_SUFFIX
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+def fields_sha256(valid_fields):
+    if valid_fields is None:
+        return NOT_VALIDATED
+    return hashlib.sha256(json.dumps(sorted(valid_fields.items()), default=str).encode("utf-8")).digest()
+
+
+class SnapshotWriter:
+    def __init__(self):
+        self.strings = []
+        self.string_index = {}
+        self.nodes = []
+
+    def string(self, text):
+        if text not in self.string_index:
+            self.string_index[text] = len(self.strings)
+            self.strings.append(text)
+        return self.string_index[text]
+
+    def value(self, value):
+        value_type = value.type
+        if value_type == "range":
+            return (VALUE_TYPES.index(value_type), value.low, value.high)
+        if value_type == "list":
+            value_type_index = None if value.value_type is None else self.string(value.value_type)
+            return (VALUE_TYPES.index(value_type), value.content, value_type_index)
+        if value_type in ("datetime", "timedelta"):
+            # as tuple, the key of the cached matchers
+            return (VALUE_TYPES.index(value_type), tuple(value.content), None)
+        return (VALUE_TYPES.index(value_type), value.content, None)
+
+    def node(self, node):
+        """ appends the node after its children, returns its index """
+        if node.type == "operator":
+            args = tuple(self.node(arg) for arg in node.args)
+            entry = (OPERATOR_NODE, self.string(node.operator), args)
+        else:
+            entry = (CONDITION_NODE, self.string(node.db), self.string(node.field), self.string(node.op),
+                     self.value(node.value))
+        self.nodes.append(entry)
+        return len(self.nodes) - 1
+
+
+def compile_ruleset(path, output=None, valid_fields=None):
+    """
+    Parses the mapping rule set at path and writes its snapshot.
+
+    :param path: rule set json (test.json format)
+    :param output: snapshot file, defaults to path with the .rules suffix
+    :param valid_fields: if given every rule is validated against it, ValueError on the first invalid rule
+    :return: the RuleSetSnapshot
+    """
+    with open(path, "rb") as f:
+        source = f.read()
+    mapping_assignments = json.loads(source.decode("utf-8"))
+
+    writer = SnapshotWriter()
+    mappings = []
+    for key, mapping in mapping_assignments.items():
+        roots = []
+        expressions = []
+        for rule in mapping.get("rule_dicts", []):
+            if valid_fields is not None:
+                validate_tree(rule, valid_fields)
+            roots.append(writer.node(node_from_dict(rule)))
+            expressions.append(writer.string(reconstruct_expression(rule)))
+        # rule_dicts keeps its position among the other keys
+        meta = {name: None if name == "rule_dicts" else value for name, value in mapping.items()}
+        mappings.append((writer.string(key), meta, tuple(roots), tuple(expressions)))
+
+    payload = marshal.dumps((writer.strings, writer.nodes, mappings))
+    source_sha256 = hashlib.sha256(source).digest()
+    output = output if output is not None else snapshot_path(path)
+    header = HEADER.pack(MAGIC, VERSION, *PYTHON_VERSION, marshal.version, source_sha256, fields_sha256(valid_fields),
+                         hashlib.sha256(payload).digest(), len(payload))
+    write_atomic(output, header + payload)
+    return decode_payload(payload, source_sha256)
+
+
+def write_atomic(path, data):
+    """ writes a temporary file next to path and renames it, a concurrent reader sees the old or the new file """
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                             prefix=os.path.basename(path), suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def read_header(data):
+    if len(data) < HEADER.size:
+        raise ValueError("Not a rule set snapshot: file too short")
+    (magic, version, major, minor, marshal_version, source_sha256, valid_fields_sha256, payload_sha256,
+     length) = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a rule set snapshot: wrong magic")
+    if version != VERSION:
+        raise ValueError(f"Unsupported rule set snapshot version {version}, expected {VERSION}")
+    if (major, minor) != PYTHON_VERSION or marshal_version != marshal.version:
+        raise ValueError(f"Rule set snapshot is stale, written by python {major}.{minor} (marshal {marshal_version})")
+    if len(data) - HEADER.size != length:
+        raise ValueError("Rule set snapshot is truncated")
+    return source_sha256, valid_fields_sha256, payload_sha256
+
+
+def load_snapshot(path, source=None, valid_fields=None):
+    """
+    Loads a snapshot written by compile_ruleset.
+
+    :param source: rule set json the snapshot was compiled from, ValueError if it changed since
+    :param valid_fields: ValueError if the snapshot was not validated against these valid_fields
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    source_sha256, valid_fields_sha256, payload_sha256 = read_header(data)
+    payload = memoryview(data)[HEADER.size:]
+    if hashlib.sha256(payload).digest() != payload_sha256:
+        raise ValueError("Rule set snapshot is corrupt: payload hash mismatch")
+    if source is not None and file_sha256(source) != source_sha256:
+        raise ValueError(f"Rule set snapshot {path} is stale, {source} changed")
+    if valid_fields is not None and fields_sha256(valid_fields) != valid_fields_sha256:
+        raise ValueError(f"Rule set snapshot {path} is stale, it was validated against other valid_fields")
+    return decode_payload(payload, source_sha256)
+
+
+VALUE_CLASSES = (StringValue, NumberValue, BoolValue, DatetimeValue, TimedeltaValue)
+
+
+def decode_value(entry, strings):
+    value_type, content, extra = entry
+    if value_type < len(VALUE_CLASSES):
+        value = object.__new__(VALUE_CLASSES[value_type])
+        # datetime and timedelta contents are stored as tuples, the ast has lists
+        value.content = list(content) if isinstance(content, tuple) else content
+        return value
+    if VALUE_TYPES[value_type] == "list":
+        return ListValue(content, None if extra is None else strings[extra])
+    return RangeValue(content, extra)
+
+
+def decode_nodes(entries, strings):
+    # the entries were checked by the node constructors at compile time, slots are set directly
+    new = object.__new__
+    nodes = []
+    append = nodes.append
+    for entry in entries:
+        if entry[0] == CONDITION_NODE:
+            node = new(ConditionNode)
+            node.db = strings[entry[1]]
+            node.field = strings[entry[2]]
+            node.op = strings[entry[3]]
+            node.value = decode_value(entry[4], strings)
+        else:
+            node = new(OperatorNode)
+            node.operator = strings[entry[1]]
+            node.args = [nodes[arg] for arg in entry[2]]
+        append(node)
+    return nodes
+
+
+def decode_payload(payload, source_sha256):
+    strings, entries, mappings = marshal.loads(payload)
+    strings = [sys.intern(text) for text in strings]
+    # thousands of small objects, one collection afterwards instead of many during the build
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        nodes = decode_nodes(entries, strings)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    mapping_assignments = {}
+    expressions = {}
+    for key, meta, roots, rule_expressions in mappings:
+        key = strings[key]
+        mapping = mapping_assignments[key] = meta
+        if "rule_dicts" in meta:
+            mapping["rule_dicts"] = [nodes[root] for root in roots]
+        expressions[key] = [strings[expression] for expression in rule_expressions]
+    return RuleSetSnapshot(mapping_assignments, expressions, source_sha256)
+
+
+def load_ruleset(path, valid_fields=None):
+    """ snapshot of the rule set json at path, compiled (again) if the snapshot is missing, stale or unreadable """
+    output = snapshot_path(path)
+    if os.path.exists(output):
+        try:
+            return load_snapshot(output, source=path, valid_fields=valid_fields)
+        except (ValueError, EOFError, TypeError):
+            pass
+    return compile_ruleset(path, output, valid_fields)
@@ -0,0 +1,137 @@
+"""
+Structured tracing with named categories, replaces the debug print calls.
+
+A category is disabled by default. Call sites check the enabled flag before they
+build anything, so a disabled trace costs one attribute lookup:
+
+    TRACE_VALIDATE = trace_category("validate")
+    ...
+    if TRACE_VALIDATE.enabled:
+        TRACE_VALIDATE.emit("condition", node=node)
+
+Enabled categories emit records {"ts", "category", "event", **fields} to a sink:
+a RingBuffer (default, the last records in memory) or a JsonlSink (one JSON line per
+record). Enable in code with enable("validate", sink=JsonlSink("trace.jsonl")) or from
+the environment, e.g. PROCESS_TOOL_TRACE=validate,evaluate and optionally
+PROCESS_TOOL_TRACE_FILE=trace.jsonl ("*" enables every category).
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+TRACE_ENV = "PROCESS_TOOL_TRACE"
+TRACE_FILE_ENV = "PROCESS_TOOL_TRACE_FILE"
+
+
+class RingBuffer:
+    """ keeps the last maxlen records, records are stored as emitted (not copied) """
+    def __init__(self, maxlen=10000):
+        self.records = deque(maxlen=maxlen)
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def __iter__(self):
+        return iter(list(self.records))
+
+    def __len__(self):
+        return len(self.records)
+
+    def clear(self):
+        self.records.clear()
+
+
+class JsonlSink:
+    """ appends every record as one JSON line, values JSON does not know are written with str() """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def __call__(self, record):
+        line = json.dumps(record, default=str, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class TraceCategory:
+    __slots__ = ("name", "enabled", "sink")
+
+    def __init__(self, name):
+        self.name = name
+        self.enabled = False
+        self.sink = None
+
+    def emit(self, event, **fields):
+        record = {"ts": time.time(), "category": self.name, "event": event}
+        record.update(fields)
+        self.sink(record)
+
+    def __repr__(self):
+        return f"TraceCategory({self.name!r}, enabled={self.enabled})"
+
+
+categories = {}
+default_sink = RingBuffer()
+# names enabled with "*" or before the category was created
+pending = {}
+
+
+def trace_category(name):
+    """ the category with this name, created (disabled) on first use """
+    if name not in categories:
+        category = TraceCategory(name)
+        categories[name] = category
+        sink = pending.get(name, pending.get("*"))
+        if sink is not None:
+            category.sink = sink
+            category.enabled = True
+    return categories[name]
+
+
+def enable(*names, sink=None):
+    """ enables the categories ("*" for all, also the ones created later), returns the sink """
+    sink = sink if sink is not None else default_sink
+    for name in names:
+        if name == "*":
+            pending["*"] = sink
+            for category in categories.values():
+                category.sink = sink
+                category.enabled = True
+            continue
+        pending[name] = sink
+        category = trace_category(name)
+        category.sink = sink
+        category.enabled = True
+    return sink
+
+
+def disable(*names):
+    """ disables the categories, without names every category """
+    if not names or "*" in names:
+        pending.clear()
+        names = list(categories)
+    for name in names:
+        pending.pop(name, None)
+        if name in categories:
+            categories[name].enabled = False
+            categories[name].sink = None
+
+
+def configure_from_env(environ=None):
+    environ = os.environ if environ is None else environ
+    names = [name.strip() for name in environ.get(TRACE_ENV, "").split(",") if name.strip()]
+    if not names:
+        return None
+    path = environ.get(TRACE_FILE_ENV)
+    return enable(*names, sink=JsonlSink(path) if path else None)
+
+
+configure_from_env()
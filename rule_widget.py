@@ -1,9 +1,21 @@
 import re
+import functools
+import operator
+import threading
 import pydantic
 
+from collections import OrderedDict, namedtuple
+
 from pydantic import BaseModel
 import typing
 from datetime import datetime, timedelta
+
+from rule_trace import trace_category
+from schema_registry import resolve_type, model_schema, field_spec
+
+TRACE_VALIDATE = trace_category("validate")
+TRACE_EVALUATE = trace_category("evaluate")
+
 test_string = "$OR($AND(?security.region == \"CA\"?, ?research.last_trade == (*,*,*,8,*,*)?),?security.price := /2,4/?, ?research.last_trade>{0,0,0,0,5,0}?)"
 
 test_data = {
@@ -31,49 +43,38 @@ schema = {
 }
 
 
+# single pass lexer for the logical layer: $AND/$OR/$NOT, parentheses, commas and ?conditions?
+LOGICAL_TOKEN = re.compile(
+    r"\s+"
+    r"|(?P<OPERATOR>\$(?:NOT|AND|OR))"
+    r"|(?P<LPAREN>\()"
+    r"|(?P<RPAREN>\))"
+    r"|(?P<COMMA>,)"
+    r"|\?(?P<CONDITION>[^?]*)\?"
+)
+
+
 def logical_tokenize(input_str):
     tokens = []
     pos = 0
     length = len(input_str)
+    match = LOGICAL_TOKEN.match
 
     while pos < length:
-        # Skip whitespace
-        if input_str[pos].isspace():
-            pos += 1
-            continue
-
-        # Logical operators
-        for op in LOGICAL_OPERATORS:
-            if input_str.startswith(op, pos):
-                tokens.append(('OPERATOR', op))
-                pos += len(op)
-                break
-        else:
-            if input_str[pos] == '(':
-                tokens.append(('LPAREN', '('))
-                pos += 1
-                continue
-            if input_str[pos] == ')':
-                tokens.append(('RPAREN', ')'))
-                pos += 1
-                continue
-            if input_str[pos] == ',':
-                tokens.append(('COMMA', ','))
-                pos += 1
-                continue
-
-            # Condition delimited by '?'
+        m = match(input_str, pos)
+        if m is None:
             if input_str[pos] == '?':
-                end_pos = input_str.find('?', pos + 1)
-                if end_pos == -1:
-                    raise SyntaxError("Unterminated condition (missing closing '?')")
-                cond = input_str[pos+1:end_pos].strip()
-                tokens.append(('CONDITION', cond))
-                pos = end_pos + 1
-                continue
-
+                raise SyntaxError("Unterminated condition (missing closing '?')")
             raise SyntaxError(f"Unexpected character {input_str[pos]} at position {pos}")
 
+        token_type = m.lastgroup
+        if token_type == 'CONDITION':
+            tokens.append(('CONDITION', m.group('CONDITION').strip()))
+        elif token_type is not None:
+            # None is whitespace
+            tokens.append((token_type, m.group(token_type)))
+        pos = m.end()
+
     return tokens
 
 
@@ -104,10 +105,21 @@ class Parser:
             return self.parse_operator_expression()
         elif token_type == 'CONDITION':
             self.advance()
-            return {"type": "condition", "value": token_value}
+            return self.condition_node(token_value)
         else:
             raise SyntaxError(f"Unexpected token {token_type} at position {self.pos}")
 
+    def condition_node(self, text):
+        # the condition text is parsed later by integrate_condition_tokenizer
+        return {"type": "condition", "value": text}
+
+    def operator_node(self, op, args):
+        return {
+            "type": "operator",
+            "operator": op,
+            "args": args
+        }
+
     def parse_operator_expression(self):
         op = self.expect('OPERATOR')
         self.expect('LPAREN')
@@ -126,11 +138,154 @@ class Parser:
         if op == '$NOT' and len(args) != 1:
             raise SyntaxError(f"$NOT operator expects exactly one argument, got {len(args)}")
 
-        return {
-            "type": "operator",
-            "operator": op,
-            "args": args
-        }
+        return self.operator_node(op, args)
+
+
+# -------------------------------------------------
+# Condition lexer
+# Every token type is recognised by its first character, so the lexer looks up a
+# handler in CONDITION_DISPATCH and the handler consumes the whole token with one
+# precompiled regex. Lists are matched and split in C, there is no size cap.
+# -------------------------------------------------
+# the separators are required, (?:[\d-]+,?)* can split a run of digits in exponentially
+# many ways and backtracks for seconds on an unclosed literal
+TIMEDELTA_TOKEN = re.compile(r"\{((?:[\d-]+(?:,[\d-]+)*,?)?)\}")
+DATETIME_TOKEN = re.compile(r"\(((?:[\d*-]+(?:,[\d*-]+)*,?)?)\)")
+RANGE_TOKEN = re.compile(r"/([\d-]*),([\d-]*)/")
+STRING_LIST_TOKEN = re.compile(r'\[((?:"[^"\\]*(?:\\[\s\S][^"\\]*)*",?)*)\]')
+NUMBER_LIST_TOKEN = re.compile(r"\[((?:[\d-]+(?:,[\d-]+)*,?)?)\]")
+STRING_TOKEN = re.compile(r'"([^"\\]*(?:\\[\s\S][^"\\]*)*)"')
+NUMBER_TOKEN = re.compile(r"(?=\d|-[\d.]|\.\d)-?\d*(?:\.\d*)?")
+OP_TOKEN = re.compile(r"<=|>=|==|<>|:=|<|>")
+BOOL_TOKEN = re.compile(r"(?i:TRUE|FALSE)")
+FIELD_TOKEN = re.compile(r"[^\W\d]\w*\.[^\W\d]\w*")
+IDENTIFIER_TOKEN = re.compile(r"[^\W\d]\w*")
+WHITESPACE_TOKEN = re.compile(r"\s+")
+
+NUMBER_PART = re.compile(r"[\d-]+")
+DATETIME_PART = re.compile(r"\*|[\d-]+")
+
+
+def _lex_timedelta(cond, i, tokens):
+    m = TIMEDELTA_TOKEN.match(cond, i)
+    parts = NUMBER_PART.findall(m.group(1)) if m else []
+    if len(parts) != 6:
+        raise SyntaxError("Invalid timedelta format, expected 6 comma-separated integers in {}")
+    tokens.append(("TIMEDELTA", parts))
+    return m.end()
+
+
+def _lex_datetime(cond, i, tokens):
+    m = DATETIME_TOKEN.match(cond, i)
+    parts = DATETIME_PART.findall(m.group(1)) if m else []
+    if len(parts) != 6:
+        raise SyntaxError("Invalid datetime format, expected 6 items in ()")
+    tokens.append(("DATETIME", parts))
+    return m.end()
+
+
+def _lex_range(cond, i, tokens):
+    m = RANGE_TOKEN.match(cond, i)
+    if m is None:
+        raise SyntaxError("Invalid range format, expected /low,high/")
+    tokens.append(("RANGE", (m.group(1), m.group(2))))
+    return m.end()
+
+
+def _lex_list(cond, i, tokens):
+    if cond.startswith('"', i + 1):
+        m = STRING_LIST_TOKEN.match(cond, i)
+        if m is None:
+            raise SyntaxError("Invalid string list, expected [\"A\",\"B\"]")
+        tokens.append(("STRING_LIST", STRING_TOKEN.findall(m.group(1))))
+    else:
+        m = NUMBER_LIST_TOKEN.match(cond, i)
+        if m is None:
+            raise SyntaxError("Invalid number list, expected [1,2,3]")
+        tokens.append(("NUMBER_LIST", NUMBER_PART.findall(m.group(1))))
+    return m.end()
+
+
+def _lex_string(cond, i, tokens):
+    m = STRING_TOKEN.match(cond, i)
+    if m is None:
+        raise SyntaxError("Unterminated string literal")
+    tokens.append(("STRING", m.group(1)))  # drop the quotes
+    return m.end()
+
+
+def _lex_number(cond, i, tokens):
+    m = NUMBER_TOKEN.match(cond, i)
+    if m is None:
+        raise SyntaxError(f"Unexpected character '{cond[i]}' at position {i}")
+    tokens.append(("NUMBER", m.group()))
+    return m.end()
+
+
+def _lex_op(cond, i, tokens):
+    m = OP_TOKEN.match(cond, i)
+    if m is None:
+        raise SyntaxError(f"Unexpected character '{cond[i]}' at position {i}")
+    tokens.append(("OP", m.group()))
+    return m.end()
+
+
+def _lex_word(cond, i, tokens):
+    # TRUE/FALSE (case-insensitive) take precedence over database.field
+    m = BOOL_TOKEN.match(cond, i)
+    if m is not None:
+        tokens.append(("BOOL", m.group().upper() == "TRUE"))
+        return m.end()
+
+    m = FIELD_TOKEN.match(cond, i)
+    if m is not None:
+        tokens.append(("FIELD", m.group()))
+        return m.end()
+
+    end = IDENTIFIER_TOKEN.match(cond, i).end()
+    if cond.startswith(".", end):
+        raise SyntaxError("Invalid field name after dot")
+    raise SyntaxError("Expected '.' in database.field")
+
+
+def _lex_single(token_type):
+    def lex(cond, i, tokens):
+        tokens.append((token_type, cond[i]))
+        return i + 1
+    return lex
+
+
+def _lex_whitespace(cond, i, tokens):
+    return WHITESPACE_TOKEN.match(cond, i).end()
+
+
+CONDITION_DISPATCH = {
+    "{": _lex_timedelta,
+    "(": _lex_datetime,
+    "/": _lex_range,
+    "[": _lex_list,
+    '"': _lex_string,
+    "-": _lex_number,
+    ".": _lex_number,
+    "<": _lex_op,
+    ">": _lex_op,
+    "=": _lex_op,
+    ":": _lex_op,
+    "*": _lex_single("STAR"),
+    ",": _lex_single("COMMA"),
+    ")": _lex_single("RPAREN"),
+}
+
+
+def _lex_fallback(cond, i, tokens):
+    char = cond[i]
+    if char.isspace():
+        return _lex_whitespace(cond, i, tokens)
+    if char.isdigit():
+        return _lex_number(cond, i, tokens)
+    if char.isalpha() or char == "_":
+        return _lex_word(cond, i, tokens)
+    raise SyntaxError(f"Unexpected character '{char}' at position {i}")
 
 
 def tokenize_condition(cond: str):
@@ -144,279 +299,10 @@ def tokenize_condition(cond: str):
     tokens = []
     i = 0
     n = len(cond)
+    dispatch = CONDITION_DISPATCH.get
 
     while i < n:
-
-        # 0. Handle whitespace as before
-        if cond[i].isspace():
-            i += 1
-            continue
-
-        # -------------------------------------------------
-        # 1. Timedelta: {1,2,3,4,5,6}
-        # -------------------------------------------------
-        if cond[i] == '{':
-            j = i + 1
-            parts = []
-            max_iter = 1000
-            count = 0
-            while j < n and cond[j] != '}':
-                count += 1
-                if count > max_iter:
-                    raise SyntaxError("Too many iterations while parsing timedelta, possible malformed input")
-
-                start = j
-                while j < n and (cond[j].isdigit() or cond[j] == '-'):
-                    j += 1
-                if j == start:
-                    raise SyntaxError("Expected number inside timedelta")
-                parts.append(cond[start:j])
-                if j < n and cond[j] == ',':
-                    j += 1
-            if len(parts) != 6 or j >= n or cond[j] != '}':
-                raise SyntaxError("Invalid timedelta format, expected 6 comma-separated integers in {}")
-            tokens.append(("TIMEDELTA", parts))
-            i = j + 1
-            continue
-
-        # -------------------------------------------------
-        # 2. Datetime: (YYYY,M,D,H,M,S) or with *
-        # -------------------------------------------------
-        if cond[i] == '(':
-            j = i + 1
-            parts = []
-            max_iter = 1000
-            count = 0
-            while j < n and cond[j] != ')':
-                count += 1
-                if count > max_iter:
-                    raise SyntaxError("Too many iterations while parsing datetime, possible malformed input")
-
-                # allow numbers or '*'
-                if cond[j] == '*':
-                    parts.append('*')
-                    j += 1
-                else:
-                    start = j
-                    while j < n and (cond[j].isdigit() or cond[j] == '-'):
-                        j += 1
-                    if j == start:
-                        raise SyntaxError("Expected number or '*' inside datetime")
-                    parts.append(cond[start:j])
-                if j < n and cond[j] == ',':
-                    j += 1
-            if len(parts) != 6 or j >= n or cond[j] != ')':
-                raise SyntaxError("Invalid datetime format, expected 6 items in ()")
-            tokens.append(("DATETIME", parts))
-            i = j + 1
-            continue
-
-        # -------------------------------------------------
-        # 3. Range: /-2,6/
-        # -------------------------------------------------
-        if cond[i] == '/':
-            j = i + 1
-            max_iter = 1000
-            count = 0
-
-            start = j
-            while j < n and (cond[j].isdigit() or cond[j] == '-'):
-                j += 1
-                count += 1
-                if count > max_iter:
-                    raise SyntaxError("Too many iterations while parsing range low bound")
-            low = cond[start:j]
-
-            if j >= n or cond[j] != ',':
-                raise SyntaxError("Expected comma in range")
-            j += 1
-
-            start = j
-            count = 0
-            while j < n and (cond[j].isdigit() or cond[j] == '-'):
-                j += 1
-                count += 1
-                if count > max_iter:
-                    raise SyntaxError("Too many iterations while parsing range high bound")
-            high = cond[start:j]
-
-            if j >= n or cond[j] != '/':
-                raise SyntaxError("Expected closing '/' in range")
-            tokens.append(("RANGE", (low, high)))
-            i = j + 1
-            continue
-
-        # -------------------------------------------------
-        # 4. List: [1,2,3] or ["A","B"]
-        # -------------------------------------------------
-        if cond[i] == '[':
-            j = i + 1
-            parts = []
-            max_iter = 10000  # more items possible
-            count = 0
-
-            in_string = cond[j] == '"'
-
-            while j < n and cond[j] != ']':
-                count += 1
-                if count > max_iter:
-                    raise SyntaxError("Too many iterations while parsing list, possible malformed input")
-
-                if in_string:
-                    if cond[j] != '"':
-                        raise SyntaxError("Expected string literal")
-                    start = j + 1
-                    j = start
-                    while j < n and cond[j] != '"':
-                        if cond[j] == '\\' and j + 1 < n:
-                            j += 2
-                        else:
-                            j += 1
-                    if j >= n:
-                        raise SyntaxError("Unterminated string in list")
-                    parts.append(cond[start:j])
-                    j += 1  # skip closing quote
-                else:
-                    start = j
-                    while j < n and (cond[j].isdigit() or cond[j] == '-'):
-                        j += 1
-                    if j == start:
-                        raise SyntaxError("Expected number in list")
-                    parts.append(cond[start:j])
-
-                if j < n and cond[j] == ',':
-                    j += 1
-
-            if j >= n or cond[j] != ']':
-                raise SyntaxError("Unclosed list")
-            token_type = "STRING_LIST" if in_string else "NUMBER_LIST"
-            tokens.append((token_type, parts))
-            i = j + 1
-            continue
-
-        # Check for TRUE/FALSE (case-insensitive)
-        if cond[i:i+4].upper() == "TRUE":
-            tokens.append(("BOOL", True))
-            i += 4
-            continue
-        elif cond[i:i+5].upper() == "FALSE":
-            tokens.append(("BOOL", False))
-            i += 5
-            continue
-
-        # -------------------------------------------------
-        # 1. database.field    (exactly one dot)
-        # -------------------------------------------------
-        # read first identifier
-        if cond[i].isalpha() or cond[i] == '_':
-
-            j = i + 1
-            while j < n and (cond[j].isalnum() or cond[j] == '_'):
-                j += 1
-            # must have a dot next
-            if j < n and cond[j] == '.':
-                k = j + 1
-                if k >= n or not (cond[k].isalpha() or cond[k] == '_'):
-                    raise SyntaxError("Invalid field name after dot")
-                while k < n and (cond[k].isalnum() or cond[k] == '_'):
-                    k += 1
-                tokens.append(("FIELD", cond[i:k]))
-                i = k
-                continue
-            else:
-                raise SyntaxError("Expected '.' in database.field")
-
-        # -------------------------------------------------
-        # 2. Comparison / assignment operators
-        #    Order matters: check the 2‑char forms first
-        # -------------------------------------------------
-        if cond.startswith('<=', i) or cond.startswith('>=', i) \
-                or cond.startswith('==', i) or cond.startswith('<>', i):
-            tokens.append(("OP", cond[i:i + 2]))
-            i += 2
-            continue
-        if cond[i] in '<>':
-            tokens.append(("OP", cond[i]))
-            i += 1
-            continue
-        if cond.startswith(':=', i):
-            tokens.append(("OP", ':='))
-            i += 2
-            continue
-
-        # -------------------------------------------------
-        # 3. Literal asterisk *
-        # -------------------------------------------------
-        if cond[i] == '*':
-            tokens.append(("STAR", '*'))
-            i += 1
-            continue
-
-        # -------------------------------------------------
-        # 4. Comma or parentheses
-        # -------------------------------------------------
-        if cond[i] == ',':
-            tokens.append(("COMMA", ','))
-            i += 1
-            continue
-        if cond[i] == '(':
-            tokens.append(("LPAREN", '('))
-            i += 1
-            continue
-        if cond[i] == ')':
-            tokens.append(("RPAREN", ')'))
-            i += 1
-            continue
-
-
-
-
-        # -------------------------------------------------
-        # 5. String literal  "...."
-        # -------------------------------------------------
-        if cond[i] == '"':
-            j = i + 1
-            while j < n and cond[j] != '"':
-                # simple escape handling for \" inside string
-                if cond[j] == '\\' and j + 1 < n:
-                    j += 2
-                else:
-                    j += 1
-            if j >= n:
-                raise SyntaxError("Unterminated string literal")
-            tokens.append(("STRING", cond[i + 1:j]))  # drop the quotes
-            i = j + 1
-            continue
-
-        # -------------------------------------------------
-        # 6. Number (supporting optional '-' and decimals)
-        # -----------------------------------------------
-        if cond[i].isdigit() or (
-                cond[i] == '-' and i + 1 < n and (cond[i + 1].isdigit() or cond[i + 1] == '.')
-        ) or (
-                cond[i] == '.' and i + 1 < n and cond[i + 1].isdigit()
-        ):
-            j = i
-            has_dot = False
-
-            if cond[j] == '-':
-                j += 1  # Skip minus
-
-            while j < n and (cond[j].isdigit() or (cond[j] == '.' and not has_dot)):
-                if cond[j] == '.':
-                    has_dot = True
-                j += 1
-
-            tokens.append(("NUMBER", cond[i:j]))
-            i = j
-            continue
-
-
-
-        # -------------------------------------------------
-        # 8. Anything else is an error
-        # -------------------------------------------------
-        raise SyntaxError(f"Unexpected character '{cond[i]}' at position {i}")
+        i = dispatch(cond[i], _lex_fallback)(cond, i, tokens)
 
     return tokens
 
@@ -478,6 +364,9 @@ class ConditionParser:
         else:
             raise SyntaxError(f"Unexpected value type {token_type}")
 
+        return self.condition_node(db, field, op, value)
+
+    def condition_node(self, db, field, op, value):
         return {
             "type": "condition",
             "db": db,
@@ -504,8 +393,6 @@ def integrate_condition_tokenizer(tree, condition_tokenizer):
 
 
 def validate_condition_node(node, schema):
-    print(999,node)
-
     db = node['db']
     field = node['field']
     op = node["op"]
@@ -519,7 +406,6 @@ def validate_condition_node(node, schema):
     value = node['value']
     type = value.get("type")
     content = value.get("content")
-    print(888, value)
 
     if scheme_type == "string":
         #if string then the potential scenarios are possible
@@ -542,7 +428,6 @@ def validate_condition_node(node, schema):
             return None
         else:
             raise ValueError(f"Number validation failed at: {full_field}")
-    print(value)
 
     if scheme_type == "datetime":
         if type == "timedelta" and op in ["<","<=","==",">",">="] and all([is_number_or_string(number) for number in content]):
@@ -563,57 +448,20 @@ def is_number_or_string(val, additional_strings=None):
     return False
 
 def validate_condition_node(node, schema):
-    print(node)
-    db = node['db']
-    field = node['field']
-    op = node["op"]
-    full_field = f"{db}.{field}"
+    if TRACE_VALIDATE.enabled:
+        TRACE_VALIDATE.emit("condition", node=node)
+    full_field = f"{node['db']}.{node['field']}"
 
     if full_field not in schema:
         raise ValueError(f"Unknown field: {full_field}")
 
     schema_type = schema[full_field]
     value = node['value']
-    val_type = value.get("type")
-    content = value.get("content")  # fallback for old structure
-
-    # --- String Validation ---
-    if schema_type == "string":
-        if val_type == "string" and isinstance(content, str) and op in ["==", "<>"]:
-            return
-        elif val_type == "list" and isinstance(content, list) and op == ":=" and all(isinstance(item, str) for item in content):
-            return
-        else:
-            raise ValueError(f"String validation failed at: {full_field} with op {op} and value {value}")
-
-    # --- Number Validation ---
-    elif schema_type in ["int", "float"]:
-        print(555,schema_type,val_type,content)
-        if val_type == "number" and isinstance(content, (int, float)) and op in ["<", "<=", "==", ">", ">="]:
-            return
-        elif val_type == "list" and isinstance(content, list) and op == ":=" and all(isinstance(item, (int, float)) for item in content):
-            return
-        elif val_type == "range" and is_number_or_string(value.get("low")) and is_number_or_string(value.get("high")) and op == ":=":
-            return
-        else:
-            raise ValueError(f"Number validation failed at: {full_field} with op {op} and value {value}")
-
-    # --- Datetime Validation ---
-    elif schema_type == "datetime":
-        if val_type == "timedelta" and op in ["<", "<=", "==", ">", ">="] and all(is_number_or_string(x) for x in content):
-            return
-        if val_type == "datetime" and op in ["<", "<=", "==", ">", ">="] and all(is_number_or_string(x, ["*"]) for x in content):
-            return
-        else:
-            raise ValueError(f"Datetime validation failed at: {full_field} with op {op} and value {value}")
-
-    elif schema_type == "bool":
-        if val_type == "bool" and op == "==":
-            return
-        else:
-            raise ValueError(f"Boolean validation failed at: {full_field} with op {op} and value {value}")
-
-    raise ValueError(f"Unhandled schema type: {schema_type}")
+    if TRACE_VALIDATE.enabled and schema_type in ("int", "float"):
+        TRACE_VALIDATE.emit("number", field=full_field, schema_type=schema_type, value_type=value.get("type"),
+                            content=value.get("content"))
+    # precomputed per (field, type), see schema_registry.FIELD_VALIDATORS
+    field_spec(full_field, schema_type).validate(node["op"], value)
 
 def is_number_or_string(s,additional_strings:list = None):
     try:
@@ -634,12 +482,16 @@ def validate_tree(tree, schema):
         for arg in tree['args']:
             validate_tree(arg, schema)
 
-def evaluate_tree_conditions(tree,data):
+def evaluate_tree_conditions(tree,data,as_of=None):
+    """
+    Writes the result of every condition into tree["eval_result"], to be combined by
+    evaluate_expression afterwards. Kept for compatibility, use evaluate() for shared trees.
+    """
     if tree['type'] == 'condition':
-        tree["eval_result"] = condition_evaluator(tree, data)
+        tree["eval_result"] = condition_evaluator(tree, data, as_of)
     elif tree['type'] == 'operator':
         for arg in tree['args']:
-            evaluate_tree_conditions(arg, data)
+            evaluate_tree_conditions(arg, data, as_of)
 
 
 def process_input_string(input_string:str ,valid_fields:dict):
@@ -651,13 +503,239 @@ def process_input_string(input_string:str ,valid_fields:dict):
     return ast
 
 
+# ----------------------------------------------------------------------
+# Parse cache
+# ----------------------------------------------------------------------
+class FrozenDict(dict):
+    """ dict that refuses changes, json.dump and isinstance(x, dict) keep working """
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Parsed rule is immutable, use thaw() for a mutable copy")
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __copy__(self):
+        return thaw(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+class FrozenList(list):
+    """ list that refuses changes, see FrozenDict """
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Parsed rule is immutable, use thaw() for a mutable copy")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+    append = extend = insert = pop = remove = clear = sort = reverse = _immutable
+
+    def __copy__(self):
+        return thaw(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return FrozenList, (list(self),)
+
+
+def freeze(tree):
+    if isinstance(tree, dict):
+        return FrozenDict({key: freeze(value) for key, value in tree.items()})
+    if isinstance(tree, list):
+        return FrozenList(freeze(value) for value in tree)
+    return tree
+
+
+def thaw(tree):
+    if isinstance(tree, dict):
+        return {key: thaw(value) for key, value in tree.items()}
+    if isinstance(tree, list):
+        return [thaw(value) for value in tree]
+    return tree
+
+
+STRING_LITERAL = re.compile(r'("(?:[^"\\]|\\.)*")')
+
+
+def normalize_rule_text(input_string):
+    """ strips the rule and collapses whitespace outside of string literals """
+    parts = STRING_LITERAL.split(input_string.strip())
+    # odd indices are the string literals
+    return "".join(part if jj % 2 else re.sub(r"\s+", " ", part) for jj, part in enumerate(parts))
+
+
+def schema_fingerprint(valid_fields):
+    return frozenset(valid_fields.items())
+
+
+ParseCacheInfo = namedtuple("ParseCacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class ParseCache:
+    """
+    Bounded LRU cache for process_input_string, keyed by normalized rule text and the
+    valid_fields schema. Cached asts are frozen (see FrozenDict) because every caller
+    gets the same object.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, input_string, valid_fields):
+        key = (normalize_rule_text(input_string), schema_fingerprint(valid_fields))
+        with self._lock:
+            ast = self._entries.get(key)
+            if ast is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return ast
+            self.misses += 1
+
+        # parse errors are raised and not cached
+        ast = freeze(process_input_string(key[0], valid_fields))
+
+        with self._lock:
+            self._entries[key] = ast
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return ast
+
+    def info(self):
+        with self._lock:
+            return ParseCacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+parse_cache = ParseCache()
+
+
+def cached_process_input_string(input_string: str, valid_fields: dict):
+    """ process_input_string through the module wide parse cache, returns a frozen ast """
+    return parse_cache.get(input_string, valid_fields)
+
+
+
+# ----------------------------------------------------------------------
+# Datetime patterns
+# ----------------------------------------------------------------------
+COMPARISON_OPERATORS = {
+    "==": operator.eq,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+DATETIME_PARTS = ("year", "month", "day", "hour", "minute", "second")
+
+
+def datetime_pattern(content):
+    """
+    Splits a datetime pattern into the positions that are not wildcards and their values,
+    (*,*,*,8,50,*) -> mask (3, 4) and target (8, 50)
+    """
+    mask = tuple(jj for jj, part in enumerate(content) if part != "*")
+    target = tuple(int(content[jj]) for jj in mask)
+    return mask, target
+
+
+def compile_datetime_matcher(content, op):
+    """
+    Returns a function reference -> bool for a datetime pattern and operator.
+    The first fixed position that differs decides, which is exactly how tuples compare,
+    so a comparison is one attrgetter call and one tuple compare.
+    """
+    if op not in COMPARISON_OPERATORS:
+        raise ValueError(f"Datetime evaluation failed, unknown operator: {op}")
+    compare = COMPARISON_OPERATORS[op]
+    mask, target = datetime_pattern(content)
 
+    if not mask:
+        # only wildcards, every datetime is equal to the pattern
+        result = compare((), ())
+        return lambda reference: result
 
-def condition_evaluator(condition,data):
+    getter = operator.attrgetter(*(DATETIME_PARTS[jj] for jj in mask))
+    if len(mask) == 1:
+        # attrgetter with one attribute returns the value, not a tuple
+        target = target[0]
+
+    def matches(reference):
+        return compare(getter(reference), target)
+    return matches
+
+
+@functools.lru_cache(maxsize=1024)
+def cached_datetime_matcher(content, op):
+    return compile_datetime_matcher(content, op)
+
+
+# ----------------------------------------------------------------------
+# Timedelta (age) conditions
+# ----------------------------------------------------------------------
+# age op td with age = as_of - reference is the same as reference op' cutoff
+# with cutoff = as_of - td, the ordering operators flip
+TIMEDELTA_CUTOFF_OPERATORS = {"==": "==", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+
+def content_to_timedelta(content):
+    """ {years, months, days, hours, minutes, seconds} -> timedelta, a year is 365 and a month 30 days """
+    timedelta_list = [float(number) for number in content]
+    number_of_days = 365 * timedelta_list[0] + 30 * timedelta_list[1] + timedelta_list[2]
+    return timedelta(days=number_of_days, hours=timedelta_list[3], minutes=timedelta_list[4], seconds=timedelta_list[5])
+
+
+@functools.lru_cache(maxsize=1024)
+def cached_timedelta(content):
+    return content_to_timedelta(content)
+
+
+def compile_timedelta_matcher(content, op, as_of=None):
+    """
+    Returns a function reference -> bool for an age condition. With as_of the cutoff is
+    computed once, without it every call compares against the current time.
+    """
+    if op not in TIMEDELTA_CUTOFF_OPERATORS:
+        raise ValueError(f"Timedelta evaluation failed, unknown operator: {op}")
+    compare = COMPARISON_OPERATORS[TIMEDELTA_CUTOFF_OPERATORS[op]]
+    td = content_to_timedelta(content)
+
+    if as_of is None:
+        def matches(reference):
+            return compare(reference, datetime.now() - td)
+        return matches
+
+    cutoff = as_of - td
+
+    def matches(reference):
+        return compare(reference, cutoff)
+    return matches
+
+
+def condition_evaluator(condition,data,as_of=None):
+    """
+    Evaluates a single condition node. as_of is the reference time for timedelta
+    conditions, defaults to now. Pass one as_of per batch so results do not drift.
+    """
     value = condition.get("value")
     reference = data.get(condition["db"]).get(condition["field"])
     op = condition.get("op")
     value_type = value.get("type")
+    if TRACE_EVALUATE.enabled:
+        TRACE_EVALUATE.emit("condition", db=condition["db"], field=condition["field"], op=op, value=value, reference=reference)
     if value_type == "string":
         if op == "==":
             if reference == value.get("content"):
@@ -735,132 +813,17 @@ def condition_evaluator(condition,data):
             raise ValueError(f"List evaluation failed at: {condition}")
 
     elif value_type == "datetime":
-        reference = [reference.year, reference.month, reference.day, reference.hour, reference.minute, reference.second]
-
-        comp_result = []
-
-        if op == "==":
-            for jj, time_number in enumerate(value.get("content")):
-                if time_number =="*":
-                    pass
-                else:
-                    if int(time_number) == reference[jj]:
-                        comp_result.append(True)
-                    else:
-                        comp_result.append(False)
-
-            if all(comp_result):
-                return True
-            else:
-                return False
-
-        elif op == "<":
-            for jj, time_number in enumerate(value.get("content")):
-                if time_number =="*":
-                    if jj == len(value.get("content")) - 1:
-                        return False
-                    else:
-                        pass
-                elif int(time_number) == reference[jj]:
-                    if jj == len(value.get("content")) - 1:
-                        return False
-                    else:
-                        pass
-                elif int(time_number) < reference[jj]:
-                    return False
-                elif int(time_number) > reference[jj]:
-                    return True
-
-        elif op == ">":
-
-            for jj, condition_boundary in enumerate(value.get("content")):
-                if condition_boundary =="*":
-                    if jj == len(value.get("content")) - 1:
-                        return False
-                    else:
-                        pass
-                elif int(condition_boundary) == reference[jj]:
-                    if jj == len(value.get("content")) - 1:
-                        return False
-                    else:
-                        pass
-                    print("tz")
-                elif int(condition_boundary) < reference[jj]:
-                    return True
-                elif int(condition_boundary) > reference[jj]:
-                    return False
-
-        elif op == ">=":
-            for jj, time_number in enumerate(value.get("content")):
-                if time_number =="*":
-                    if jj == len(value.get("content")) - 1:
-                        return True
-                    else:
-                        pass
-                elif int(time_number) == reference[jj]:
-                    if jj == len(value.get("content")) - 1:
-                        return True
-                    else:
-                        pass
-                elif int(time_number) < reference[jj]:
-                    return True
-                elif int(time_number) > reference[jj]:
-                    return False
-
-        elif op == "<=":
-            for jj, time_number in enumerate(value.get("content")):
-                if time_number =="*":
-                    if jj == len(value.get("content")) - 1:
-                        return True
-                    else:
-                        pass
-                elif int(time_number) == reference[jj]:
-                    if jj == len(value.get("content")) - 1:
-                        return True
-                    else:
-                        pass
-                elif int(time_number) > reference[jj]:
-                    return True
-                elif int(time_number) < reference[jj]:
-                    return False
-
-
-
+        return cached_datetime_matcher(tuple(value.get("content")), op)(reference)
 
 
     elif value_type == "timedelta":
-        age = datetime.now() - reference
-        timedelta_list = [float(number) for number in value.get("content")]
-        number_of_days = 365*timedelta_list[0] + 30 * timedelta_list[1] + timedelta_list[2]
-        td = timedelta(days = number_of_days, hours = timedelta_list[3], minutes = timedelta_list[4], seconds = timedelta_list[5])
-        if op == "==":
-            if age == td:
-                return True
-            else:
-                return False
-        elif op == ">=":
-            if age >= td:
-                return True
-            else:
-                return False
-        elif op == ">":
-            if age > td:
-                return True
-            else:
-                return False
-        elif op == "<":
-            if age < td:
-                return True
-            else:
-                return False
-
-        elif op == "<=":
-            if age <= td:
-                return True
-            else:
-                return False
-        else:
+        # age op td <=> reference op' (as_of - td), one datetime comparison per record
+        if op not in TIMEDELTA_CUTOFF_OPERATORS:
             raise ValueError(f"Number evaluation failed at: {condition}")
+        if as_of is None:
+            as_of = datetime.now()
+        cutoff = as_of - cached_timedelta(tuple(value.get("content")))
+        return COMPARISON_OPERATORS[TIMEDELTA_CUTOFF_OPERATORS[op]](reference, cutoff)
 
 
 
@@ -895,6 +858,76 @@ def evaluate_expression(node):
         else:
             raise ValueError(f"Unknown operator: {op}")
 
+
+class EvaluationStats:
+    """
+    Counts evaluated and skipped (short-circuited) condition leaves over one or more evaluate() calls,
+    shared_hits are conditions answered from the shared results of mapping_rules.MappingRuleSet
+    """
+    def __init__(self):
+        self.evaluated = 0
+        self.skipped = 0
+        self.shared_hits = 0
+
+    def __repr__(self):
+        return f"EvaluationStats(evaluated={self.evaluated}, skipped={self.skipped}, shared_hits={self.shared_hits})"
+
+
+def count_conditions(tree):
+    if tree["type"] == "condition":
+        return 1
+    return sum(count_conditions(arg) for arg in tree["args"])
+
+
+def rule_fields(tree):
+    """ set of "db.field" paths a rule reads """
+    if tree["type"] == "condition":
+        return {f"{tree['db']}.{tree['field']}"}
+    fields = set()
+    for arg in tree["args"]:
+        fields |= rule_fields(arg)
+    return fields
+
+
+def evaluate(tree, data, stats=None, as_of=None):
+    """
+    Evaluates a rule ast against data and returns the result. Unlike
+    evaluate_tree_conditions/evaluate_expression nothing is written into the tree,
+    so one parsed rule set can be shared between threads.
+    $AND/$OR stop at the first deciding argument, the remaining leaves are never
+    evaluated. Pass an EvaluationStats to count evaluated and skipped leaves.
+    as_of is the reference time for timedelta conditions, see condition_evaluator.
+    """
+    if tree["type"] == "condition":
+        if stats is not None:
+            stats.evaluated += 1
+        return condition_evaluator(tree, data, as_of)
+
+    elif tree["type"] == "operator":
+        op = tree["operator"]
+        args = tree["args"]
+
+        if op == "$AND" or op == "$OR":
+            # $AND is decided by the first False, $OR by the first True
+            deciding = op == "$OR"
+            for jj, arg in enumerate(args):
+                if bool(evaluate(arg, data, stats, as_of)) == deciding:
+                    if stats is not None:
+                        stats.skipped += sum(count_conditions(rest) for rest in args[jj + 1:])
+                    return deciding
+            return not deciding
+
+        elif op == "$NOT":
+            if len(args) != 1:
+                raise ValueError(f"$NOT expects exactly one argument, got {len(args)}")
+            return not evaluate(args[0], data, stats, as_of)
+
+        else:
+            raise ValueError(f"Unknown operator: {op}")
+
+    else:
+        raise ValueError(f"Unknown node type {tree['type']}")
+
 def reconstruct_expression(node):
     if node["type"] == "operator":
         op = node["operator"]
@@ -942,71 +975,13 @@ def serialize_value(val):
     else:
         raise ValueError(f"Unknown value type: {vtype}")
 
-def resolve_type(ann) -> str:
-    origin =typing.get_origin(ann)
-    args = typing.get_args(ann)
-
-    # Handle Optional or Union[..., None]
-    if origin is typing.Union:
-        non_none = [arg for arg in args if arg is not type(None)]
-        if len(non_none) == 1:
-            return resolve_type(non_none[0])
-        else:
-            return "union"
-
-    # Handle Literal
-    if origin is typing.Literal:
-        if all(isinstance(arg, str) for arg in args):
-            return "string"
-        elif all(isinstance(arg, int) for arg in args):
-            return "number"
-        elif all(isinstance(arg, float) for arg in args):
-            return "float"
-        elif all(isinstance(arg, bool) for arg in args):
-            return "bool"
-        else:
-            return "mixed"
-
-    # Handle List[...] types
-    if origin in (list, typing.List):
-        inner = args[0]
-        return f"list[{resolve_type(inner)}]"
-
-    # Handle primitive types
-    if ann is str:
-        return "string"
-    elif ann is int:
-        return "int"
-    elif ann is float:
-        return "float"
-    elif ann is bool:
-        return "bool"
-    elif ann in (datetime, getattr(__import__('datetime'), 'datetime', object())):
-        return "datetime"
-    elif ann is timedelta:
-        return "timedelta"
-
-    # Fallback
-    return str(ann)
 def create_valid_fields_dict(model: BaseModel,name: str = None) -> dict:
     """
-    creates a dict with valid fields and type requirements
+    creates a dict with valid fields and type requirements, cached per model (schema_registry)
     :param model:
     :return:
     """
-    model_name = name if name else model.__name__
-    output = {}
-    fields = list(model.model_fields.keys())
-    for field in fields:
-        try:
-            info = model.model_fields[field]
-            print(info)
-            output_type = resolve_type(info.annotation)
-            output[f"{model_name}.{field}"] = output_type
-        except Exception as err:
-            print(f"Error creating valid field for {field} {info} because of {err}")
-            pass
-    return output
+    return model_schema(model, name)
 
 # Formatted HTML tooltip
 tooltip_html = """
@@ -354,6 +354,38 @@ class TestFullParsing(unittest.TestCase):
         cond = 'filter.names == ["A","B",1]'  # missing quotes for string elements
         with self.assertRaises(SyntaxError):
             self.parse_condition(cond)
+
+    def test_invalid_condition_list_not_closed(self):
+        cond = 'filter.names := ['
+        with self.assertRaises(SyntaxError):
+            self.parse_condition(cond)
+
+    # --- Large inputs, there is no size cap on list literals ---
+
+    def test_large_string_list(self):
+        isins = [f"DE{i:010d}" for i in range(50000)]
+        cond = 'sec.isin := [' + ",".join(f'"{isin}"' for isin in isins) + ']'
+        result = self.parse_condition(cond)
+        self.assertEqual(result["value"], {"type": "list", "value_type": "string", "content": isins})
+
+    def test_large_number_list(self):
+        numbers = [str(i) for i in range(-100, 20000)]
+        cond = 'pos.number_of_trades := [' + ",".join(numbers) + ']'
+        result = self.parse_condition(cond)
+        self.assertEqual(result["value"]["content"], numbers)
+
+    def test_large_rule_string(self):
+        isins = ",".join(f'"DE{i:010d}"' for i in range(50000))
+        input_str = f'$AND(?sec.isin := [{isins}]?, ?sec.region == "DE"?)'
+        tokens = tokenize(input_str)
+        self.assertEqual([token_type for token_type, _ in tokens],
+                         ["OPERATOR", "LPAREN", "CONDITION", "COMMA", "CONDITION", "RPAREN"])
+
+    def test_escaped_quotes_in_strings(self):
+        self.assertEqual(tokenize_condition(r'a.b == "x\"y"'), [("FIELD", "a.b"), ("OP", "=="), ("STRING", r'x\"y')])
+        self.assertEqual(tokenize_condition(r'a.b := ["x\"y","z"]'), [("FIELD", "a.b"), ("OP", ":="), ("STRING_LIST", [r'x\"y', "z"])])
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,238 @@
+"""
+"db.field" -> type maps (valid_fields) built from pydantic models, once per model.
+
+Rules address a field as "db.field", so model_schema (the valid_fields of the rule
+language) has the top level fields only, fields holding a nested model are left out.
+field_specs is lookup-only and also has the nested paths: nested models add their
+fields under the parent path ("pos.account.currency"), lists of models under "field[]"
+("trade.legs[].price"), the getter of the spec reads them from a record. Fields whose
+annotation cannot be resolved (e.g. a bare typing.List) are left out and reported on
+the "schema" trace.
+
+    valid_fields = model_schema(SecurityModel, "sec") | model_schema(PositionModel, "pos")
+    spec = field_specs(SecurityModel, "sec")["sec.adr_ratio"]
+    spec.accepts("range", ":="), spec.validate(":=", value), spec.getter({"sec": security})
+
+validate_condition_node (rule_widget) validates every condition with the FieldSpec of
+its "db.field", FIELD_VALIDATORS is the only type -> operator table.
+"""
+import functools
+import typing
+from datetime import datetime, timedelta
+
+from pydantic import BaseModel
+
+from rule_trace import trace_category
+
+TRACE_SCHEMA = trace_category("schema")
+
+COMPARISONS = frozenset(["<", "<=", "==", ">", ">="])
+
+
+def is_number(value, wildcards=()):
+    """ True for anything float() accepts and for the wildcards, e.g. "*" in datetime contents """
+    try:
+        float(value)
+        return True
+    except (ValueError, TypeError):
+        return value in wildcards
+
+
+def list_of(kinds):
+    return lambda value: isinstance(value.get("content"), list) and all(
+        isinstance(item, kinds) for item in value.get("content"))
+
+
+# schema type -> value type -> (operators, check of the value), the validation of rule conditions
+FIELD_VALIDATORS = {
+    "string": {
+        "string": (frozenset(["==", "<>"]), lambda value: isinstance(value.get("content"), str)),
+        "list": (frozenset([":="]), list_of(str)),
+    },
+    "int": {
+        "number": (COMPARISONS, lambda value: isinstance(value.get("content"), (int, float))),
+        "list": (frozenset([":="]), list_of((int, float))),
+        "range": (frozenset([":="]), lambda value: is_number(value.get("low")) and is_number(value.get("high"))),
+    },
+    "datetime": {
+        "timedelta": (COMPARISONS, lambda value: all(is_number(item) for item in value.get("content"))),
+        "datetime": (COMPARISONS, lambda value: all(is_number(item, ("*",)) for item in value.get("content"))),
+    },
+    "bool": {
+        "bool": (frozenset(["=="]), lambda value: True),
+    },
+}
+FIELD_VALIDATORS["float"] = FIELD_VALIDATORS["int"]
+
+# name of the schema type in validation errors
+TYPE_LABELS = {"string": "String", "int": "Number", "float": "Number", "datetime": "Datetime", "bool": "Boolean"}
+
+
+class FieldSpec:
+    """ type of one schema path, its validators per value type and a function record -> value """
+    __slots__ = ("path", "type", "validators", "getter")
+
+    def __init__(self, path, field_type, validators, getter):
+        self.path = path
+        self.type = field_type
+        self.validators = validators
+        self.getter = getter
+
+    def accepts(self, value_type, op):
+        entry = (self.validators or {}).get(value_type)
+        return entry is not None and op in entry[0]
+
+    def validate(self, op, value):
+        """ ValueError if the condition "path op value" is not valid for the type of the path """
+        if self.validators is None:
+            raise ValueError(f"Unhandled schema type: {self.type}")
+        entry = self.validators.get(value.get("type"))
+        if entry is None or op not in entry[0] or not entry[1](value):
+            raise ValueError(f"{TYPE_LABELS[self.type]} validation failed at: {self.path} with op {op} and value {value}")
+
+    def __repr__(self):
+        return f"FieldSpec({self.path!r}, {self.type!r})"
+
+
+def resolve_type(ann) -> str:
+    origin = typing.get_origin(ann)
+    args = typing.get_args(ann)
+
+    # Handle Optional or Union[..., None]
+    if origin is typing.Union:
+        non_none = [arg for arg in args if arg is not type(None)]
+        if len(non_none) == 1:
+            return resolve_type(non_none[0])
+        else:
+            return "union"
+
+    # Handle Literal
+    if origin is typing.Literal:
+        if all(isinstance(arg, str) for arg in args):
+            return "string"
+        elif all(isinstance(arg, int) for arg in args):
+            return "number"
+        elif all(isinstance(arg, float) for arg in args):
+            return "float"
+        elif all(isinstance(arg, bool) for arg in args):
+            return "bool"
+        else:
+            return "mixed"
+
+    # Handle List[...] types
+    if origin in (list, typing.List):
+        if not args:
+            raise ValueError(f"List without element type: {ann}")
+        return f"list[{resolve_type(args[0])}]"
+
+    # Handle primitive types
+    if ann is str:
+        return "string"
+    elif ann is int:
+        return "int"
+    elif ann is float:
+        return "float"
+    elif ann is bool:
+        return "bool"
+    elif ann is datetime:
+        return "datetime"
+    elif ann is timedelta:
+        return "timedelta"
+
+    # Fallback
+    return str(ann)
+
+
+def nested_model(ann):
+    """ (model, is_list) if the annotation is a model, an optional model or a list of models, else None """
+    if typing.get_origin(ann) is typing.Union:
+        non_none = [arg for arg in typing.get_args(ann) if arg is not type(None)]
+        if len(non_none) != 1:
+            return None
+        ann = non_none[0]
+    if typing.get_origin(ann) in (list, typing.List):
+        args = typing.get_args(ann)
+        inner = nested_model(args[0]) if args else None
+        return (inner[0], True) if inner is not None and not inner[1] else None
+    if isinstance(ann, type) and issubclass(ann, BaseModel):
+        return ann, False
+    return None
+
+
+def collect_fields(model, prefix, output, seen, expand=True):
+    """ path -> type of the fields of model, with expand=False fields holding a nested model are left out """
+    if model in seen:
+        # recursive model, the inner occurrence is not expanded
+        return
+    seen = seen | {model}
+    for field, info in model.model_fields.items():
+        path = f"{prefix}.{field}"
+        nested = nested_model(info.annotation)
+        if nested is not None:
+            if expand:
+                inner, is_list = nested
+                collect_fields(inner, f"{path}[]" if is_list else path, output, seen)
+            continue
+        try:
+            output[path] = resolve_type(info.annotation)
+            if TRACE_SCHEMA.enabled:
+                TRACE_SCHEMA.emit("field", path=path, type=output[path])
+        except Exception as err:
+            if TRACE_SCHEMA.enabled:
+                TRACE_SCHEMA.emit("field_error", path=path, annotation=info.annotation, error=err)
+
+
+@functools.lru_cache(maxsize=None)
+def cached_schema(model, name, expand=False):
+    output = {}
+    collect_fields(model, name, output, frozenset(), expand)
+    return output
+
+
+def model_schema(model, name=None) -> dict:
+    """
+    "name.field" -> type string for every top level field of a pydantic model, built once per (model, name).
+    :param name: db name of the paths, defaults to the model class name
+    """
+    # a copy, callers merge and extend the result
+    return dict(cached_schema(model, name if name else model.__name__))
+
+
+def path_getter(path):
+    """ record -> value for a schema path, None if a level is missing, a list for "[]" paths """
+    parts = path.replace("[]", ".[]").split(".")
+
+    def get(value, parts):
+        for jj, part in enumerate(parts):
+            if part == "[]":
+                return [get(item, parts[jj + 1:]) for item in value or ()]
+            if value is None:
+                return None
+            value = value.get(part)
+        return value
+    return lambda record: get(record, parts)
+
+
+@functools.lru_cache(maxsize=None)
+def field_spec(path, field_type):
+    """ FieldSpec of a path with the given type string, built once, validate_condition_node looks it up per condition """
+    return FieldSpec(path, field_type, FIELD_VALIDATORS.get(field_type), path_getter(path))
+
+
+@functools.lru_cache(maxsize=None)
+def cached_field_specs(model, name):
+    return {path: field_spec(path, field_type) for path, field_type in cached_schema(model, name, expand=True).items()}
+
+
+def field_specs(model, name=None) -> dict:
+    """
+    "name.field" -> FieldSpec for every field of a pydantic model including the nested paths,
+    built once per (model, name). Only the paths in model_schema can be used in rules.
+    """
+    return dict(cached_field_specs(model, name if name else model.__name__))
+
+
+def clear_cache():
+    cached_schema.cache_clear()
+    cached_field_specs.cache_clear()
+    field_spec.cache_clear()
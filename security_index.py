@@ -0,0 +1,79 @@
+"""
+Hash join between positions and securities.
+
+SecurityIndex builds one dict per security key (isin, ref_ticker, de_ticker) once, a
+position is matched by its join fields in order, the first hit wins. Like find_by_field
+the first security with a key value is used. Positions without a security are counted
+in miss_count, misses counts them per key value for the first max_misses distinct values
+only, so the index stays bounded over a long cursor.
+
+    index = SecurityIndex(securities_data)
+    for record in index.records(positions):  # {"sec": security or None, "pos": position}
+        rule_set.assign(record)
+    index.misses.most_common(10)
+"""
+from collections import Counter
+
+SECURITY_KEYS = ("isin", "ref_ticker", "de_ticker")
+# (position field, security key) pairs tried in order
+DEFAULT_JOIN = (("isin", "isin"),)
+
+
+class SecurityIndex:
+    def __init__(self, securities, keys=SECURITY_KEYS, on=DEFAULT_JOIN, max_misses=1000):
+        for _, key in on:
+            if key not in keys:
+                raise ValueError(f"Join key {key} is not indexed, indexed keys: {', '.join(keys)}")
+        self.keys = tuple(keys)
+        self.on = tuple(on)
+        self.indexes = {key: {} for key in self.keys}
+        self.size = 0
+        for security in securities:
+            self.add(security)
+        self.hits = 0
+        self.miss_count = 0
+        # sample for diagnostics: tuple of the position's join values -> number of positions without a security,
+        # values missing after max_misses distinct ones are only counted in miss_count
+        self.max_misses = max_misses
+        self.misses = Counter()
+
+    def add(self, security):
+        """ indexes a security under every key it has, an existing security with the same value is kept """
+        self.size += 1
+        for key, index in self.indexes.items():
+            value = security.get(key)
+            if value is not None:
+                index.setdefault(value, security)
+
+    def find(self, key, value):
+        """ the security with security[key] == value, None if there is none """
+        return self.indexes[key].get(value)
+
+    def match(self, position):
+        for field, key in self.on:
+            value = position.get(field)
+            if value is not None:
+                security = self.indexes[key].get(value)
+                if security is not None:
+                    self.hits += 1
+                    return security
+        self.miss_count += 1
+        values = tuple(position.get(field) for field, _ in self.on)
+        if values in self.misses or len(self.misses) < self.max_misses:
+            self.misses[values] += 1
+        return None
+
+    def join_batch(self, positions):
+        """ the security of every position, None for misses, the lookup of assignment_pipeline.run_pipeline """
+        return [self.match(position) for position in positions]
+
+    def records(self, positions):
+        """ evaluation records {"sec": ..., "pos": ...}, one per position """
+        for position in positions:
+            yield {"sec": self.match(position), "pos": position}
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f"SecurityIndex(securities={self.size}, hits={self.hits}, misses={self.miss_count})"
@@ -0,0 +1,128 @@
+import unittest
+import threading
+from datetime import datetime
+from pymongo import UpdateOne
+from mapping_rules import build_rule_set
+from assignment_pipeline import (batched, cursor_source, dict_lookup, collection_lookup, join_stage, prefetch,
+                                 mongo_sink, run_pipeline)
+from test_mapping_rules import make_mappings, make_records, first_match
+
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = iter(documents)
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.documents)
+
+    def close(self):
+        self.closed = True
+
+
+class LazyCollection:
+    """ find() generates the documents on demand and counts how many were read """
+    def __init__(self, make_document, count):
+        self.make_document = make_document
+        self.count = count
+        self.produced = 0
+        self.cursors = []
+        self.requests = []
+
+    def generate(self):
+        for jj in range(self.count):
+            self.produced += 1
+            yield self.make_document(jj)
+
+    def find(self, query=None, projection=None, batch_size=0):
+        if query:
+            (key, condition), = query.items()
+            keys = set(condition["$in"])
+            documents = (document for document in self.generate() if document.get(key) in keys)
+        else:
+            documents = self.generate()
+        self.cursors.append(Cursor(documents))
+        return self.cursors[-1]
+
+    def bulk_write(self, requests, ordered=True):
+        self.requests.extend(requests)
+
+
+class TestAssignmentPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.as_of = datetime(2025, 7, 11, 12, 0, 0)
+        self.mappings = make_mappings(30)
+        self.records = make_records(500)
+        self.securities = [dict(record["sec"], isin=f"DE{jj:010d}") for jj, record in enumerate(self.records)]
+        self.positions = LazyCollection(lambda jj: dict(self.records[jj]["pos"], _id=jj, isin=f"DE{jj:010d}"), 500)
+
+    def test_same_result_as_first_match(self):
+        results = []
+        rule_set = build_rule_set(self.mappings, as_of=self.as_of)
+        stats = run_pipeline(cursor_source(self.positions, batch_size=64), dict_lookup(self.securities),
+                             rule_set.assign, results.extend)
+        self.assertEqual(stats.batches, 8)
+        self.assertEqual(stats.records, 500)
+        self.assertEqual(stats.assigned + stats.unmatched, 500)
+        self.assertEqual([key for _, key, _ in results],
+                         [first_match(self.mappings, record) for record in self.records])
+        self.assertTrue(self.positions.cursors[0].closed)
+
+    def test_collection_lookup_and_views(self):
+        securities = LazyCollection(lambda jj: self.securities[jj], 500)
+        results = []
+        rule_set = build_rule_set(self.mappings, as_of=self.as_of)
+        run_pipeline(cursor_source(self.positions, batch_size=100), collection_lookup(securities),
+                     rule_set.assign, results.extend, prefetch_depth=0)
+        # one $in query per batch
+        self.assertEqual(len(securities.cursors), 5)
+        self.assertEqual(results[3][0]["sec"]["isin"], "DE0000000003")
+        joined = next(join_stage([[{"isin": "DE0000000001", "position_uid": "p"}, {"isin": "XX"}]],
+                                 dict_lookup(self.securities), views=True))
+        self.assertEqual(joined[0]["sec"].get("isin"), "DE0000000001")
+        self.assertEqual(joined[0]["pos"].position_uid, "p")
+        self.assertIsNone(joined[1]["sec"])
+
+    def test_bounded_read_ahead(self):
+        seen = []
+
+        def slow_assign(record):
+            # the producer may only be prefetch_depth batches (plus the one being joined) ahead
+            seen.append(self.positions.produced - len(seen))
+            return None
+        run_pipeline(cursor_source(self.positions, batch_size=10), dict_lookup(self.securities), slow_assign,
+                     lambda results: None, prefetch_depth=2)
+        self.assertLessEqual(max(seen), 10 * 4)
+
+    def test_errors_and_early_stop(self):
+        def failing():
+            yield 1
+            raise KeyError("broken cursor")
+        with self.assertRaises(KeyError):
+            list(prefetch(failing()))
+
+        batches = prefetch(batched(range(10 ** 6), 10), depth=1)
+        self.assertEqual(next(batches), list(range(10)))
+        batches.close()
+        self.assertEqual([thread.name for thread in threading.enumerate() if thread.name == "assignment-prefetch"], [])
+
+        stats = run_pipeline([[{"isin": "DE0000000001"}]], dict_lookup(self.securities),
+                             lambda record: record["pos"]["missing"], lambda results: None)
+        self.assertEqual(stats.failed, 1)
+        stats = run_pipeline([[{"isin": "XX"}, {}]], dict_lookup(self.securities), lambda record: None, lambda results: None)
+        self.assertEqual(stats.missing, 2)
+
+    def test_mongo_sink(self):
+        sink = mongo_sink(self.positions, self.as_of)
+        sink([({"pos": {"_id": 1}}, "mapping_1", None), ({"pos": {"_id": 2}}, None, KeyError("x")),
+              ({"pos": {"_id": 3}}, None, None)])
+        self.assertEqual(len(self.positions.requests), 2)
+        self.assertTrue(all(isinstance(request, UpdateOne) for request in self.positions.requests))
+
+
+if __name__ == "__main__":
+    unittest.main()
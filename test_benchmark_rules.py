@@ -0,0 +1,62 @@
+import unittest
+import json
+import os
+import tempfile
+from models import PositionModel, SecurityModel
+from benchmark_rules import synthetic_records, synthetic_rule_strings, valid_fields, run_benchmarks, compare_to_baseline, main
+
+BENCHMARKS = {"process_input_string", "validate_tree", "evaluate_tree_conditions", "evaluate",
+              "compile_rule", "compiled_rule", "mapping_evaluator", "mapping_rule_set"}
+
+
+class TestBenchmarkRules(unittest.TestCase):
+
+    def test_synthetic_records_follow_the_models(self):
+        records = synthetic_records(20, 5, seed=1)
+        self.assertEqual(len(records), 20)
+        for record in records:
+            PositionModel(**record["pos"])
+            SecurityModel(**record["sec"])
+            self.assertEqual(record["pos"]["isin"], record["sec"]["isin"])
+        self.assertEqual(records, synthetic_records(20, 5, seed=1))
+
+    def test_synthetic_rules_are_valid(self):
+        from rule_widget import process_input_string
+        fields = valid_fields()
+        for rules in synthetic_rule_strings(10, 3, seed=2):
+            self.assertEqual(len(rules), 3)
+            for rule in rules:
+                process_input_string(rule, fields)
+
+    def test_run_benchmarks(self):
+        result = run_benchmarks(positions=20, securities=5, mappings=3, rules_per_mapping=2, repeat=1)
+        self.assertEqual(set(result["results"]), BENCHMARKS)
+        self.assertEqual(result["results"]["mapping_evaluator"]["ops"], 20)
+        self.assertEqual(result["results"]["evaluate"]["ops"], 20 * 6)
+        self.assertEqual(result["meta"]["positions"], 20)
+        json.dumps(result)
+
+    def test_regressions(self):
+        baseline = {"results": {"evaluate": {"us_per_op": 1.0}, "validate_tree": {"us_per_op": 10.0}}}
+        result = {"results": {"evaluate": {"us_per_op": 1.5}, "validate_tree": {"us_per_op": 10.5}, "new": {"us_per_op": 3.0}}}
+        regressions = compare_to_baseline(result, baseline, max_regression=0.2)
+        self.assertEqual([name for name, *_ in regressions], ["evaluate"])
+        self.assertAlmostEqual(regressions[0][3], 0.5)
+
+    def test_main_exit_code(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "bench.json")
+            arguments = ["--positions", "10", "--securities", "3", "--mappings", "2", "--repeat", "1", "--output", output]
+            self.assertEqual(main(arguments), 0)
+            with open(output, encoding="utf-8") as f:
+                result = json.load(f)
+            for entry in result["results"].values():
+                entry["us_per_op"] /= 1000
+            baseline = os.path.join(directory, "baseline.json")
+            with open(baseline, "w", encoding="utf-8") as f:
+                json.dump(result, f)
+            self.assertEqual(main(arguments + ["--baseline", baseline]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
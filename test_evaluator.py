@@ -1,6 +1,7 @@
 import unittest
 from datetime import datetime, timedelta
-from rule_widget import condition_evaluator
+from rule_widget import condition_evaluator, datetime_pattern, compile_datetime_matcher, evaluate
+from rule_compiler import compile_rule
 # Assume condition_evaluator is imported or defined in this scope
 import unittest
 from datetime import datetime, timedelta
@@ -393,8 +394,72 @@ class TestDatetimeWildcardsRandomSamples(unittest.TestCase):
         cond = self.make_condition(">", ['*', 7, 9, '*', 30, 45])
         self.assertTrue(condition_evaluator(cond, self.data))  # Expected: True
 
-if __name__ == "__main__":
-    unittest.main()
+class TestDatetimeMatcher(unittest.TestCase):
+
+    def test_pattern_mask_and_target(self):
+        self.assertEqual(datetime_pattern(["*", "*", "*", "8", "50", "*"]), ((3, 4), (8, 50)))
+        self.assertEqual(datetime_pattern([2025, 7, "*", "*", "*", "*"]), ((0, 1), (2025, 7)))
+        self.assertEqual(datetime_pattern(["*"] * 6), ((), ()))
+
+    def test_matcher_compares_fixed_positions(self):
+        before = compile_datetime_matcher(["*", "*", "*", "9", "0", "*"], "<")
+        self.assertTrue(before(datetime(2025, 7, 10, 8, 59, 59)))   # Expected: True
+        self.assertFalse(before(datetime(2025, 7, 10, 9, 0, 59)))   # Expected: False, seconds are a wildcard
+        self.assertFalse(before(datetime(2025, 7, 10, 10, 0, 0)))   # Expected: False
+
+    def test_matcher_single_position(self):
+        at_eight = compile_datetime_matcher(["*", "*", "*", "8", "*", "*"], "==")
+        self.assertTrue(at_eight(datetime(2025, 1, 1, 8, 15)))      # Expected: True
+        self.assertFalse(at_eight(datetime(2025, 1, 1, 9, 15)))     # Expected: False
+
+    def test_matcher_only_wildcards(self):
+        self.assertTrue(compile_datetime_matcher(["*"] * 6, "<=")(datetime(2025, 1, 1)))   # Expected: True
+        self.assertFalse(compile_datetime_matcher(["*"] * 6, ">")(datetime(2025, 1, 1)))   # Expected: False
+
+    def test_matcher_unknown_operator(self):
+        with self.assertRaises(ValueError):
+            compile_datetime_matcher(["*"] * 6, "<>")
+
+
+class TestTimedeltaAsOf(unittest.TestCase):
+
+    def setUp(self):
+        self.as_of = datetime(2025, 7, 11, 12, 0, 0)
+        self.data = {"db1": {"f1": self.as_of - timedelta(hours=1)}}
+
+    def make_condition(self, op, content):
+        return {"type": "condition", "db": "db1", "field": "f1", "op": op, "value": {"type": "timedelta", "content": content}}
+
+    def test_equal_with_fixed_as_of(self):
+        # Expect True because the age is exactly one hour at as_of
+        cond = self.make_condition("==", ["0", "0", "0", "1", "0", "0"])
+        self.assertTrue(condition_evaluator(cond, self.data, as_of=self.as_of))
+        self.assertTrue(compile_rule(cond, as_of=self.as_of)(self.data))
+
+    def test_operators_with_fixed_as_of(self):
+        for op, content, expected in [
+            (">", ["0", "0", "0", "0", "30", "0"], True),
+            (">", ["0", "0", "0", "1", "0", "0"], False),
+            (">=", ["0", "0", "0", "1", "0", "0"], True),
+            ("<", ["0", "0", "0", "2", "0", "0"], True),
+            ("<", ["0", "0", "0", "1", "0", "0"], False),
+            ("<=", ["0", "0", "0", "1", "0", "0"], True),
+            ("<=", ["0", "0", "0", "0", "59", "59"], False),
+        ]:
+            cond = self.make_condition(op, content)
+            self.assertEqual(condition_evaluator(cond, self.data, as_of=self.as_of), expected, (op, content))
+            self.assertEqual(compile_rule(cond, as_of=self.as_of)(self.data), expected, (op, content))
+
+    def test_historical_rerun(self):
+        # one day later the same position is older than a day
+        cond = self.make_condition(">", ["0", "0", "1", "0", "0", "0"])
+        self.assertFalse(evaluate(cond, self.data, as_of=self.as_of))
+        self.assertTrue(evaluate(cond, self.data, as_of=self.as_of + timedelta(days=1)))
+
+    def test_unknown_operator(self):
+        with self.assertRaises(ValueError):
+            condition_evaluator(self.make_condition("<>", ["0"] * 6), self.data, as_of=self.as_of)
+
 
 if __name__ == "__main__":
     unittest.main()
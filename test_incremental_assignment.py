@@ -0,0 +1,105 @@
+import unittest
+import random
+from datetime import datetime, timedelta
+from rule_widget import process_input_string, evaluate
+from rule_compiler import compile_rule
+from incremental_assignment import IncrementalAssigner, changed_fields
+
+VALID_FIELDS = {
+    "sec.region": "string",
+    "sec.price": "float",
+    "pos.direction": "string",
+    "pos.remaining_quantity": "float",
+    "pos.pnl": "float",
+    "pos.first_trade": "datetime",
+    "pos.last_trade": "datetime",
+}
+
+MAPPINGS = {
+    "de_long": ['?sec.region == "DE"?', '?pos.direction == "LONG"?'],
+    "us_cheap": ['$AND(?sec.region == "US"?, ?sec.price < 10?)'],
+    "morning": ['?pos.first_trade < (*,*,*,9,0,*)?'],
+    "closed_recent": ['?pos.remaining_quantity == 0?', '?pos.last_trade < {0,0,1,0,0,0}?'],
+    "losing": ['?pos.pnl < 0?'],
+    "rest": [],
+}
+
+
+def make_mappings():
+    return {key: {"rule_dicts": [process_input_string(rule, VALID_FIELDS) for rule in rules]} for key, rules in MAPPINGS.items()}
+
+
+def first_match(mapping_assignments, data, as_of):
+    for key, mapping in mapping_assignments.items():
+        if all(evaluate(rule, data, as_of=as_of) for rule in mapping["rule_dicts"]):
+            return key
+    return None
+
+
+class TestIncrementalAssigner(unittest.TestCase):
+
+    def setUp(self):
+        self.as_of = datetime(2025, 7, 11, 12, 0, 0)
+        self.mappings = make_mappings()
+        rng = random.Random(4)
+        self.records = {}
+        for jj in range(100):
+            self.records[jj] = {
+                "sec": {"region": rng.choice(["DE", "US", "AT"]), "price": rng.choice([5, 20])},
+                "pos": {"direction": rng.choice(["LONG", "SHORT"]), "remaining_quantity": rng.choice([0.0, 4.0]),
+                        "pnl": rng.choice([-5.0, 3.0]), "first_trade": datetime(2025, 7, 11, rng.choice([8, 10]), 30),
+                        "last_trade": self.as_of - timedelta(hours=rng.choice([2, 30]))},
+            }
+
+    def test_compiled_rule_fields(self):
+        rule = compile_rule(process_input_string('$AND(?sec.region == "US"?, $NOT(?pos.pnl < 0?))', VALID_FIELDS))
+        self.assertEqual(rule.fields, frozenset({"sec.region", "pos.pnl"}))
+
+    def test_intraday_updates(self):
+        assigner = IncrementalAssigner(self.mappings, VALID_FIELDS, as_of=self.as_of)
+        for record_id, record in self.records.items():
+            self.assertEqual(assigner.assign(record_id, record), first_match(self.mappings, record, self.as_of))
+
+        rng = random.Random(9)
+        for _ in range(3):
+            for record_id, record in self.records.items():
+                changed = {"sec": record["sec"], "pos": dict(record["pos"], remaining_quantity=rng.choice([0.0, 4.0]),
+                                                             pnl=rng.choice([-5.0, 3.0]))}
+                fields = {"pos.remaining_quantity", "pos.pnl"}
+                self.assertEqual(assigner.update(record_id, changed, fields), first_match(self.mappings, changed, self.as_of))
+                self.records[record_id] = changed
+
+    def test_only_dependent_mappings_are_evaluated(self):
+        assigner = IncrementalAssigner(self.mappings, as_of=self.as_of)
+        record = {"sec": {"region": "AT", "price": 20},
+                  "pos": {"direction": "SHORT", "remaining_quantity": 4.0, "pnl": 3.0,
+                          "first_trade": datetime(2025, 7, 11, 10, 0), "last_trade": self.as_of}}
+        self.assertEqual(assigner.assign("a", record), "rest")
+        evaluated = assigner.evaluated
+        changed = {"sec": record["sec"], "pos": dict(record["pos"], pnl=-1.0)}
+        self.assertEqual(assigner.update("a", changed, {"pos.pnl"}), "losing")
+        self.assertEqual(assigner.evaluated - evaluated, 1)
+        self.assertEqual(assigner.depends_on("pos.pnl"), ["losing"])
+
+    def test_changed_fields_computed_from_last_record(self):
+        assigner = IncrementalAssigner(self.mappings, as_of=self.as_of)
+        record = self.records[0]
+        assigner.assign(0, record)
+        changed = {"sec": dict(record["sec"], region="US", price=5), "pos": record["pos"]}
+        self.assertEqual(changed_fields(record, changed), {"sec.region", "sec.price"})
+        self.assertEqual(assigner.update(0, changed), first_match(self.mappings, changed, self.as_of))
+
+    def test_set_as_of_invalidates_time_dependent_mappings(self):
+        assigner = IncrementalAssigner(self.mappings, as_of=self.as_of)
+        record = {"sec": {"region": "AT", "price": 20},
+                  "pos": {"direction": "SHORT", "remaining_quantity": 0.0, "pnl": 3.0,
+                          "first_trade": datetime(2025, 7, 11, 10, 0), "last_trade": self.as_of - timedelta(hours=20)}}
+        self.assertEqual(assigner.assign("a", record), "closed_recent")
+        later = self.as_of + timedelta(hours=5)
+        assigner.set_as_of(later)
+        self.assertEqual(assigner.refresh("a", record), first_match(self.mappings, record, later))
+        self.assertEqual(assigner.refresh("a", record), "rest")
+
+
+if __name__ == "__main__":
+    unittest.main()
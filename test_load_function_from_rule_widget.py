@@ -1,6 +1,10 @@
 import unittest
 import copy
+import json
+import pickle
+import time
 from rule_widget import reconstruct_expression, process_input_string
+from rule_widget import ParseCache, thaw, tokenize_condition
 
 # ----- bring these into scope ------------------------------------------------
 # from my_module import reconstruct_expression, parse_expression_string
@@ -165,6 +169,89 @@ class TestRoundTripDictString(unittest.TestCase):
         self.round_trip(teststring)
 
 
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ParseCache(maxsize=2)
+        self.rule = '$AND(?sec.price:=/10,20/?,$NOT(?sec.region=="US"?))'
+
+    def test_same_ast_as_process_input_string(self):
+        self.assertEqual(self.cache.get(self.rule, VALID_FIELDS), process_input_string(self.rule, VALID_FIELDS))
+
+    def test_hits_and_misses(self):
+        first = self.cache.get(self.rule, VALID_FIELDS)
+        # whitespace outside of string literals does not matter
+        second = self.cache.get('  $AND(?sec.price:=/10,20/?,$NOT(?sec.region=="US"?))  ', VALID_FIELDS)
+        self.assertIs(first, second)
+        info = self.cache.info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 1, 1))
+
+    def test_string_literals_are_not_normalized(self):
+        first = self.cache.get('?sec.region == "a  b"?', VALID_FIELDS)
+        second = self.cache.get('?sec.region == "a b"?', VALID_FIELDS)
+        self.assertEqual(first["value"]["content"], "a  b")
+        self.assertEqual(second["value"]["content"], "a b")
+
+    def test_schema_is_part_of_the_key(self):
+        self.cache.get(self.rule, VALID_FIELDS)
+        # a different schema has to validate again
+        with self.assertRaises(ValueError):
+            self.cache.get(self.rule, {"sec.region": "string"})
+        self.assertEqual(self.cache.info().misses, 2)
+
+    def test_lru_eviction(self):
+        self.cache.get('?sec.region == "A"?', VALID_FIELDS)
+        self.cache.get('?sec.region == "B"?', VALID_FIELDS)
+        self.cache.get('?sec.region == "A"?', VALID_FIELDS)
+        self.cache.get('?sec.region == "C"?', VALID_FIELDS)  # evicts B
+        self.cache.get('?sec.region == "A"?', VALID_FIELDS)
+        self.cache.get('?sec.region == "B"?', VALID_FIELDS)
+        info = self.cache.info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (2, 4, 2))
+
+    def test_cached_ast_is_immutable(self):
+        ast = self.cache.get(self.rule, VALID_FIELDS)
+        with self.assertRaises(TypeError):
+            ast["eval_result"] = True
+        with self.assertRaises(TypeError):
+            ast["args"].append({})
+        with self.assertRaises(TypeError):
+            ast["args"][0]["value"].update({"low": "0"})
+
+    def test_frozen_ast_is_still_usable(self):
+        ast = self.cache.get(self.rule, VALID_FIELDS)
+        self.assertEqual(reconstruct_expression(ast), reconstruct_expression(process_input_string(self.rule, VALID_FIELDS)))
+        self.assertEqual(json.loads(json.dumps(ast)), thaw(ast))
+        self.assertEqual(pickle.loads(pickle.dumps(ast)), ast)
+        mutable = copy.deepcopy(ast)
+        mutable["eval_result"] = True
+
+
+
+class TestMalformedLiterals(unittest.TestCase):
+
+    def assert_fails_fast(self, condition):
+        start = time.perf_counter()
+        with self.assertRaises(SyntaxError):
+            tokenize_condition(condition)
+        self.assertLess(time.perf_counter() - start, 0.5, condition[:40])
+
+    def test_unclosed_literals(self):
+        for opening in ("[", "{", "("):
+            self.assert_fails_fast(f"a.b == {opening}" + "1" * 40)
+
+    def test_malformed_large_lists(self):
+        numbers = ",".join(["1234567"] * 50000)
+        self.assert_fails_fast(f"a.b := [{numbers},x]")
+        self.assert_fails_fast(f"a.b := [{numbers}")
+        isins = ",".join(f'"DE{jj:010d}"' for jj in range(50000))
+        self.assert_fails_fast(f"a.b := [{isins}")
+
+    def test_well_formed_literals(self):
+        self.assertEqual(tokenize_condition("a.b := [1,2,3,]")[-1], ("NUMBER_LIST", ["1", "2", "3"]))
+        self.assertEqual(tokenize_condition("a.b == (*,*,*,8,50,*)")[-1], ("DATETIME", ["*", "*", "*", "8", "50", "*"]))
+        self.assertEqual(tokenize_condition("a.b < {0,0,1,0,0,0}")[-1], ("TIMEDELTA", ["0", "0", "1", "0", "0", "0"]))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import json
+import random
+from datetime import datetime
+from rule_widget import process_input_string, evaluate, EvaluationStats
+from mapping_rules import build_rule_set
+
+VALID_FIELDS = {
+    "sec.region": "string",
+    "sec.price": "float",
+    "pos.first_trade": "datetime",
+    "pos.last_trade": "datetime",
+    "pos.remaining_quantity": "float",
+}
+
+
+def first_match(mapping_assignments, data):
+    # reference: mapping_evaluator from position_assignment_filer
+    for key, mapping in mapping_assignments.items():
+        if all(evaluate(rule, data) for rule in mapping.get("rule_dicts", [])):
+            return key
+    return None
+
+
+def make_records(count, seed=3):
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        first_trade = datetime(2025, 7, rng.randint(1, 28), rng.choice([8, 9, 13]), rng.randint(0, 59), rng.randint(0, 59))
+        records.append({
+            "sec": {"region": rng.choice(["DE", "US", "AT"]), "price": rng.choice([1, 5, 12, 30])},
+            "pos": {"first_trade": first_trade, "last_trade": first_trade.replace(minute=rng.randint(0, 59)),
+                    "remaining_quantity": rng.choice([0.0, 0.0, 5.0])},
+        })
+    return records
+
+
+def make_mappings(count):
+    # many mappings sharing a handful of predicates
+    shared = ['?sec.region == "DE"?', '?sec.region == "US"?', '?pos.remaining_quantity == 0?',
+              '?sec.price > 10?', '?pos.first_trade < (*,*,*,9,0,*)?', '?pos.first_trade >= (*,*,*,13,0,0)?']
+    mappings = {}
+    for jj in range(count):
+        rules = [shared[jj % 2], shared[2 + jj % 4]]
+        if jj % 3 == 0:
+            rules.append(f"$NOT({shared[(jj + 1) % 6]})")
+        rules.append(f"?pos.last_trade < (*,*,*,*,{jj % 60},*)?")
+        mappings[f"mapping_{jj}"] = {"label": f"Mapping {jj}", "temp": False,
+                                     "rule_dicts": [process_input_string(rule, VALID_FIELDS) for rule in rules]}
+    return mappings
+
+
+class TestMappingRuleSet(unittest.TestCase):
+
+    def setUp(self):
+        self.records = make_records(200)
+
+    def test_test_json_same_as_first_match(self):
+        with open("test.json", "r", encoding="utf-8") as f:
+            assigners = json.load(f)
+        rule_set = build_rule_set(assigners)
+        for record in self.records:
+            self.assertEqual(rule_set.assign(record), first_match(assigners, record), record)
+
+    def test_large_rule_set_same_as_first_match(self):
+        mappings = make_mappings(60)
+        rule_set = build_rule_set(mappings, VALID_FIELDS)
+        for record in self.records:
+            self.assertEqual(rule_set.assign(record), first_match(mappings, record), record)
+
+    def test_conditions_are_shared(self):
+        rule_set = build_rule_set(make_mappings(60))
+        info = rule_set.info()
+        self.assertEqual(info.mappings, 60)
+        self.assertEqual(info.total_conditions, 200)
+        # 6 shared predicates plus 60 distinct last_trade minutes
+        self.assertEqual(info.distinct_conditions, 66)
+
+    def test_each_condition_evaluated_once_per_record(self):
+        mappings = make_mappings(60)
+        rule_set = build_rule_set(mappings)
+        # a record no mapping matches walks through every mapping
+        record = {"sec": {"region": "AT", "price": 1},
+                  "pos": {"first_trade": datetime(2025, 7, 1, 8, 0, 0), "last_trade": datetime(2025, 7, 1, 8, 0, 0),
+                          "remaining_quantity": 0.0}}
+        stats = EvaluationStats()
+        self.assertIsNone(rule_set.assign(record, stats))
+        # only the region conditions run, every other mapping reuses their result
+        self.assertEqual(stats.evaluated, 2)
+        self.assertEqual(stats.shared_hits, 58)
+        self.assertEqual(stats.skipped, 0)
+
+    def test_skipped_and_shared_hits_are_separate(self):
+        mappings = {
+            "de_expensive": {"rule_dicts": [process_input_string('$AND(?sec.region == "DE"?, ?sec.price > 10?)', VALID_FIELDS)]},
+            "de": {"rule_dicts": [process_input_string('?sec.region == "DE"?', VALID_FIELDS)]},
+        }
+        record = {"sec": {"region": "US", "price": 20}}
+        stats = EvaluationStats()
+        self.assertIsNone(build_rule_set(mappings).assign(record, stats))
+        # price is short-circuited like in evaluate, region is shared by the second mapping
+        plain = EvaluationStats()
+        evaluate(mappings["de_expensive"]["rule_dicts"][0], record, plain)
+        self.assertEqual((stats.evaluated, stats.skipped, stats.shared_hits), (plain.evaluated, plain.skipped, 1))
+
+    def test_evaluations_reduced(self):
+        mappings = make_mappings(60)
+        rule_set = build_rule_set(mappings)
+        shared_stats = EvaluationStats()
+        plain_stats = EvaluationStats()
+        for record in self.records:
+            rule_set.assign(record, shared_stats)
+            for key, mapping in mappings.items():
+                if all(evaluate(rule, record, plain_stats) for rule in mapping["rule_dicts"]):
+                    break
+        self.assertLess(shared_stats.evaluated * 3, plain_stats.evaluated)
+
+    def test_schema_is_validated(self):
+        mappings = {"broken": {"rule_dicts": [
+            {"type": "condition", "db": "sec", "field": "unknown", "op": "==", "value": {"type": "string", "content": "DE"}}]}}
+        with self.assertRaises(ValueError):
+            build_rule_set(mappings, VALID_FIELDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import typing
+from datetime import datetime
+from pydantic import BaseModel, Field
+from models import PositionModel, SecurityModel
+from rule_widget import process_input_string, evaluate
+from rule_compiler import compile_rule
+from mapping_rules import build_rule_set
+from record_views import view_class, make_views, bulk_validate
+from test_mapping_rules import VALID_FIELDS, make_records
+
+
+class Basket(BaseModel):
+    name: str
+    members: typing.List[str] = []
+    weights: typing.List[float] = Field(default_factory=list)
+
+
+class TestRecordViews(unittest.TestCase):
+
+    def test_view_fields(self):
+        PositionView = view_class(PositionModel)
+        self.assertIs(view_class(PositionModel), PositionView)
+        view = PositionView({"_id": "abc", "position_uid": "p1", "remaining_quantity": 5.0, "unknown": 1})
+        self.assertEqual(view.remaining_quantity, 5.0)
+        self.assertEqual(view["position_uid"], "p1")
+        self.assertEqual(view.get("_id"), "abc")
+        self.assertIsNone(view.get("pnl"))
+        self.assertIsNone(view.get("unknown"))
+        self.assertEqual(view.get("get", 7), 7)
+        self.assertEqual(PositionView.TYPES["first_trade"], "datetime")
+        self.assertFalse(hasattr(view, "__dict__"))
+        with self.assertRaises(KeyError):
+            view["unknown"]
+
+    def test_defaults(self):
+        security = view_class(SecurityModel)({"isin": "DE1", "region": "DE", "ref_ticker": "A", "ref_exchange": "X"})
+        self.assertEqual(security.sector, "unknown")
+        BasketView = view_class(Basket)
+        first, second = BasketView({"name": "a"}), BasketView({"name": "b"})
+        first.members.append("x")
+        self.assertEqual(second.members, [])
+        self.assertEqual(second.weights, [])
+
+    def test_evaluation_on_views(self):
+        as_of = datetime(2025, 7, 11, 12, 0, 0)
+        SecurityView, PositionView = view_class(SecurityModel), view_class(PositionModel)
+        records = make_records(200)
+        views = [{"sec": SecurityView(record["sec"]), "pos": PositionView(record["pos"])} for record in records]
+        rule = process_input_string('$AND(?sec.region == "DE"?, ?pos.first_trade < (*,*,*,9,0,*)?)', VALID_FIELDS)
+        compiled = compile_rule(rule, as_of=as_of)
+        mappings = {key: {"rule_dicts": [process_input_string(rule, VALID_FIELDS) for rule in rules]} for key, rules in {
+            "de_morning": ['?sec.region == "DE"?', '?pos.first_trade < (*,*,*,9,0,*)?'],
+            "flat": ['?pos.remaining_quantity == 0?'],
+            "us": ['?sec.region := ["US","AT"]?'],
+        }.items()}
+        rule_set = build_rule_set(mappings, as_of=as_of)
+        for record, view in zip(records, views):
+            self.assertEqual(evaluate(rule, view, as_of=as_of), evaluate(rule, record, as_of=as_of))
+            self.assertEqual(compiled(view), compiled(record))
+            self.assertEqual(rule_set.assign(view), rule_set.assign(record))
+
+    def test_bulk_validate(self):
+        positions = [{"position_uid": "p1", "remaining_quantity": 1.0},
+                     {"remaining_quantity": "x"},
+                     {"position_uid": "p3", "first_trade": "not a date"}]
+        invalid = bulk_validate(PositionModel, positions)
+        self.assertEqual([index for index, _ in invalid], [1, 2])
+        self.assertEqual({error["loc"] for error in invalid[0][1]}, {("position_uid",), ("remaining_quantity",)})
+        self.assertEqual(bulk_validate(PositionModel, make_views(PositionModel, positions[:1])), [])
+        view = view_class(PositionModel)(positions[0])
+        self.assertEqual(view.validate().position_uid, "p1")
+
+
+if __name__ == "__main__":
+    unittest.main()
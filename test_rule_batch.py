@@ -0,0 +1,161 @@
+import unittest
+import random
+from unittest import mock
+from datetime import datetime, timedelta
+from decimal import Decimal
+import numpy as np
+from rule_widget import process_input_string, evaluate
+from rule_batch import evaluate_batch, evaluate_records, build_columns, assign_batch, BatchEvaluator
+
+VALID_FIELDS = {
+    "sec.region": "string",
+    "sec.price": "float",
+    "sec.tdg": "bool",
+    "sec.description": "string",
+    "pos.first_trade": "datetime",
+    "pos.last_trade": "datetime",
+    "pos.remaining_quantity": "float",
+}
+
+RULES = [
+    '?sec.region == "DE"?',
+    '?sec.description <> "AG"?',
+    # not accepted by validate_tree, but supported by condition_evaluator
+    {"type": "condition", "db": "sec", "field": "region", "op": ":=", "value": {"type": "string", "content": "DE US"}},
+    '?sec.region := ["DE","AT","CH"]?',
+    '?sec.price > 10?',
+    '?sec.price <= 10?',
+    '?sec.price := /5,20/?',
+    '?sec.tdg == TRUE?',
+    '?pos.remaining_quantity == 0?',
+    '?pos.first_trade > (*,*,*,8,50,*)?',
+    '?pos.first_trade < (*,*,*,9,0,*)?',
+    '?pos.first_trade >= (2025,3,*,*,*,*)?',
+    '?pos.first_trade <= (*,*,15,12,*,*)?',
+    '?pos.first_trade == (*,*,*,9,*,*)?',
+    '?pos.last_trade < {0,0,3,0,0,0}?',
+    '?pos.last_trade >= {0,0,10,0,0,0}?',
+    '$AND(?sec.region == "DE"?, ?pos.first_trade > (*,*,*,8,50,*)?, ?pos.first_trade < (*,*,*,9,0,*)?)',
+    '$OR($NOT(?sec.region := ["DE","US"]?), ?sec.price := /10,20/?)',
+    '$AND($OR(?sec.tdg == TRUE?, ?sec.price >= 10?), $NOT(?pos.remaining_quantity == 0?))',
+]
+
+
+def make_records(count, as_of, seed=7):
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        first_trade = datetime(2025, rng.randint(1, 12), rng.randint(1, 28), rng.randint(7, 17), rng.randint(0, 59), rng.randint(0, 59))
+        records.append({
+            "sec": {
+                "region": rng.choice(["DE", "US", "AT", "CA"]),
+                "price": rng.choice([1, 5, 10, 12.5, 20, 30]),
+                "tdg": rng.choice([True, False]),
+                "description": rng.choice(["Siemens AG", "Apple Inc", "Bayer AG"]),
+            },
+            "pos": {
+                "first_trade": first_trade,
+                "last_trade": as_of - timedelta(days=rng.randint(0, 20), hours=rng.randint(0, 23)),
+                "remaining_quantity": rng.choice([0.0, 0.0, 5.0, -3.0]),
+            },
+        })
+    return records
+
+
+class TestBatchEvaluation(unittest.TestCase):
+
+    def setUp(self):
+        self.as_of = datetime(2025, 7, 11, 12, 0, 0)
+        self.records = make_records(300, self.as_of)
+
+    def test_same_result_as_record_evaluation(self):
+        for rule_string in RULES:
+            ast = process_input_string(rule_string, VALID_FIELDS) if isinstance(rule_string, str) else rule_string
+            result = evaluate_records(ast, self.records, as_of=self.as_of)
+            # timedelta rules compare against now in condition_evaluator, shift the records accordingly
+            shift = datetime.now() - self.as_of
+            expected = []
+            for record in self.records:
+                shifted = {"sec": record["sec"], "pos": dict(record["pos"], last_trade=record["pos"]["last_trade"] + shift)}
+                expected.append(evaluate(ast, shifted))
+            self.assertEqual(result.tolist(), expected, rule_string)
+
+    def test_result_is_bool_array(self):
+        ast = process_input_string('?sec.region == "DE"?', VALID_FIELDS)
+        result = evaluate_batch(ast, {"sec.region": ["DE", "US", None]})
+        self.assertEqual(result.dtype, np.bool_)
+        self.assertEqual(result.tolist(), [True, False, False])
+
+    def test_missing_values_are_false(self):
+        # Expect False instead of a TypeError for None values
+        ast = process_input_string('$OR(?sec.price > 10?, ?pos.first_trade == (*,*,*,9,*,*)?)', VALID_FIELDS)
+        columns = {"sec.price": [None, 11], "pos.first_trade": [None, None]}
+        self.assertEqual(evaluate_batch(ast, columns).tolist(), [False, True])
+
+    def test_datetime64_columns(self):
+        ast = process_input_string('?pos.first_trade < (*,*,*,9,0,*)?', VALID_FIELDS)
+        columns = {"pos.first_trade": np.array(["2025-07-10T08:59:00", "2025-07-10T09:00:30", "NaT"], dtype="datetime64[s]")}
+        self.assertEqual(evaluate_batch(ast, columns).tolist(), [True, False, False])
+
+    def test_columns_of_different_length(self):
+        ast = process_input_string('$AND(?sec.region == "DE"?, ?sec.price > 1?)', VALID_FIELDS)
+        with self.assertRaises(ValueError):
+            evaluate_batch(ast, {"sec.region": ["DE"], "sec.price": [1, 2]})
+
+    def test_list_membership_without_row_loop(self):
+        ast = process_input_string('?sec.region := ["DE","AT","CH"]?', VALID_FIELDS)
+        columns = build_columns(self.records, ["sec.region"])
+        self.assertEqual(columns["sec.region"].dtype, object)
+        with mock.patch.object(BatchEvaluator, "row_mask", side_effect=AssertionError("row_mask called")):
+            result = evaluate_batch(ast, columns)
+        self.assertEqual(result.tolist(), [record["sec"]["region"] in ("DE", "AT", "CH") for record in self.records])
+
+    def test_list_membership_unhashable_values(self):
+        ast = process_input_string('?sec.region := ["DE","AT"]?', VALID_FIELDS)
+        columns = {"sec.region": np.array(["DE", None, ["DE"], "US"], dtype=object)}
+        self.assertEqual(evaluate_batch(ast, columns).tolist(), [True, False, False, False])
+
+    def test_mixed_type_columns(self):
+        regions = ["DE", np.str_("DE"), 1, None, True, ["DE"], "US"]
+        prices = [np.int64(12), Decimal("12.5"), np.float32(3), "12", None, True, 10]
+        records = [{"sec": {"region": region, "price": price, "tdg": price}} for region, price in zip(regions, prices)]
+        rules = ['?sec.region == "DE"?', '?sec.price > 10?', '?sec.price <= 10?', '?sec.price := /5,20/?',
+                 '?sec.tdg == TRUE?', '$AND(?sec.region == "DE"?, ?sec.price > 10?)']
+        for rule in rules:
+            ast = process_input_string(rule, VALID_FIELDS)
+            expected = []
+            for record in records:
+                try:
+                    expected.append(bool(evaluate(ast, record)))
+                except TypeError:
+                    # None > 10 and "12" > 10 raise in evaluate, the batch is False there
+                    expected.append(False)
+            self.assertEqual(evaluate_records(ast, records).tolist(), expected, rule)
+
+    def test_numeric_column_compared_with_string(self):
+        ast = process_input_string('$OR(?sec.region == "DE"?, ?sec.price > 10?)', VALID_FIELDS)
+        result = evaluate_batch(ast, {"sec.region": np.array([1, 2, 3]), "sec.price": np.array([5, 20, 30])})
+        self.assertEqual(result.tolist(), [False, True, True])
+        ast = process_input_string('?sec.tdg == TRUE?', VALID_FIELDS)
+        self.assertEqual(evaluate_batch(ast, {"sec.tdg": np.array(["TRUE", "x"])}).tolist(), [False, False])
+
+    def test_assign_batch_first_match(self):
+        mapping_assignments = {
+            "de_morning": {"rule_dicts": [process_input_string('?sec.region == "DE"?', VALID_FIELDS),
+                                          process_input_string('?pos.first_trade < (*,*,*,9,0,*)?', VALID_FIELDS)]},
+            "de": {"rule_dicts": [process_input_string('?sec.region == "DE"?', VALID_FIELDS)]},
+            "expensive": {"rule_dicts": [process_input_string('?sec.price > 10?', VALID_FIELDS)]},
+        }
+        columns = build_columns(self.records, ["sec.region", "sec.price", "pos.first_trade"])
+        result = assign_batch(mapping_assignments, columns, as_of=self.as_of)
+        for record, key in zip(self.records, result):
+            expected = None
+            for mapping_key, mapping in mapping_assignments.items():
+                if all(evaluate(rule, record) for rule in mapping["rule_dicts"]):
+                    expected = mapping_key
+                    break
+            self.assertEqual(key, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,243 @@
+import unittest
+from datetime import datetime, timedelta
+from rule_widget import condition_evaluator, process_input_string, evaluate_tree_conditions, evaluate_expression
+from rule_compiler import compile_rule, AdaptiveRule, NodeStats, reorder_ast
+
+VALID_FIELDS = {
+    "sec.region": "string",
+    "sec.price": "float",
+    "sec.tdg": "bool",
+    "pos.first_trade": "datetime",
+    "pos.remaining_quantity": "float",
+}
+
+
+class TestCompiledConditions(unittest.TestCase):
+
+    def setUp(self):
+        self.ref_datetime = datetime(2025, 7, 10, 15, 30, 45)
+        self.data = {
+            "db1": {
+                "text": "hello",
+                "number": 5,
+                "letters": ["a", "b", "c"],
+                "when": self.ref_datetime,
+                "flag": True,
+            }
+        }
+
+    def make_condition(self, field, op, value):
+        return {"type": "condition", "db": "db1", "field": field, "op": op, "value": value}
+
+    def assert_same_as_evaluator(self, cond):
+        # the compiled closure has to agree with condition_evaluator
+        self.assertEqual(compile_rule(cond)(self.data), condition_evaluator(cond, self.data), cond)
+
+    def test_string_conditions(self):
+        for op, content in [("==", "hello"), ("==", "world"), ("<>", "ell"), ("<>", "xyz"), (":=", "hello world"), (":=", "world")]:
+            self.assert_same_as_evaluator(self.make_condition("text", op, {"type": "string", "content": content}))
+
+    def test_number_conditions(self):
+        for op in ["==", "<", "<=", ">", ">="]:
+            for content in [4, 5, 6]:
+                self.assert_same_as_evaluator(self.make_condition("number", op, {"type": "number", "content": content}))
+
+    def test_range_conditions(self):
+        for low, high in [("3", "7"), (5, 5), ("6", "9"), ("-2", "4")]:
+            self.assert_same_as_evaluator(self.make_condition("number", ":=", {"type": "range", "low": low, "high": high}))
+
+    def test_list_conditions(self):
+        self.assert_same_as_evaluator(self.make_condition("text", ":=", {"type": "list", "content": ["hello", "x"]}))
+        self.assert_same_as_evaluator(self.make_condition("text", ":=", {"type": "list", "content": ["x"]}))
+        self.assert_same_as_evaluator(self.make_condition("letters", "<>", {"type": "list", "content": ["a", "b"]}))
+        self.assert_same_as_evaluator(self.make_condition("letters", "<>", {"type": "list", "content": ["a", "x"]}))
+
+    def test_list_conditions_with_unusual_references(self):
+        data = {"db1": {"letters": "abc", "nested": [["a"], "b"], "listed": ["a"], "missing": None}}
+        cases = [
+            # string reference, <> keeps substring semantics
+            ("letters", "<>", ["a", "bc"]),
+            ("letters", "<>", ["a", "x"]),
+            # unhashable reference for :=
+            ("listed", ":=", ["a", "b"]),
+            # unhashable elements in the reference for <>
+            ("nested", "<>", ["b"]),
+            ("nested", "<>", ["a"]),
+        ]
+        for field, op, content in cases:
+            cond = self.make_condition(field, op, {"type": "list", "content": content})
+            self.assertEqual(compile_rule(cond)(data), condition_evaluator(cond, data), (field, op, content))
+        # None references raise the same TypeError as condition_evaluator
+        cond = self.make_condition("missing", "<>", {"type": "list", "content": ["a"]})
+        with self.assertRaises(TypeError):
+            compile_rule(cond)(data)
+
+    def test_large_list_membership(self):
+        isins = [f"DE{i:010d}" for i in range(20000)]
+        rule = compile_rule(self.make_condition("text", ":=", {"type": "list", "content": isins}))
+        self.assertTrue(rule({"db1": {"text": "DE0000019999"}}))
+        self.assertFalse(rule({"db1": {"text": "US0000000001"}}))
+
+    def test_datetime_conditions(self):
+        patterns = [
+            ["*", "*", "*", "*", "*", "*"],
+            ["*", "*", "*", "15", "30", "*"],
+            ["*", "*", "*", "8", "50", "*"],
+            ["*", "*", "*", "16", "0", "*"],
+            [2025, 7, 10, 15, 30, 45],
+            [2025, "*", "*", "*", 31, 0],
+            ["*", 7, 9, "*", 30, 45],
+            ["*", "*", "*", "*", "*", 46],
+        ]
+        for op in ["==", "<", "<=", ">", ">="]:
+            for pattern in patterns:
+                self.assert_same_as_evaluator(self.make_condition("when", op, {"type": "datetime", "content": pattern}))
+
+    def test_timedelta_conditions(self):
+        # the reference is far enough away from the bound that the moving clock does not matter
+        data = {"db1": {"when": datetime.now() - timedelta(hours=1)}}
+        cond = self.make_condition("when", ">", {"type": "timedelta", "content": ["0", "0", "0", "0", "30", "0"]})
+        self.assertTrue(compile_rule(cond)(data))  # Expected: True
+        cond = self.make_condition("when", ">=", {"type": "timedelta", "content": ["0", "0", "1", "0", "0", "0"]})
+        self.assertFalse(compile_rule(cond)(data))  # Expected: False
+
+    def test_bool_conditions(self):
+        self.assert_same_as_evaluator(self.make_condition("flag", "==", {"type": "bool", "content": True}))
+        self.assert_same_as_evaluator(self.make_condition("flag", "==", {"type": "bool", "content": False}))
+
+    def test_unknown_value_type(self):
+        # Expect ValueError at compile time instead of a silent None per record
+        cond = self.make_condition("text", "==", {"type": "unknown", "content": "abc"})
+        with self.assertRaises(ValueError):
+            compile_rule(cond)
+
+    def test_unknown_operator(self):
+        cond = self.make_condition("text", "???", {"type": "string", "content": "abc"})
+        with self.assertRaises(ValueError):
+            compile_rule(cond)
+
+
+class TestCompiledRules(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [
+            {"sec": {"region": "DE", "price": 3, "tdg": True},
+             "pos": {"first_trade": datetime(2025, 7, 10, 8, 55, 0), "remaining_quantity": 0.0}},
+            {"sec": {"region": "US", "price": 12, "tdg": False},
+             "pos": {"first_trade": datetime(2025, 7, 10, 9, 5, 0), "remaining_quantity": 10.0}},
+            {"sec": {"region": "CA", "price": 4, "tdg": True},
+             "pos": {"first_trade": datetime(2025, 7, 10, 14, 0, 0), "remaining_quantity": 0.0}},
+        ]
+
+    def assert_same_as_two_phase(self, rule_string):
+        ast = process_input_string(rule_string, VALID_FIELDS)
+        rule = compile_rule(ast, VALID_FIELDS)
+        for record in self.records:
+            evaluate_tree_conditions(ast, record)
+            self.assertEqual(rule(record), evaluate_expression(ast), (rule_string, record))
+
+    def test_and(self):
+        self.assert_same_as_two_phase('$AND(?sec.region == "DE"?, ?pos.first_trade > (*,*,*,8,50,*)?, ?pos.first_trade < (*,*,*,9,0,*)?)')
+
+    def test_or_not(self):
+        self.assert_same_as_two_phase('$OR($NOT(?sec.region := ["DE","US"]?), ?sec.price := /10,20/?)')
+
+    def test_nested(self):
+        self.assert_same_as_two_phase('$AND($OR(?sec.tdg == TRUE?, ?sec.price >= 10?), $NOT(?pos.remaining_quantity == 0?))')
+
+    def test_schema_is_validated(self):
+        ast = {"type": "condition", "db": "sec", "field": "unknown", "op": "==", "value": {"type": "string", "content": "DE"}}
+        with self.assertRaises(ValueError):
+            compile_rule(ast, VALID_FIELDS)
+
+    def test_ast_is_not_modified(self):
+        ast = process_input_string('$AND(?sec.region == "DE"?, ?sec.price := /2,4/?)', VALID_FIELDS)
+        before = repr(ast)
+        compile_rule(ast)(self.records[0])
+        self.assertEqual(repr(ast), before)
+
+
+class TestAdaptiveRules(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [
+            {"sec": {"region": region, "price": price, "tdg": price > 10},
+             "pos": {"first_trade": datetime(2025, 7, 10, hour, 0, 0), "remaining_quantity": 0.0}}
+            for region in ["DE", "US", "CA", "AT"] for price in [3, 12, 25] for hour in [8, 9, 14]
+        ]
+        self.ast = process_input_string(
+            '$AND($OR(?sec.tdg == TRUE?, ?pos.first_trade < (*,*,*,9,0,*)?), ?sec.region == "DE"?)', VALID_FIELDS)
+
+    def test_same_result_as_compiled(self):
+        rule = AdaptiveRule(self.ast, VALID_FIELDS, reorder_every=5)
+        expected = compile_rule(self.ast)
+        for _ in range(3):
+            for record in self.records:
+                self.assertEqual(rule(record), expected(record), record)
+        rule.freeze()
+        for record in self.records:
+            self.assertEqual(rule(record), expected(record), record)
+
+    def test_selective_argument_moves_first(self):
+        # region decides the $AND for 3 of 4 records, the $OR only for 4 of 9
+        stats = {
+            (0,): NodeStats(100, 44, 0.001), (0, 0): NodeStats(100, 33, 0.0005), (0, 1): NodeStats(67, 11, 0.0005),
+            (1,): NodeStats(44, 11, 0.00044),
+        }
+        ordered = reorder_ast(self.ast, stats)
+        self.assertEqual(ordered["args"][0], self.ast["args"][1])
+        # the cheaper per decision $OR argument stays first
+        self.assertEqual(ordered["args"][1], self.ast["args"][0])
+
+    def test_order_is_deterministic(self):
+        stats = {(0,): NodeStats(10, 5, 0.01), (1,): NodeStats(10, 5, 0.01)}
+        self.assertEqual(reorder_ast(self.ast, stats), self.ast)
+        self.assertEqual(reorder_ast(self.ast, {}), self.ast)
+
+    def test_exported_stats_reproduce_order(self):
+        rule = AdaptiveRule(self.ast, reorder_every=10)
+        for record in self.records:
+            rule(record)
+        frozen = AdaptiveRule.from_exported_stats(self.ast, rule.export_stats())
+        self.assertTrue(frozen.frozen)
+        self.assertEqual(frozen.ordered_ast(), rule.ordered_ast())
+        for record in self.records:
+            self.assertEqual(frozen(record), compile_rule(self.ast)(record))
+
+    def test_reordering_does_not_surface_exceptions(self):
+        ast = process_input_string('$AND(?sec.region == "DE"?, ?sec.price > 10?)', VALID_FIELDS)
+        # price decides far more often, it runs first after reordering
+        rule = AdaptiveRule.from_exported_stats(ast, {"": [100, 9, 0.01], "0": [100, 90, 0.001], "1": [100, 10, 0.001]})
+        self.assertEqual(rule.ordered_ast()["args"][0], ast["args"][1])
+        # None > 10 raises, the authored order stops at the region first
+        self.assertFalse(compile_rule(ast)({"sec": {"region": "US", "price": None}}))
+        self.assertFalse(rule({"sec": {"region": "US", "price": None}}))
+        with self.assertRaises(TypeError):
+            compile_rule(ast)({"sec": {"region": "DE", "price": None}})
+        with self.assertRaises(TypeError):
+            rule({"sec": {"region": "DE", "price": None}})
+        rule.unfreeze()
+        self.assertFalse(rule({"sec": {"region": "US", "price": None}}))
+
+    def test_exported_stats_without_exceptions(self):
+        rule = AdaptiveRule(self.ast, reorder_every=10)
+        for record in self.records:
+            rule(record)
+        exported = rule.export_stats()
+        self.assertTrue(all(len(values) == 4 for values in exported.values()))
+        # exports written before exceptions were counted
+        frozen = AdaptiveRule.from_exported_stats(self.ast, {key: values[:3] for key, values in exported.items()})
+        self.assertEqual(frozen.ordered_ast(), rule.ordered_ast())
+        self.assertTrue(all(stats.exceptions == 0 for stats in frozen.stats.values()))
+
+    def test_ast_is_not_modified(self):
+        before = repr(self.ast)
+        rule = AdaptiveRule(self.ast, reorder_every=1)
+        for record in self.records:
+            rule(record)
+        rule.freeze()
+        self.assertEqual(repr(self.ast), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import json
+from unittest import mock
+from datetime import datetime, timedelta
+import pandas as pd
+from rule_widget import process_input_string, evaluate
+from rule_frame import rule_to_expr, join_frames, assign_mappings
+from rule_batch import BatchEvaluator
+from test_rule_batch import VALID_FIELDS, RULES, make_records
+
+
+def to_frames(records):
+    # one security per position, joined back by isin
+    positions = pd.DataFrame([dict(record["pos"], isin=f"DE{jj:010d}") for jj, record in enumerate(records)])
+    securities = pd.DataFrame([dict(record["sec"], isin=f"DE{jj:010d}") for jj, record in enumerate(records)])
+    return positions, securities
+
+
+class TestRuleFrame(unittest.TestCase):
+
+    def setUp(self):
+        self.as_of = datetime(2025, 7, 11, 12, 0, 0)
+        self.records = make_records(300, self.as_of)
+        self.positions, self.securities = to_frames(self.records)
+        self.frame = join_frames(self.positions, self.securities)
+
+    def test_same_result_as_evaluate(self):
+        for rule_string in RULES:
+            ast = process_input_string(rule_string, VALID_FIELDS) if isinstance(rule_string, str) else rule_string
+            result = rule_to_expr(ast, as_of=self.as_of)(self.frame)
+            expected = [evaluate(ast, record, as_of=self.as_of) for record in self.records]
+            self.assertEqual(result.tolist(), expected, rule_string)
+
+    def test_datetime_columns_are_datetime64(self):
+        self.assertEqual(self.frame["pos.first_trade"].dtype.kind, "M")
+
+    def test_loc_filter(self):
+        ast = process_input_string('$AND(?sec.region == "DE"?, ?sec.price > 10?)', VALID_FIELDS)
+        filtered = self.frame.loc[rule_to_expr(ast)]
+        self.assertTrue(len(filtered) > 0)
+        self.assertTrue((filtered["sec.region"] == "DE").all())
+        self.assertTrue((filtered["sec.price"] > 10).all())
+
+    def test_join_keeps_index_and_missing_securities(self):
+        positions = pd.DataFrame({"isin": ["A", "B", "C"], "remaining_quantity": [0.0, 1.0, 0.0]}, index=[10, 20, 30])
+        securities = pd.DataFrame({"isin": ["A", "C", "A"], "region": ["DE", "US", "AT"]})
+        frame = join_frames(positions, securities)
+        self.assertEqual(frame.index.tolist(), [10, 20, 30])
+        self.assertEqual(frame["sec.region"].tolist()[0], "DE")
+        self.assertTrue(pd.isna(frame["sec.region"].tolist()[1]))
+        ast = process_input_string('?sec.region := ["DE","US"]?', VALID_FIELDS)
+        self.assertEqual(rule_to_expr(ast)(frame).tolist(), [True, False, True])
+
+    def test_string_conditions_without_row_loop(self):
+        rules = [
+            '?sec.description <> "AG"?',
+            '?sec.region := ["DE","AT","CH"]?',
+            {"type": "condition", "db": "sec", "field": "region", "op": ":=", "value": {"type": "string", "content": "DE US"}},
+            {"type": "condition", "db": "sec", "field": "region", "op": ":=", "value": {"type": "string", "content": "x" * 500 + "AT"}},
+            {"type": "condition", "db": "sec", "field": "description", "op": "<>", "value": {"type": "list", "content": ["AG", "S"]}},
+        ]
+        # one position without a security, NaN in the sec. columns
+        positions = pd.concat([self.positions, pd.DataFrame([{"isin": "XX", "remaining_quantity": 1.0}])], ignore_index=True)
+        frame = join_frames(positions, self.securities)
+        records = [{"sec": {"region": region if isinstance(region, str) else None,
+                            "description": description if isinstance(description, str) else None}}
+                   for region, description in zip(frame["sec.region"], frame["sec.description"])]
+        for rule in rules:
+            ast = process_input_string(rule, VALID_FIELDS) if isinstance(rule, str) else rule
+            with mock.patch.object(BatchEvaluator, "row_mask", side_effect=AssertionError("row_mask called")):
+                result = rule_to_expr(ast)(frame)
+            expected = [ref is not None and evaluate(ast, record)
+                        for record, ref in zip(records, (r["sec"][ast["field"]] for r in records))]
+            self.assertEqual(result.tolist(), expected, rule)
+
+    def test_unknown_column(self):
+        ast = process_input_string('?sec.region == "DE"?', VALID_FIELDS)
+        with self.assertRaises(KeyError):
+            rule_to_expr(ast)(self.positions)
+
+    def test_assign_mappings(self):
+        with open("test.json", "r", encoding="utf-8") as f:
+            assigners = json.load(f)
+        assigners["de"] = {"rule_dicts": [process_input_string('?sec.region == "DE"?', VALID_FIELDS)]}
+        assigners["recent"] = {"rule_dicts": [process_input_string('?pos.last_trade < {0,0,3,0,0,0}?', VALID_FIELDS)]}
+        assignments = assign_mappings(self.positions, self.securities, assigners, as_of=self.as_of)
+        self.assertEqual(assignments.name, "mapping")
+        for record, key in zip(self.records, assignments):
+            expected = None
+            for mapping_key, mapping in assigners.items():
+                if all(evaluate(rule, record, as_of=self.as_of) for rule in mapping["rule_dicts"]):
+                    expected = mapping_key
+                    break
+            self.assertEqual(key, expected)
+        self.assertIn(None, assignments.tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import json
+import random
+from rule_widget import process_input_string
+from rule_index import build_rule_index, Interval
+from test_mapping_rules import first_match, make_records, make_mappings
+
+VALID_FIELDS = {
+    "sec.region": "string",
+    "sec.isin": "string",
+    "sec.price": "float",
+    "sec.tdg": "bool",
+    "pos.direction": "string",
+    "pos.remaining_quantity": "float",
+}
+
+ISINS = [f"DE{jj:010d}" for jj in range(40)]
+
+
+def make_keyed_mappings(count, seed=11):
+    # mappings keyed on region, direction, isin lists and price ranges like the production set
+    rng = random.Random(seed)
+    mappings = {}
+    for jj in range(count):
+        rules = [f'?sec.region == "{rng.choice(["DE", "US", "AT", "CH"])}"?']
+        if jj % 2:
+            rules.append(f'?pos.direction == "{rng.choice(["buy", "sell"])}"?')
+        if jj % 3 == 0:
+            isins = ",".join(f'"{isin}"' for isin in rng.sample(ISINS, 5))
+            rules.append(f"?sec.isin := [{isins}]?")
+        if jj % 4 == 0:
+            low = rng.randint(0, 50)
+            rules.append(f"?sec.price := /{low},{low + rng.randint(0, 30)}/?")
+        if jj % 5 == 0:
+            rules.append(f'$AND(?sec.price {rng.choice(["<", "<=", ">", ">="])} {rng.randint(0, 60)}?, ?sec.tdg == TRUE?)')
+        if jj % 7 == 0:
+            rules.append('$OR(?pos.remaining_quantity == 0?, ?sec.price > 40?)')
+        mappings[f"mapping_{jj}"] = {"rule_dicts": [process_input_string(rule, VALID_FIELDS) for rule in rules]}
+    return mappings
+
+
+def make_keyed_records(count, seed=5):
+    rng = random.Random(seed)
+    return [{"sec": {"region": rng.choice(["DE", "US", "AT", "CH", "FR"]), "isin": rng.choice(ISINS),
+                     "price": rng.choice([0, 5, 10, 10.5, 25, 30, 45, 60, 80]), "tdg": rng.choice([True, False])},
+             "pos": {"direction": rng.choice(["buy", "sell"]), "remaining_quantity": rng.choice([0.0, 3.0])}}
+            for _ in range(count)]
+
+
+class TestInterval(unittest.TestCase):
+
+    def test_contains(self):
+        self.assertIn(5, Interval(5, True, 10, False))
+        self.assertNotIn(10, Interval(5, True, 10, False))
+        self.assertNotIn(5, Interval(low=5))
+        self.assertIn(-1e9, Interval(high=0))
+
+    def test_intersect(self):
+        interval = Interval(0.0, True, 20.0, True).intersect(Interval(low=10)).intersect(Interval(high=20, high_closed=False))
+        self.assertNotIn(10, interval)
+        self.assertIn(15, interval)
+        self.assertNotIn(20, interval)
+
+
+class TestRuleIndex(unittest.TestCase):
+
+    def test_same_as_first_match(self):
+        mappings = make_keyed_mappings(150)
+        index = build_rule_index(mappings, VALID_FIELDS)
+        for record in make_keyed_records(500):
+            self.assertEqual(index.assign(record), first_match(mappings, record), record)
+
+    def test_most_mappings_are_skipped(self):
+        mappings = make_keyed_mappings(150)
+        index = build_rule_index(mappings)
+        records = make_keyed_records(200)
+        candidates = sum(len(index.candidates(record)) for record in records) / len(records)
+        self.assertLess(candidates, len(mappings) / 4)
+        self.assertEqual(index.info().indexed_mappings, 150)
+
+    def test_candidates_keep_priority_order(self):
+        mappings = make_keyed_mappings(50)
+        index = build_rule_index(mappings)
+        order = list(mappings)
+        for record in make_keyed_records(50):
+            candidates = index.candidates(record)
+            self.assertEqual(candidates, sorted(candidates, key=order.index))
+
+    def test_other_rule_sets(self):
+        with open("test.json", "r", encoding="utf-8") as f:
+            assigners = json.load(f)
+        for mappings in [assigners, make_mappings(60)]:
+            index = build_rule_index(mappings)
+            for record in make_records(200):
+                self.assertEqual(index.assign(record), first_match(mappings, record), record)
+
+    def test_values_the_index_cannot_compare(self):
+        mappings = {
+            "cheap": {"rule_dicts": [process_input_string("?sec.price < 10?", VALID_FIELDS)]},
+            "de": {"rule_dicts": [process_input_string('?sec.region := ["DE","AT"]?', VALID_FIELDS)]},
+            "rest": {"rule_dicts": []},
+        }
+        index = build_rule_index(mappings)
+        self.assertEqual(index.assign({"sec": {"price": float("nan"), "region": ["DE"]}}), "rest")
+        self.assertEqual(index.assign({"sec": {"price": "5", "region": "AT"}}), "de")
+        self.assertEqual(index.assign({"sec": {"price": 5, "region": "AT"}}), "cheap")
+
+
+if __name__ == "__main__":
+    unittest.main()
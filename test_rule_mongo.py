@@ -0,0 +1,357 @@
+import unittest
+import os
+import json
+import random
+from datetime import datetime, timedelta
+from rule_widget import process_input_string, evaluate
+from rule_mongo import rule_to_expr, mapping_pipeline, assign_in_mongo
+
+VALID_FIELDS = {
+    "sec.region": "string",
+    "sec.description": "string",
+    "sec.price": "float",
+    "sec.tdg": "bool",
+    "sec.tags": "string",
+    "pos.isin": "string",
+    "pos.direction": "string",
+    "pos.first_trade": "datetime",
+    "pos.last_trade": "datetime",
+    "pos.remaining_quantity": "float",
+}
+
+RULES = [
+    '?sec.region == "DE"?',
+    '?sec.description <> "AG"?',
+    '?sec.tags <> "esg"?',
+    '?sec.region := ["DE","AT","CH"]?',
+    '?sec.price > 10?',
+    '?sec.price <= 10?',
+    '?sec.price == 12.5?',
+    '?sec.price := /5,20/?',
+    '?sec.tdg == TRUE?',
+    '?pos.remaining_quantity == 0?',
+    '?pos.first_trade > (*,*,*,8,50,*)?',
+    '?pos.first_trade < (*,*,*,9,0,*)?',
+    '?pos.first_trade >= (2025,3,*,*,*,*)?',
+    '?pos.first_trade <= (*,*,15,12,*,*)?',
+    '?pos.first_trade == (*,*,*,9,*,*)?',
+    '?pos.first_trade < (*,*,*,*,*,*)?',
+    '?pos.last_trade < {0,0,3,0,0,0}?',
+    '?pos.last_trade >= {0,0,10,0,0,0}?',
+    '$AND(?sec.region == "DE"?, ?pos.first_trade > (*,*,*,8,50,*)?, ?pos.first_trade < (*,*,*,9,0,*)?)',
+    '$OR($NOT(?sec.region := ["DE","US"]?), ?sec.price := /10,20/?)',
+    '$AND($OR(?sec.tdg == TRUE?, ?sec.price >= 10?), $NOT(?pos.remaining_quantity == 0?))',
+]
+
+# not accepted by validate_tree, but supported by condition_evaluator
+SUBSTRING_OF = {"type": "condition", "db": "sec", "field": "region", "op": ":=",
+                "value": {"type": "string", "content": "DE US"}}
+CONTAINS_ALL = [
+    {"type": "condition", "db": "sec", "field": "tags", "op": "<>", "value": {"type": "list", "content": ["esg", "dax"]}},
+    {"type": "condition", "db": "sec", "field": "description", "op": "<>", "value": {"type": "list", "content": ["Bayer", "AG"]}},
+]
+
+MISSING = object()
+TYPE_ORDER = {"missing": 0, "null": 1, "number": 2, "string": 3, "object": 4, "array": 5, "bool": 6, "date": 7}
+
+
+def bson_type(value):
+    if value is MISSING:
+        return "missing"
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "double"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, datetime):
+        return "date"
+    if isinstance(value, list):
+        return "array"
+    return "object"
+
+
+def type_class(value):
+    value_type = bson_type(value)
+    return "number" if value_type in ("int", "double") else value_type
+
+
+def bson_compare(left, right):
+    """ -1, 0 or 1, values of different types are ordered by type like in MongoDB """
+    left_class, right_class = type_class(left), type_class(right)
+    if left_class != right_class:
+        return -1 if TYPE_ORDER[left_class] < TYPE_ORDER[right_class] else 1
+    if left_class in ("missing", "null"):
+        return 0
+    if left_class in ("array", "object"):
+        return 0 if left == right else (-1 if repr(left) < repr(right) else 1)
+    return (left > right) - (left < right)
+
+
+def truthy(value):
+    return value not in (MISSING, None, False, 0)
+
+
+class LocalAggregation:
+    """
+    In-process stand-in for the subset of the aggregation framework rule_mongo emits,
+    used when no mongod is available.
+    """
+    def __init__(self, collections):
+        self.collections = collections
+
+    def aggregate(self, collection, pipeline):
+        documents = [dict(document) for document in self.collections[collection]]
+        for stage in pipeline:
+            (name, spec), = stage.items()
+            documents = getattr(self, "stage_" + name[1:])(documents, spec)
+        return documents
+
+    def stage_lookup(self, documents, spec):
+        foreign = self.collections[spec["from"]]
+        for document in documents:
+            local = document.get(spec["localField"], MISSING)
+            document[spec["as"]] = [dict(other) for other in foreign
+                                    if bson_compare(other.get(spec["foreignField"], MISSING), local) == 0]
+        return documents
+
+    def stage_project(self, documents, spec):
+        projected = []
+        for document in documents:
+            # _id is kept unless it is excluded
+            result = {"_id": document["_id"]} if "_id" not in spec and "_id" in document else {}
+            for field, expr in spec.items():
+                if expr is None:
+                    raise ValueError(f"Invalid $project, null for field {field}")
+                if expr == 0:
+                    continue
+                value = document.get(field, MISSING) if expr == 1 else self.eval(expr, document)
+                if value is not MISSING:
+                    result[field] = value
+            projected.append(result)
+        return projected
+
+    def stage_merge(self, documents, spec):
+        into = {document["_id"]: document for document in self.collections.setdefault(spec["into"], [])}
+        for document in documents:
+            into[document["_id"]] = document
+        self.collections[spec["into"]] = list(into.values())
+        return []
+
+    def path(self, path, document):
+        if path == "$$ROOT":
+            return document
+        value = document
+        for part in path[1:].split("."):
+            if not isinstance(value, dict) or part not in value:
+                return MISSING
+            value = value[part]
+        return value
+
+    def eval(self, expr, document):
+        if isinstance(expr, str):
+            return self.path(expr, document) if expr.startswith("$") else expr
+        if isinstance(expr, list):
+            return [self.eval(item, document) for item in expr]
+        if not isinstance(expr, dict):
+            return expr
+        if len(expr) != 1 or not next(iter(expr)).startswith("$"):
+            return {field: self.eval(item, document) for field, item in expr.items()}
+
+        (op, args), = expr.items()
+        if op == "$literal":
+            return args
+        if op == "$cond":
+            return self.eval(args[1] if truthy(self.eval(args[0], document)) else args[2], document)
+        if op == "$switch":
+            for branch in args["branches"]:
+                if truthy(self.eval(branch["case"], document)):
+                    return self.eval(branch["then"], document)
+            return self.eval(args["default"], document)
+        if op == "$and":
+            return all(truthy(self.eval(arg, document)) for arg in args)
+        if op == "$or":
+            return any(truthy(self.eval(arg, document)) for arg in args)
+
+        values = self.eval(args, document) if isinstance(args, list) else [self.eval(args, document)]
+        if op == "$not":
+            return not truthy(values[0])
+        if op in ("$eq", "$lt", "$lte", "$gt", "$gte"):
+            compared = bson_compare(values[0], values[1])
+            return {"$eq": compared == 0, "$lt": compared < 0, "$lte": compared <= 0,
+                    "$gt": compared > 0, "$gte": compared >= 0}[op]
+        if op == "$in":
+            if not isinstance(values[1], list):
+                raise TypeError("$in needs an array")
+            return any(bson_compare(values[0], item) == 0 for item in values[1])
+        if op == "$type":
+            return bson_type(values[0])
+        if op == "$isArray":
+            return isinstance(values[0], list)
+        if op == "$isNumber":
+            return bson_type(values[0]) in ("int", "double")
+        if op == "$indexOfCP":
+            if not all(isinstance(value, str) for value in values):
+                raise TypeError("$indexOfCP needs strings")
+            return values[0].find(values[1])
+        if op == "$setIsSubset":
+            return all(any(bson_compare(item, other) == 0 for other in values[1]) for item in values[0])
+        if op == "$arrayElemAt":
+            array, index = values
+            return array[index] if -len(array) <= index < len(array) else MISSING
+        if op in ("$year", "$month", "$dayOfMonth", "$hour", "$minute", "$second"):
+            if not isinstance(values[0], datetime):
+                raise TypeError(f"{op} needs a date")
+            attribute = {"$dayOfMonth": "day"}.get(op, op[1:])
+            return getattr(values[0], attribute)
+        raise ValueError(f"Operator not supported by the stand-in: {op}")
+
+
+def make_collections(count, as_of, seed=13):
+    rng = random.Random(seed)
+    securities = [{
+        "_id": f"sec_{jj}",
+        "isin": f"DE{jj:010d}",
+        "region": rng.choice(["DE", "US", "AT", "CA"]),
+        "description": rng.choice(["Siemens AG", "Apple Inc", "Bayer AG"]),
+        "price": rng.choice([1, 5, 10, 12.5, 20, 30]),
+        "tdg": rng.choice([True, False]),
+        "tags": rng.choice([["esg", "dax"], ["dax"], [], ["esg"]]),
+    } for jj in range(20)]
+    positions = []
+    for jj in range(count):
+        first_trade = datetime(2025, rng.randint(1, 12), rng.randint(1, 28), rng.randint(7, 17), rng.randint(0, 59), rng.randint(0, 59))
+        positions.append({
+            "_id": f"pos_{jj}",
+            "isin": rng.choice(securities)["isin"],
+            "direction": rng.choice(["LONG", "SHORT"]),
+            "first_trade": first_trade,
+            "last_trade": as_of - timedelta(days=rng.randint(0, 20), hours=rng.randint(0, 23)),
+            "remaining_quantity": rng.choice([0.0, 0.0, 5.0, -3.0]),
+        })
+    return {"positions": positions, "securities": securities}
+
+
+def python_assignment(mapping_assignments, collections, as_of):
+    securities = {security["isin"]: security for security in collections["securities"]}
+    assignments = {}
+    for position in collections["positions"]:
+        data = {"sec": securities.get(position.get("isin")), "pos": position}
+        assignments[position["_id"]] = None
+        for key, mapping in mapping_assignments.items():
+            if all(evaluate(rule, data, as_of=as_of) for rule in mapping.get("rule_dicts", [])):
+                assignments[position["_id"]] = key
+                break
+    return assignments
+
+
+class TestRuleExpressions(unittest.TestCase):
+
+    def setUp(self):
+        self.as_of = datetime(2025, 7, 11, 12, 0, 0)
+        self.collections = make_collections(200, self.as_of)
+        self.local = LocalAggregation(self.collections)
+        securities = {security["isin"]: security for security in self.collections["securities"]}
+        self.records = [{"sec": securities[position["isin"]], "pos": position} for position in self.collections["positions"]]
+
+    def test_same_result_as_evaluate(self):
+        for rule in RULES + [SUBSTRING_OF] + CONTAINS_ALL:
+            ast = process_input_string(rule, VALID_FIELDS) if isinstance(rule, str) else rule
+            expr = rule_to_expr(ast, self.as_of)
+            for record in self.records:
+                self.assertEqual(bool(self.local.eval(expr, record)), evaluate(ast, record, as_of=self.as_of), (rule, record))
+
+    def test_values_python_raises_for_are_false(self):
+        records = [{"sec": {"price": None, "region": 5, "tags": None}, "pos": {"first_trade": "2025-07-10", "last_trade": None}},
+                   {"sec": {"price": "12", "region": None, "tags": 7}, "pos": {}}]
+        rules = ['?sec.price > 10?', '?sec.price := /5,20/?', '?sec.tags <> "esg"?',
+                 '?pos.first_trade < (*,*,*,9,0,*)?', '?pos.last_trade < {0,0,3,0,0,0}?']
+        for rule in [process_input_string(rule, VALID_FIELDS) for rule in rules] + CONTAINS_ALL:
+            expr = rule_to_expr(rule, self.as_of)
+            for record in records:
+                self.assertFalse(self.local.eval(expr, record), (rule, record))
+        expr = rule_to_expr(SUBSTRING_OF, self.as_of)
+        self.assertFalse(self.local.eval(expr, records[0]))
+
+    def test_literal_strings_are_not_field_paths(self):
+        ast = process_input_string('?sec.region == "$pos.direction"?', VALID_FIELDS)
+        expr = rule_to_expr(ast, self.as_of)
+        self.assertFalse(self.local.eval(expr, {"sec": {"region": "DE"}, "pos": {"direction": "DE"}}))
+        self.assertTrue(self.local.eval(expr, {"sec": {"region": "$pos.direction"}, "pos": {}}))
+
+
+class TestMappingPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.as_of = datetime(2025, 7, 11, 12, 0, 0)
+        self.collections = make_collections(300, self.as_of)
+        self.mappings = {}
+        for jj, rule in enumerate(RULES):
+            rule_dicts = [process_input_string(rule, VALID_FIELDS)]
+            if jj % 2:
+                rule_dicts.append(process_input_string('?pos.direction == "LONG"?', VALID_FIELDS))
+            self.mappings[f"mapping_{jj}"] = {"label": rule, "temp": False, "rule_dicts": rule_dicts}
+
+    def run_local(self, mapping_assignments):
+        local = LocalAggregation(self.collections)
+        local.aggregate("positions", mapping_pipeline(mapping_assignments, as_of=self.as_of))
+        return {document["_id"]: document.get("mapping") for document in local.collections["assignments"]}
+
+    def test_same_assignment_as_python(self):
+        self.assertEqual(self.run_local(self.mappings), python_assignment(self.mappings, self.collections, self.as_of))
+
+    def test_test_json(self):
+        with open("test.json", "r", encoding="utf-8") as f:
+            assigners = json.load(f)
+        self.assertEqual(self.run_local(assigners), python_assignment(assigners, self.collections, self.as_of))
+
+    def test_pipeline_stages(self):
+        pipeline = mapping_pipeline(self.mappings, as_of=self.as_of, into="position_assignments")
+        self.assertEqual([next(iter(stage)) for stage in pipeline], ["$lookup", "$project", "$project", "$merge"])
+        self.assertEqual(pipeline[-1]["$merge"]["into"], "position_assignments")
+        self.assertEqual([next(iter(stage)) for stage in mapping_pipeline(self.mappings, self.as_of, into=None)][-1], "$project")
+
+    def test_unknown_security_and_empty_rule_set(self):
+        self.collections["positions"].append({"_id": "orphan", "isin": "XX0000000000", "remaining_quantity": 0.0})
+        mappings = {"flat": {"rule_dicts": [process_input_string("?pos.remaining_quantity == 0?", VALID_FIELDS)]},
+                    "de": {"rule_dicts": [process_input_string('?sec.region == "DE"?', VALID_FIELDS)]}}
+        self.assertEqual(self.run_local(mappings)["orphan"], "flat")
+        self.assertIsNone(self.run_local({})["orphan"])
+
+    def test_empty_rule_set_assigns_none(self):
+        pipeline = mapping_pipeline({}, as_of=self.as_of, into=None)
+        self.assertEqual(pipeline[-1]["$project"]["mapping"], {"$literal": None})
+        documents = LocalAggregation(self.collections).aggregate("positions", pipeline)
+        self.assertEqual(len(documents), len(self.collections["positions"]))
+        self.assertTrue(all("mapping" in document and document["mapping"] is None for document in documents))
+        self.assertEqual({document["_id"]: document["mapping"] for document in documents},
+                         python_assignment({}, self.collections, self.as_of))
+
+
+@unittest.skipUnless(os.environ.get("PROCESS_TOOL_MONGO_URI"), "needs a mongod, set PROCESS_TOOL_MONGO_URI")
+class TestMongoPipeline(unittest.TestCase):
+
+    def test_same_assignment_as_python(self):
+        from pymongo import MongoClient
+        as_of = datetime(2025, 7, 11, 12, 0, 0)
+        collections = make_collections(300, as_of)
+        client = MongoClient(os.environ["PROCESS_TOOL_MONGO_URI"])
+        database = client["process_tool_test_rule_mongo"]
+        try:
+            for name, documents in collections.items():
+                database[name].insert_many(documents)
+            with open("test.json", "r", encoding="utf-8") as f:
+                assigners = json.load(f)
+            assign_in_mongo(database, assigners, as_of=as_of)
+            result = {document["_id"]: document["mapping"] for document in database["assignments"].find()}
+            self.assertEqual(result, python_assignment(assigners, collections, as_of))
+        finally:
+            client.drop_database("process_tool_test_rule_mongo")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import json
+from datetime import datetime
+from rule_widget import process_input_string
+from rule_network import build_decision_network, SwitchNode, SequentialNode
+from test_mapping_rules import VALID_FIELDS, first_match, make_records, make_mappings
+
+
+class TestDecisionNetwork(unittest.TestCase):
+
+    def setUp(self):
+        self.records = make_records(300)
+
+    def assert_same_as_first_match(self, mappings, network):
+        for record in self.records:
+            self.assertEqual(network.assign(record), first_match(mappings, record), record)
+
+    def test_test_json_same_as_first_match(self):
+        with open("test.json", "r", encoding="utf-8") as f:
+            assigners = json.load(f)
+        self.assert_same_as_first_match(assigners, build_decision_network(assigners))
+
+    def test_large_rule_set_same_as_first_match(self):
+        mappings = make_mappings(120)
+        self.assert_same_as_first_match(mappings, build_decision_network(mappings, VALID_FIELDS))
+
+    def test_equality_field_becomes_switch(self):
+        mappings = {
+            region: {"rule_dicts": [process_input_string(f'?sec.region == "{region}"?', VALID_FIELDS),
+                                    process_input_string('?sec.price > 10?', VALID_FIELDS)]}
+            for region in ["DE", "US", "AT", "CH"]
+        }
+        network = build_decision_network(mappings)
+        self.assertIsInstance(network.root, SwitchNode)
+        self.assertEqual(set(network.root.branches), {"DE", "US", "AT", "CH"})
+        # region and price, whatever the number of regions
+        self.assertEqual(network.depth, 2)
+        self.assert_same_as_first_match(mappings, network)
+
+    def test_tests_grow_sublinear(self):
+        small = build_decision_network(make_mappings(30))
+        large = build_decision_network(make_mappings(300))
+        self.assertLess(large.expected_tests(self.records), 2 * small.expected_tests(self.records))
+        self.assertLess(large.expected_tests(self.records), 30)
+
+    def test_node_budget_falls_back_to_sequential(self):
+        mappings = make_mappings(60)
+        network = build_decision_network(mappings, max_nodes=5)
+        self.assertTrue(any(isinstance(node, SequentialNode) for node in network.nodes()))
+        self.assert_same_as_first_match(mappings, network)
+
+    def test_unhashable_value_takes_default(self):
+        mappings = {"de": {"rule_dicts": [process_input_string('?sec.region == "DE"?', VALID_FIELDS)]}}
+        network = build_decision_network(mappings)
+        self.assertIsNone(network.assign({"sec": {"region": ["DE"]}}))
+        self.assertEqual(network.assign({"sec": {"region": "DE"}}), "de")
+
+    def test_report(self):
+        network = build_decision_network(make_mappings(60))
+        self.assertGreater(network.node_count, 1)
+        self.assertGreaterEqual(network.depth, 1)
+        self.assertGreater(network.expected_tests(), 0)
+        self.assertEqual(network.expected_tests([]), 0.0)
+
+    def test_schema_is_validated(self):
+        mappings = {"broken": {"rule_dicts": [
+            {"type": "condition", "db": "sec", "field": "unknown", "op": "==", "value": {"type": "string", "content": "DE"}}]}}
+        with self.assertRaises(ValueError):
+            build_decision_network(mappings, VALID_FIELDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import json
+from datetime import datetime
+from rule_widget import process_input_string, evaluate, reconstruct_expression, validate_tree
+from rule_compiler import compile_rule
+from mapping_rules import build_rule_set
+from rule_nodes import (parse_rule, node_from_dict, node_to_dict, load_mappings, dump_mappings,
+                        ConditionNode, OperatorNode, ListValue, RangeValue, value_from_dict)
+from test_rule_batch import VALID_FIELDS, RULES, make_records
+
+
+def parse_both(rule):
+    if isinstance(rule, str):
+        return process_input_string(rule, VALID_FIELDS), parse_rule(rule, VALID_FIELDS)
+    return rule, node_from_dict(rule)
+
+
+class TestRuleNodes(unittest.TestCase):
+
+    def setUp(self):
+        self.as_of = datetime(2025, 7, 11, 12, 0, 0)
+        self.records = make_records(200, self.as_of)
+
+    def test_parser_builds_nodes(self):
+        node = parse_rule('$NOT(?sec.price := /5,20/?)', VALID_FIELDS)
+        self.assertIsInstance(node, OperatorNode)
+        self.assertIsInstance(node.args[0], ConditionNode)
+        self.assertIsInstance(node.args[0].value, RangeValue)
+        self.assertFalse(hasattr(node, "__dict__"))
+
+    def test_round_trip(self):
+        for rule in RULES:
+            tree, node = parse_both(rule)
+            self.assertEqual(node.to_dict(), tree, rule)
+            self.assertEqual(node_from_dict(tree).to_dict(), tree, rule)
+            self.assertEqual(json.dumps(node.to_dict()), json.dumps(tree), rule)
+
+    def test_test_json_round_trip(self):
+        with open("test.json", "r", encoding="utf-8") as f:
+            assigners = json.load(f)
+        nodes = load_mappings(assigners)
+        self.assertEqual(json.dumps(dump_mappings(nodes)), json.dumps(assigners))
+        # lists without value_type stay without it
+        self.assertEqual(ListValue(["DE"]).to_dict(), {"type": "list", "content": ["DE"]})
+
+    def test_same_result_as_evaluate(self):
+        for rule in RULES:
+            tree, node = parse_both(rule)
+            for record in self.records:
+                self.assertEqual(node.evaluate(record, self.as_of), evaluate(tree, record, as_of=self.as_of), rule)
+
+    def test_dict_consumers_accept_nodes(self):
+        for rule in RULES:
+            tree, node = parse_both(rule)
+            self.assertEqual(reconstruct_expression(node), reconstruct_expression(tree))
+            compiled = compile_rule(node, as_of=self.as_of)
+            self.assertEqual([compiled(record) for record in self.records],
+                             [evaluate(tree, record, as_of=self.as_of) for record in self.records])
+        validate_tree(parse_rule('?sec.region == "DE"?', VALID_FIELDS), VALID_FIELDS)
+
+    def test_rule_set_from_nodes(self):
+        assigners = {"de": {"rule_dicts": [process_input_string('?sec.region == "DE"?', VALID_FIELDS)]},
+                     "cheap": {"rule_dicts": [process_input_string('?sec.price < 10?', VALID_FIELDS)]}}
+        expected = build_rule_set(assigners, as_of=self.as_of)
+        rule_set = build_rule_set(load_mappings(assigners), as_of=self.as_of)
+        for record in self.records:
+            self.assertEqual(rule_set.assign(record), expected.assign(record))
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            value_from_dict({"type": "unknown", "content": 1})
+        with self.assertRaises(ValueError):
+            node_from_dict({"type": "operator", "operator": "$XOR", "args": []})
+        with self.assertRaises(ValueError):
+            node_from_dict({"type": "condition", "db": "sec", "field": "price", "op": "<>",
+                            "value": {"type": "number", "content": 1}}).evaluate({"sec": {"price": 1}})
+        with self.assertRaises(KeyError):
+            parse_rule('?sec.price > 1?', VALID_FIELDS)["eval_result"]
+        self.assertIs(node_to_dict(RULES[2]), RULES[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import json
+import os
+import tempfile
+from datetime import datetime
+from rule_widget import process_input_string
+from rule_compiler import compile_rule
+from rule_profiler import RuleProfiler, profile_mappings
+
+VALID_FIELDS = {
+    "sec.region": "string",
+    "sec.price": "float",
+    "pos.first_trade": "datetime",
+    "pos.remaining_quantity": "float",
+}
+
+
+class TestRuleProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [
+            {"sec": {"region": region, "price": price}, "pos": {"first_trade": datetime(2025, 7, 10, 8, 55), "remaining_quantity": 0.0}}
+            for region in ["DE", "US", "AT", "CH"] for price in [5, 15]
+        ]
+        self.ast = process_input_string('$AND(?sec.region == "DE"?, $OR(?sec.price > 10?, ?pos.remaining_quantity == 1?))', VALID_FIELDS)
+
+    def test_counts(self):
+        profiler = RuleProfiler()
+        rule = compile_rule(self.ast, profiler=profiler, name="de")
+        results = [rule(record) for record in self.records]
+        self.assertEqual(results, [False, True] + [False] * 6)
+        rows = {tuple(row["path"]): row for row in profiler.rows()}
+        self.assertEqual(rows[()]["evaluations"], 8)
+        self.assertEqual(rows[()]["true_count"], 1)
+        self.assertEqual(rows[(0,)]["true_count"], 2)
+        # the $OR only runs for the two DE records
+        self.assertEqual(rows[(1,)]["evaluations"], 2)
+        self.assertEqual(rows[(1, 1)]["evaluations"], 1)
+        self.assertEqual(rows[(1, 1)]["true_count"], 0)
+        self.assertEqual(rows[(1,)]["type"], "$OR")
+        self.assertEqual(rows[(0,)]["expression"], '?sec.region == "DE"?')
+
+    def test_same_result_as_plain_rule(self):
+        profiled = compile_rule(self.ast, profiler=RuleProfiler(), name="de")
+        plain = compile_rule(self.ast)
+        for record in self.records:
+            self.assertEqual(profiled(record), plain(record))
+
+    def test_exceptions_are_counted_and_raised(self):
+        profiler = RuleProfiler()
+        rule = compile_rule(process_input_string("?sec.price > 10?", VALID_FIELDS), profiler=profiler, name="price")
+        with self.assertRaises(TypeError):
+            rule({"sec": {"price": None}})
+        row = profiler.rows()[0]
+        self.assertEqual((row["evaluations"], row["exceptions"], row["true_count"]), (1, 1, 0))
+
+    def test_report_and_json(self):
+        profiler = RuleProfiler()
+        mappings = {"a": {"label": "DE cheap", "rule_dicts": [self.ast]},
+                    "b": {"label": "never", "rule_dicts": [process_input_string('?sec.region == "FR"?', VALID_FIELDS)]}}
+        compiled = profile_mappings(mappings, profiler)
+        for record in self.records:
+            for rules in compiled.values():
+                all(rule(record) for rule in rules)
+
+        report = profiler.report(sort_by="evaluations")
+        lines = report.splitlines()
+        self.assertEqual(len(lines), 1 + 6)
+        self.assertIn("DE cheap[0] (a[0])", report)
+        self.assertIn('?sec.region == "FR"?', report)
+        self.assertEqual(len(profiler.report(top=2).splitlines()), 3)
+        self.assertIn('?sec.region == "FR"?', [row["expression"] for row in profiler.never_true()])
+        with self.assertRaises(ValueError):
+            profiler.report(sort_by="unknown")
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.json")
+            profiler.save(path)
+            with open(path, encoding="utf-8") as f:
+                rows = json.load(f)
+        self.assertEqual(len(rows), 6)
+        self.assertEqual({row["rule"] for row in rows}, {"a[0]", "b[0]"})
+        self.assertEqual({row["label"] for row in rows}, {"DE cheap[0]", "never[0]"})
+
+        profiler.reset()
+        self.assertTrue(all(row["evaluations"] == 0 for row in profiler.rows()))
+
+    def test_same_label_is_not_merged(self):
+        profiler = RuleProfiler()
+        mappings = {"auction_de": {"label": "MITTAGSAUKTION", "rule_dicts": [process_input_string('?sec.region == "DE"?', VALID_FIELDS)]},
+                    "auction_us": {"label": "MITTAGSAUKTION", "rule_dicts": [process_input_string('?sec.region == "US"?', VALID_FIELDS)]}}
+        compiled = profile_mappings(mappings, profiler)
+        record = {"sec": {"region": "US"}}
+        for rules in compiled.values():
+            all(rule(record) for rule in rules)
+        rows = profiler.rows()
+        self.assertEqual([(row["rule"], row["evaluations"], row["true_count"]) for row in rows],
+                         [("auction_de[0]", 1, 0), ("auction_us[0]", 1, 1)])
+        report = profiler.report()
+        self.assertIn('?sec.region == "DE"?', report)
+        self.assertIn('?sec.region == "US"?', report)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import unittest
+import json
+import os
+import tempfile
+from unittest import mock
+from datetime import datetime
+from rule_nodes import dump_mappings, OperatorNode
+from mapping_rules import build_rule_set
+from rule_snapshot import compile_ruleset, load_snapshot, load_ruleset, snapshot_path, HEADER
+from test_mapping_rules import VALID_FIELDS, make_mappings, make_records
+
+
+class TestRuleSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "rules.json")
+        self.mappings = make_mappings(40)
+        self.write(self.mappings)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, mappings):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(mappings, f)
+
+    def test_round_trip(self):
+        compile_ruleset(self.path, valid_fields=VALID_FIELDS)
+        snapshot = load_snapshot(snapshot_path(self.path), source=self.path)
+        self.assertEqual(json.dumps(dump_mappings(snapshot.mappings)), json.dumps(self.mappings))
+        with open("test.json", "r", encoding="utf-8") as f:
+            assigners = json.load(f)
+        output = os.path.join(self.directory.name, "test.rules")
+        compile_ruleset("test.json", output)
+        self.assertEqual(json.dumps(dump_mappings(load_snapshot(output).mappings)), json.dumps(assigners))
+
+    def test_same_assignments(self):
+        as_of = datetime(2025, 7, 11, 12, 0, 0)
+        compile_ruleset(self.path)
+        expected = build_rule_set(self.mappings, as_of=as_of)
+        rule_set = build_rule_set(load_snapshot(snapshot_path(self.path)).mappings, as_of=as_of)
+        for record in make_records(200):
+            self.assertEqual(rule_set.assign(record), expected.assign(record))
+
+    def test_expressions_and_interned_strings(self):
+        compile_ruleset(self.path)
+        snapshot = load_snapshot(snapshot_path(self.path))
+        key = next(iter(self.mappings))
+        self.assertEqual(len(snapshot.expressions[key]), len(self.mappings[key]["rule_dicts"]))
+        conditions = [rule.args[0] if isinstance(rule, OperatorNode) else rule
+                      for mapping in snapshot.mappings.values() for rule in mapping["rule_dicts"]]
+        dbs = {id(condition.db) for condition in conditions if condition.db == "sec"}
+        self.assertEqual(len(dbs), 1)
+
+    def test_stale_and_corrupt(self):
+        output = snapshot_path(self.path)
+        compile_ruleset(self.path)
+        self.write(make_mappings(41))
+        with self.assertRaises(ValueError):
+            load_snapshot(output, source=self.path)
+        # load_ruleset recompiles
+        self.assertEqual(len(load_ruleset(self.path).mappings), 41)
+        self.assertEqual(len(load_snapshot(output, source=self.path).mappings), 41)
+
+        with open(output, "rb") as f:
+            data = bytearray(f.read())
+        data[HEADER.size + 10] ^= 0xFF
+        with open(output, "wb") as f:
+            f.write(data)
+        with self.assertRaises(ValueError):
+            load_snapshot(output)
+        with open(output, "wb") as f:
+            f.write(b"{}")
+        with self.assertRaises(ValueError):
+            load_snapshot(output)
+
+    def test_valid_fields_change(self):
+        output = snapshot_path(self.path)
+        compile_ruleset(self.path)
+        with self.assertRaises(ValueError):
+            load_snapshot(output, valid_fields=VALID_FIELDS)
+        load_ruleset(self.path, VALID_FIELDS)
+        self.assertEqual(len(load_snapshot(output, source=self.path, valid_fields=VALID_FIELDS).mappings), 40)
+
+        # a field the rules use is no longer valid, the snapshot is recompiled and the rules rejected
+        field = next(iter(self.mappings.values()))["rule_dicts"][0]
+        field = field["args"][0] if field["type"] == "operator" else field
+        fewer_fields = {key: value for key, value in VALID_FIELDS.items() if key != f"{field['db']}.{field['field']}"}
+        with self.assertRaises(ValueError):
+            load_ruleset(self.path, fewer_fields)
+
+    def test_other_python_is_stale(self):
+        output = snapshot_path(self.path)
+        compile_ruleset(self.path)
+        with open(output, "rb") as f:
+            data = bytearray(f.read())
+        # python minor version in the header
+        data[7] ^= 0xFF
+        with open(output, "wb") as f:
+            f.write(data)
+        with self.assertRaises(ValueError):
+            load_snapshot(output)
+        self.assertEqual(len(load_ruleset(self.path).mappings), 40)
+        self.assertEqual(len(load_snapshot(output).mappings), 40)
+
+    def test_written_atomically(self):
+        compile_ruleset(self.path)
+        with mock.patch("rule_snapshot.os.replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                compile_ruleset(self.path, valid_fields=VALID_FIELDS)
+        # the old snapshot is untouched, no temporary file is left behind
+        self.assertEqual(len(load_snapshot(snapshot_path(self.path)).mappings), 40)
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["rules.json", "rules.rules"])
+
+    def test_invalid_rule(self):
+        self.write({"bad": {"rule_dicts": [{"type": "condition", "db": "sec", "field": "unknown", "op": "==",
+                                            "value": {"type": "string", "content": "DE"}}]}})
+        with self.assertRaises(ValueError):
+            compile_ruleset(self.path, valid_fields=VALID_FIELDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
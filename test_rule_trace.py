@@ -0,0 +1,78 @@
+import unittest
+import json
+import os
+import tempfile
+from datetime import datetime
+
+import rule_trace
+from rule_trace import trace_category, enable, disable, RingBuffer, JsonlSink, configure_from_env
+from rule_widget import process_input_string, validate_tree, evaluate
+from position_assignment_filer import mapping_evaluator
+from test_mapping_rules import VALID_FIELDS
+
+
+class TestRuleTrace(unittest.TestCase):
+
+    def tearDown(self):
+        disable()
+        rule_trace.default_sink.clear()
+
+    def test_disabled_by_default(self):
+        category = trace_category("test_disabled")
+        self.assertFalse(category.enabled)
+        self.assertIs(trace_category("test_disabled"), category)
+
+    def test_ring_buffer(self):
+        sink = enable("test_ring", sink=RingBuffer(maxlen=3))
+        category = trace_category("test_ring")
+        for jj in range(5):
+            category.emit("event", index=jj)
+        records = list(sink)
+        self.assertEqual([record["index"] for record in records], [2, 3, 4])
+        self.assertEqual(records[0]["category"], "test_ring")
+        self.assertEqual(records[0]["event"], "event")
+
+    def test_enable_before_create_and_wildcard(self):
+        enable("test_later")
+        self.assertTrue(trace_category("test_later").enabled)
+        disable()
+        enable("*")
+        self.assertTrue(trace_category("test_created_after_wildcard").enabled)
+        disable()
+        self.assertFalse(trace_category("test_later").enabled)
+
+    def test_validate_and_evaluate(self):
+        enable("validate", "evaluate")
+        ast = process_input_string('$AND(?sec.region == "DE"?, ?sec.price > 10?)', VALID_FIELDS)
+        validate_tree(ast, VALID_FIELDS)
+        evaluate(ast, {"sec": {"region": "DE", "price": 11}})
+        events = [(record["category"], record["event"]) for record in rule_trace.default_sink]
+        self.assertIn(("validate", "condition"), events)
+        self.assertIn(("validate", "number"), events)
+        self.assertIn(("evaluate", "condition"), events)
+
+    def test_disabled_call_sites_emit_nothing(self):
+        ast = process_input_string('?sec.region == "DE"?', VALID_FIELDS)
+        mapping_evaluator({"de": {"label": "DE", "rule_dicts": [ast]}}, {"sec": {"region": "DE"}})
+        self.assertEqual(len(rule_trace.default_sink), 0)
+
+    def test_jsonl_sink(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "trace.jsonl")
+            sink = configure_from_env({rule_trace.TRACE_ENV: "mapping", rule_trace.TRACE_FILE_ENV: path})
+            ast = process_input_string('?sec.region == "DE"?', VALID_FIELDS)
+            key = mapping_evaluator({"de": {"label": "DE", "rule_dicts": [ast]}}, {"sec": {"region": "DE"}},
+                                    as_of=datetime(2025, 7, 11))
+            sink.close()
+            with open(path, "r", encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual(key, "de")
+        self.assertEqual(records[0]["category"], "mapping")
+        self.assertEqual(records[0]["key"], "de")
+
+    def test_configure_from_env_without_categories(self):
+        self.assertIsNone(configure_from_env({}))
+
+
+if __name__ == "__main__":
+    unittest.main()
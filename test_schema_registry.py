@@ -0,0 +1,110 @@
+import unittest
+import sys
+import typing
+import importlib
+from datetime import datetime
+from pydantic import BaseModel
+from models import SecurityModel, PositionModel
+from rule_widget import create_valid_fields_dict, process_input_string
+from schema_registry import model_schema, field_specs, field_spec, resolve_type, cached_schema
+
+
+class Leg(BaseModel):
+    price: float
+    venue: typing.Optional[str] = None
+
+
+class Account(BaseModel):
+    currency: str
+    opened: datetime
+
+
+class Order(BaseModel):
+    quantity: int
+    account: typing.Optional[Account] = None
+    legs: typing.List[Leg] = []
+    tags: typing.List[str] = []
+    raw: typing.Optional[typing.List] = None
+
+
+class Node(BaseModel):
+    value: int
+    children: typing.List["Node"] = []
+
+
+class TestSchemaRegistry(unittest.TestCase):
+
+    def test_flat_models(self):
+        fields = create_valid_fields_dict(SecurityModel, name="sec")
+        self.assertEqual(fields["sec.region"], "string")
+        self.assertEqual(fields["sec.adr_ratio"], "float")
+        self.assertEqual(model_schema(PositionModel, "pos")["pos.first_trade"], "datetime")
+        self.assertTrue(all(key.startswith("SecurityModel.") for key in model_schema(SecurityModel)))
+
+    def test_nested_and_lists(self):
+        # rules address "db.field" only, nested paths are not valid fields
+        self.assertEqual(model_schema(Order, "order"), {
+            "order.quantity": "int",
+            "order.tags": "list[string]",
+        })
+        self.assertEqual(model_schema(Node, "node"), {"node.value": "int"})
+        self.assertEqual({path: spec.type for path, spec in field_specs(Order, "order").items()}, {
+            "order.quantity": "int",
+            "order.account.currency": "string",
+            "order.account.opened": "datetime",
+            "order.legs[].price": "float",
+            "order.legs[].venue": "string",
+            "order.tags": "list[string]",
+        })
+
+    def test_nested_paths_are_rejected_in_rules(self):
+        with self.assertRaises(SyntaxError):
+            process_input_string('?order.account.currency == "EUR"?', model_schema(Order, "order"))
+
+    def test_cached(self):
+        model_schema(Order, "order")
+        hits = cached_schema.cache_info().hits
+        fields = model_schema(Order, "order")
+        self.assertEqual(cached_schema.cache_info().hits, hits + 1)
+        fields["order.extra"] = "string"
+        self.assertNotIn("order.extra", model_schema(Order, "order"))
+
+    def test_field_specs(self):
+        specs = field_specs(Order, "order")
+        self.assertTrue(specs["order.quantity"].accepts("range", ":="))
+        self.assertFalse(specs["order.quantity"].accepts("string", "=="))
+        self.assertTrue(specs["order.account.opened"].accepts("timedelta", "<"))
+        record = {"order": {"quantity": 3, "account": None, "legs": [{"price": 1.5}, {"price": 2.0}]}}
+        self.assertEqual(specs["order.quantity"].getter(record), 3)
+        self.assertIsNone(specs["order.account.currency"].getter(record))
+        self.assertEqual(specs["order.legs[].price"].getter(record), [1.5, 2.0])
+
+    def test_validation_uses_field_specs(self):
+        valid_fields = model_schema(Order, "order")
+        process_input_string('$AND(?order.quantity := /1,5/?, ?order.quantity >= 2?)', valid_fields)
+        hits = field_spec.cache_info().hits
+        process_input_string('?order.quantity < 9?', valid_fields)
+        self.assertEqual(field_spec.cache_info().hits, hits + 1)
+        self.assertTrue(field_spec("order.quantity", "int").accepts("list", ":="))
+        with self.assertRaises(ValueError):
+            process_input_string('?order.quantity == "1"?', valid_fields)
+        with self.assertRaises(ValueError):
+            process_input_string('?order.tags := ["a"]?', valid_fields)
+
+    def test_resolve_type(self):
+        self.assertEqual(resolve_type(typing.Optional[typing.Literal["IB", "SI"]]), "string")
+        with self.assertRaises(ValueError):
+            resolve_type(typing.List)
+
+    def test_trade_valid_fields_is_lazy(self):
+        sys.modules.pop("trades", None)
+        trades = importlib.import_module("trades")
+        self.assertNotIn("trade_valid_fields", vars(trades))
+        self.assertEqual(trades.trade_valid_fields["trade.broker"], "string")
+        self.assertNotIn("trade.error_logs", trades.trade_valid_fields)
+        with self.assertRaises(AttributeError):
+            trades.unknown
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import random
+import timeit
+from position_assignment_filer import find_by_field
+from security_index import SecurityIndex
+
+
+def make_securities(count, seed=5):
+    rng = random.Random(seed)
+    return [{"isin": f"DE{jj:010d}", "ref_ticker": f"T{jj}", "de_ticker": f"D{jj}" if jj % 2 else None,
+             "region": rng.choice(["DE", "US"])} for jj in range(count)]
+
+
+class TestSecurityIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.securities = make_securities(2000)
+        rng = random.Random(1)
+        self.positions = [{"isin": f"DE{rng.randrange(2100):010d}"} for _ in range(1000)] + [{"isin": None}, {}]
+
+    def test_same_result_as_find_by_field(self):
+        index = SecurityIndex(self.securities)
+        for position in self.positions[:-2]:
+            self.assertIs(index.match(position), find_by_field(self.securities, "isin", position.get("isin")))
+        self.assertEqual(len(index), 2000)
+
+    def test_first_security_wins(self):
+        duplicate = dict(self.securities[3], region="XX")
+        index = SecurityIndex(self.securities + [duplicate])
+        self.assertIs(index.find("isin", duplicate["isin"]), self.securities[3])
+
+    def test_misses(self):
+        index = SecurityIndex(self.securities)
+        records = list(index.records(self.positions))
+        self.assertEqual([record["pos"] for record in records], self.positions)
+        missing = [record for record in records if record["sec"] is None]
+        self.assertEqual(index.miss_count, len(missing))
+        self.assertEqual(index.hits + index.miss_count, len(self.positions))
+        self.assertEqual(index.misses[(None,)], 2)
+        self.assertTrue(all(int(isin[2:]) >= 2000 for (isin,) in index.misses if isin is not None))
+
+    def test_misses_are_bounded(self):
+        index = SecurityIndex(self.securities, max_misses=3)
+        for jj in range(100):
+            index.match({"isin": f"XX{jj % 10}"})
+        self.assertEqual(index.miss_count, 100)
+        self.assertEqual(index.misses, {("XX0",): 10, ("XX1",): 10, ("XX2",): 10})
+
+    def test_multi_key_join(self):
+        index = SecurityIndex(self.securities, on=(("isin", "isin"), ("ticker", "ref_ticker"), ("ticker", "de_ticker")))
+        self.assertIs(index.match({"isin": "unknown", "ticker": "T7"}), self.securities[7])
+        self.assertIs(index.match({"ticker": "D9"}), self.securities[9])
+        self.assertIsNone(index.find("de_ticker", None))
+        self.assertIsNone(index.match({"ticker": "D8"}))
+        self.assertEqual(index.misses, {(None, "D8", "D8"): 1})
+        with self.assertRaises(ValueError):
+            SecurityIndex(self.securities, keys=("isin",), on=(("ticker", "ref_ticker"),))
+
+    def test_faster_than_linear_scan(self):
+        positions = self.positions[:200]
+        scan = min(timeit.repeat(lambda: [find_by_field(self.securities, "isin", p.get("isin")) for p in positions],
+                                 number=1, repeat=3))
+        join = min(timeit.repeat(lambda: SecurityIndex(self.securities).join_batch(positions), number=1, repeat=3))
+        self.assertLess(join, scan)
+
+
+if __name__ == "__main__":
+    unittest.main()